@@ -0,0 +1,12 @@
+from django.contrib import admin
+from sharding.admin import ShardedModelAdmin
+from .models import DailyUtilization
+
+
+@admin.register(DailyUtilization)
+class DailyUtilizationAdmin(ShardedModelAdmin):
+    list_display = ('date', 'doctor', 'clinic', 'specialty', 'booked_slots', 'total_slots')
+    list_filter = ('specialty',)
+    list_select_related = ('doctor__user', 'clinic')
+    date_hierarchy = 'date'
+    raw_id_fields = ('doctor', 'clinic')
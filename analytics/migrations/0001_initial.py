@@ -0,0 +1,35 @@
+# Generated by Django 5.1.1 on 2026-10-18 23:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('appointments', '0001_initial'),
+        ('users', '0002_doctor_photo_thumbnails_patient_photo_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyUtilization',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('specialty', models.CharField(max_length=100, verbose_name='Specialty')),
+                ('total_slots', models.PositiveIntegerField(default=0, verbose_name='Total slots')),
+                ('booked_slots', models.PositiveIntegerField(default=0, verbose_name='Booked slots')),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='appointments.clinic', verbose_name='Clinic')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.doctor', verbose_name='Doctor')),
+            ],
+            options={
+                'verbose_name': 'Daily utilization',
+                'verbose_name_plural': 'Daily utilizations',
+                'indexes': [models.Index(fields=['clinic', 'date'], name='analytics_d_clinic__2b634c_idx'), models.Index(fields=['specialty', 'date'], name='analytics_d_special_8ecc23_idx')],
+                'unique_together': {('date', 'doctor', 'clinic')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+from users.models import Doctor
+from appointments.models import Clinic
+from sharding.query import ShardedManager
+
+
+class DailyUtilization(models.Model):
+    '''Booked and total slot counts of one doctor at one clinic on one day.'''
+
+    date = models.DateField(verbose_name=_("Date"))
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, verbose_name=_("Doctor"))
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, verbose_name=_("Clinic"))
+    specialty = models.CharField(max_length=100, verbose_name=_("Specialty"))
+    total_slots = models.PositiveIntegerField(default=0, verbose_name=_("Total slots"))
+    booked_slots = models.PositiveIntegerField(default=0, verbose_name=_("Booked slots"))
+
+    objects = ShardedManager()
+
+    class Meta:
+        unique_together = ('date', 'doctor', 'clinic')
+        indexes = [
+            models.Index(fields=['clinic', 'date']),
+            models.Index(fields=['specialty', 'date']),
+        ]
+        verbose_name = _("Daily utilization")
+        verbose_name_plural = _("Daily utilizations")
+
+    @property
+    def free_slots(self):
+        return self.total_slots - self.booked_slots
+
+    def __str__(self):
+        return f"{self.doctor_id}@{self.clinic_id} {self.date}: {self.booked_slots}/{self.total_slots}"
@@ -0,0 +1,120 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from appointments.models import Availability, ArchivedAvailability
+from sharding import routing as sharding
+from .models import DailyUtilization
+
+
+def count_slots(selectable_time_list):
+    '''Return ``(total, booked)`` for a ``selectable_time_list`` dict.'''
+    slots = selectable_time_list or {}
+    return len(slots), sum(1 for is_selectable in slots.values() if not is_selectable)
+
+
+def day_bounds(day):
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, start + timedelta(days=1)
+
+
+def bucket_of(doctor_id, clinic_id, start_time):
+    return doctor_id, clinic_id, timezone.localdate(start_time)
+
+
+def buckets_of(availability):
+    '''Return the rollup buckets an availability counts (or counted) towards.'''
+    buckets = set()
+    if availability.start_time:
+        buckets.add(bucket_of(availability.doctor_id, availability.clinic_id, availability.start_time))
+    loaded = getattr(availability, '_loaded_values', None) or {}
+    if loaded.get('start_time'):
+        buckets.add(bucket_of(
+            loaded.get('doctor_id', availability.doctor_id),
+            loaded.get('clinic_id', availability.clinic_id),
+            loaded['start_time'],
+        ))
+    return buckets
+
+
+def refresh_buckets(buckets):
+    '''Recompute the rollup rows of the given ``(doctor_id, clinic_id, date)`` buckets.
+
+    A bucket only holds the few availabilities of one doctor at one clinic
+    on one day, so this stays cheap no matter how large the tables grow.
+    '''
+    for doctor_id, clinic_id, day in buckets:
+        with sharding.use_shard(sharding.shard_for_clinic(clinic_id)):
+            refresh_bucket(doctor_id, clinic_id, day)
+
+
+def refresh_bucket(doctor_id, clinic_id, day):
+    '''Recompute one rollup row on the active shard.'''
+    start, end = day_bounds(day)
+    rows = Availability.objects.filter(
+        doctor_id=doctor_id, clinic_id=clinic_id,
+        start_time__gte=start, start_time__lt=end,
+    ).values_list('selectable_time_list', 'doctor__specialty')
+    total = booked = 0
+    specialty = None
+    for selectable_time_list, specialty in rows:
+        slots, taken = count_slots(selectable_time_list)
+        total += slots
+        booked += taken
+    if specialty is None:
+        DailyUtilization.objects.filter(date=day, doctor_id=doctor_id, clinic_id=clinic_id).delete()
+        return
+    DailyUtilization.objects.update_or_create(
+        date=day, doctor_id=doctor_id, clinic_id=clinic_id,
+        defaults={'specialty': specialty, 'total_slots': total, 'booked_slots': booked},
+    )
+
+
+def rebuild(since=None, until=None, batch_size=2000):
+    '''Rebuild all rollup rows between ``since`` and ``until`` (inclusive dates).
+
+    Archived availabilities are counted too, so past days keep their rows.
+    Each shard is rebuilt from its own rows.
+    '''
+    return sum(
+        rebuild_shard(alias, since, until, batch_size) for alias in sharding.each_shard()
+    )
+
+
+def rebuild_shard(alias, since, until, batch_size):
+    tables = [Availability.objects.all(), ArchivedAvailability.objects.all()]
+    rollups = DailyUtilization.objects.all()
+    if since:
+        tables = [availabilities.filter(start_time__gte=day_bounds(since)[0]) for availabilities in tables]
+        rollups = rollups.filter(date__gte=since)
+    if until:
+        tables = [availabilities.filter(start_time__lt=day_bounds(until)[1]) for availabilities in tables]
+        rollups = rollups.filter(date__lte=until)
+
+    totals = {}
+    with sharding.use_shard(alias):
+        for availabilities in tables:
+            rows = availabilities.values_list(
+                'doctor_id', 'clinic_id', 'start_time', 'selectable_time_list', 'doctor__specialty'
+            ).order_by()
+            for doctor_id, clinic_id, start_time, selectable_time_list, specialty in rows.iterator(
+                chunk_size=batch_size
+            ):
+                slots, taken = count_slots(selectable_time_list)
+                entry = totals.setdefault(bucket_of(doctor_id, clinic_id, start_time), [specialty, 0, 0])
+                entry[1] += slots
+                entry[2] += taken
+
+    with sharding.atomic(alias):
+        rollups.delete()
+        DailyUtilization.objects.bulk_create(
+            (
+                DailyUtilization(
+                    date=day, doctor_id=doctor_id, clinic_id=clinic_id,
+                    specialty=specialty, total_slots=total, booked_slots=booked,
+                )
+                for (doctor_id, clinic_id, day), (specialty, total, booked) in totals.items()
+            ),
+            batch_size=batch_size,
+        )
+    return len(totals)
@@ -0,0 +1,48 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+
+
+class UtilizationQuerySerializer(serializers.Serializer):
+    '''UtilizationQuerySerializer for validating utilization report parameters.
+
+    ## Fields:
+    - group_by: doctor, clinic or specialty
+    - days: Number of days back from today (ignored when start is given)
+    - start: First day of the report
+    - end: Last day of the report (defaults to today)
+    - per_day: Split the totals by day
+    '''
+
+    group_by = serializers.ChoiceField(choices=['doctor', 'clinic', 'specialty'], default='clinic')
+    days = serializers.IntegerField(min_value=1, max_value=366, default=30)
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    per_day = serializers.BooleanField(default=True)
+
+    def validate(self, attrs):
+        start, end = attrs.get('start'), attrs.get('end')
+        if start and end and start > end:
+            raise serializers.ValidationError(_("Start date must not be after end date."))
+        return attrs
+
+
+class UtilizationSerializer(serializers.Serializer):
+    '''UtilizationSerializer for one row of a utilization report.
+
+    ## Fields:
+    - date: Day of the row (only when split per day)
+    - key: Id of the doctor or clinic, or the specialty name
+    - name: Display name of the group
+    - total_slots: Number of slots offered
+    - booked_slots: Number of slots taken
+    - free_slots: Number of slots still selectable
+    - utilization: Percentage of booked slots
+    '''
+
+    date = serializers.DateField(required=False)
+    key = serializers.CharField()
+    name = serializers.CharField()
+    total_slots = serializers.IntegerField()
+    booked_slots = serializers.IntegerField()
+    free_slots = serializers.IntegerField()
+    utilization = serializers.FloatField()
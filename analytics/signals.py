@@ -0,0 +1,11 @@
+from django.dispatch import receiver
+from appointments.signals import slots_changed
+from .rollups import buckets_of, refresh_buckets
+
+
+@receiver(slots_changed)
+def update_daily_utilization(sender, availabilities, **kwargs):
+    buckets = set()
+    for availability in availabilities:
+        buckets |= buckets_of(availability)
+    refresh_buckets(buckets)
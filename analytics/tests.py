@@ -0,0 +1,92 @@
+from datetime import datetime, time, timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from users.models import User
+from appointments.archive import archive
+from appointments.models import Clinic, Availability, Appointment
+from .models import DailyUtilization
+
+
+class DailyUtilizationTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        doctor_user = User.objects.create_user(
+            phone_number='09120000001', password='securepassword',
+            first_name='Sara', last_name='Rad', is_doctor=True
+        )
+        self.doctor = doctor_user.doctor
+        self.doctor.medical_code = 'MC-1'
+        self.doctor.specialty = 'Cardiology'
+        self.doctor.save()
+        self.patient = User.objects.create_user(
+            phone_number='09120000002', password='securepassword',
+            first_name='Ali', last_name='Karimi'
+        ).patient
+        self.clinic = Clinic.objects.create(name='Central', address='Main street')
+        self.day = timezone.localdate() + timedelta(days=1)
+        start = timezone.make_aware(datetime.combine(self.day, time(10, 0)))
+        self.availability = Availability.objects.create(
+            doctor=self.doctor, clinic=self.clinic,
+            start_time=start, end_time=start + timedelta(hours=1)
+        )
+
+    def rollup(self):
+        return DailyUtilization.objects.get(date=self.day, doctor=self.doctor, clinic=self.clinic)
+
+    def test_rollup_follows_booking_and_cancellation(self):
+        self.assertEqual((self.rollup().total_slots, self.rollup().booked_slots), (6, 0))
+        appointment = Appointment.objects.create(
+            patient=self.patient, availability=self.availability, selected_time='10:10'
+        )
+        self.assertEqual(self.rollup().booked_slots, 1)
+        appointment.delete()
+        self.assertEqual(self.rollup().booked_slots, 0)
+
+    def test_rollup_is_removed_with_availability(self):
+        self.availability.delete()
+        self.assertFalse(DailyUtilization.objects.exists())
+
+    def test_rebuild_command(self):
+        Appointment.objects.create(patient=self.patient, availability=self.availability, selected_time='10:00')
+        DailyUtilization.objects.all().delete()
+        call_command('rebuild_utilization', stdout=StringIO())
+        self.assertEqual((self.rollup().total_slots, self.rollup().booked_slots), (6, 1))
+
+    def test_utilization_by_clinic(self):
+        Appointment.objects.create(patient=self.patient, availability=self.availability, selected_time='10:00')
+        admin = User.objects.create_superuser(
+            phone_number='09120000003', password='securepassword',
+            first_name='Admin', last_name='User'
+        )
+        client = APIClient()
+        client.force_authenticate(admin)
+        response = client.get('/analytics/utilization/', {
+            'group_by': 'clinic', 'start': self.day.isoformat(), 'end': self.day.isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{
+            'date': self.day.isoformat(), 'key': str(self.clinic.pk), 'name': 'Central',
+            'total_slots': 6, 'booked_slots': 1, 'free_slots': 5, 'utilization': 16.67,
+        }])
+
+    def test_utilization_requires_staff(self):
+        client = APIClient()
+        client.force_authenticate(self.patient.user)
+        self.assertEqual(client.get('/analytics/utilization/').status_code, 403)
+
+    def test_rebuild_keeps_archived_days(self):
+        past = timezone.localdate() - timedelta(days=200)
+        start = timezone.make_aware(datetime.combine(past, time(10, 0)))
+        old = Availability.objects.create(
+            doctor=self.doctor, clinic=self.clinic, start_time=start, end_time=start + timedelta(hours=1)
+        )
+        Appointment.objects.create(patient=self.patient, availability=old, selected_time='10:00')
+        archive(90)
+        call_command('rebuild_utilization', stdout=StringIO())
+        rollup = DailyUtilization.objects.get(date=past, doctor=self.doctor, clinic=self.clinic)
+        self.assertEqual((rollup.total_slots, rollup.booked_slots), (6, 1))
@@ -0,0 +1,7 @@
+from django.urls import path
+from .views import UtilizationAPIView
+
+
+urlpatterns = [
+    path('analytics/utilization/', UtilizationAPIView.as_view(), name='utilization'),
+]
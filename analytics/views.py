@@ -0,0 +1,61 @@
+from datetime import timedelta
+
+from django.db.models import Sum
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from healthcare_appointment_system.apidocs import swagger_auto_schema
+from .models import DailyUtilization
+from .serializers import UtilizationQuerySerializer, UtilizationSerializer
+
+GROUP_COLUMNS = {
+    'doctor': ('doctor_id', 'doctor__user__first_name', 'doctor__user__last_name'),
+    'clinic': ('clinic_id', 'clinic__name'),
+    'specialty': ('specialty',),
+}
+
+
+class UtilizationAPIView(APIView):
+    '''Booked vs. free slot report built from the daily rollup table.'''
+
+    permission_classes = [IsAdminUser, IsAuthenticated]
+
+    @swagger_auto_schema(
+        query_serializer=UtilizationQuerySerializer,
+        responses={200: UtilizationSerializer(many=True)},
+        operation_description=_('Utilization of doctors, clinics or specialties over a date range.')
+    )
+    def get(self, request):
+        '''Aggregate the daily rollups for the requested range and grouping.'''
+        query = UtilizationQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        end = params.get('end') or timezone.localdate()
+        start = params.get('start') or end - timedelta(days=params['days'] - 1)
+        columns = GROUP_COLUMNS[params['group_by']]
+        group = (('date',) if params['per_day'] else ()) + columns
+
+        rows = (
+            DailyUtilization.objects.filter(date__gte=start, date__lte=end)
+            .values(*group)
+            .annotate(total=Sum('total_slots'), booked=Sum('booked_slots'))
+            .order_by(*group)
+        )
+        data = []
+        for row in rows:
+            item = {
+                'key': str(row[columns[0]]),
+                'name': ' '.join(str(row[column]) for column in columns[1:]) or row[columns[0]],
+                'total_slots': row['total'],
+                'booked_slots': row['booked'],
+                'free_slots': row['total'] - row['booked'],
+                'utilization': round(100 * row['booked'] / row['total'], 2) if row['total'] else 0.0,
+            }
+            if params['per_day']:
+                item['date'] = row['date']
+            data.append(item)
+        return Response(UtilizationSerializer(data, many=True).data, status=status.HTTP_200_OK)
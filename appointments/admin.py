@@ -1,7 +1,79 @@
 from django.contrib import admin
-from .models import Clinic, Availability, Appointment
+from django.utils.translation import gettext_lazy as _
+from healthcare_appointment_system.paginators import EstimatedCountPaginator
+from sharding.admin import ShardedModelAdmin
+from .models import Clinic, Availability, Appointment, ArchivedAvailability, ArchivedAppointment
 
 
-admin.site.register(Clinic)
-admin.site.register(Availability)
-admin.site.register(Appointment)
+class LargeTableAdmin(ShardedModelAdmin):
+    '''Change list without exact counts of the whole table.'''
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(Clinic)
+class ClinicAdmin(ShardedModelAdmin):
+    list_display = ('name', 'address', 'updated_at')
+    search_fields = ('name',)
+    ordering = ('name',)
+
+
+@admin.register(Availability)
+class AvailabilityAdmin(LargeTableAdmin):
+    list_display = ('doctor', 'clinic', 'start_time', 'end_time')
+    list_filter = ('clinic',)
+    search_fields = ('doctor__user__last_name', 'doctor__medical_code', 'clinic__name')
+    autocomplete_fields = ('doctor', 'clinic')
+    date_hierarchy = 'start_time'
+    ordering = ('-start_time',)
+
+    def get_queryset(self, request):
+        # not list_select_related: the autocomplete of AppointmentAdmin
+        # renders str(availability) too
+        return super().get_queryset(request).select_related('doctor__user', 'clinic')
+
+
+@admin.register(Appointment)
+class AppointmentAdmin(LargeTableAdmin):
+    list_display = ('patient', 'doctor', 'clinic', 'scheduled_at', 'selected_time')
+    list_select_related = ('patient__user', 'availability__doctor__user', 'availability__clinic')
+    search_fields = ('patient__user__last_name', 'patient__user__phone_number')
+    autocomplete_fields = ('patient', 'availability')
+    date_hierarchy = 'scheduled_at'
+    ordering = ('-scheduled_at', '-id')
+
+    @admin.display(description=_("Doctor"), ordering='availability__doctor__user__last_name')
+    def doctor(self, obj):
+        return obj.availability.doctor
+
+    @admin.display(description=_("Clinic"))
+    def clinic(self, obj):
+        return obj.availability.clinic
+
+
+class ArchiveAdmin(LargeTableAdmin):
+    '''Read-only change list of an archive table.'''
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ArchivedAvailability)
+class ArchivedAvailabilityAdmin(ArchiveAdmin):
+    list_display = ('id', 'doctor', 'clinic', 'start_time', 'end_time', 'archived_at')
+    list_select_related = ('doctor__user', 'clinic')
+    search_fields = ('doctor__user__last_name', 'doctor__medical_code')
+    ordering = ('-id',)
+
+
+@admin.register(ArchivedAppointment)
+class ArchivedAppointmentAdmin(ArchiveAdmin):
+    list_display = ('id', 'patient', 'availability', 'scheduled_at', 'selected_time', 'archived_at')
+    list_select_related = ('patient__user', 'availability')
+    search_fields = ('patient__user__last_name', 'patient__user__phone_number')
+    date_hierarchy = 'scheduled_at'
+    ordering = ('-scheduled_at', '-id')
@@ -6,3 +6,14 @@ class AppointmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'appointments'
     verbose_name = _("appointments")
+
+    def ready(self):
+        from diagnostics import metrics
+        from .coalescing import single_flight
+        from .live import hub
+        from .outbox import lag, pending_events
+        metrics.register('outbox_lag_seconds', lag)
+        metrics.register('outbox_pending_events', lambda: pending_events().count())
+        metrics.register('live_slots_subscribers', hub.subscriber_count)
+        metrics.register('single_flight_requests', lambda: single_flight.requests)
+        metrics.register('single_flight_coalescing_ratio', single_flight.ratio)
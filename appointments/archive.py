@@ -0,0 +1,133 @@
+'''Archival of past availabilities and appointments.
+
+Availabilities that ended more than ``ARCHIVE_AFTER_DAYS`` days ago are
+moved, together with their appointments, to ``ArchivedAvailability`` and
+``ArchivedAppointment`` in bounded transactional batches, so the hot tables
+(and their indexes) only hold recent and upcoming rows. Archived rows keep
+their primary keys, and an appointment always lives in the same table as
+its availability.
+
+History reads go through ``history``, which merges both tables.
+'''
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from sharding import routing as sharding
+
+from .models import (Availability, Appointment, AppointmentReminder,
+                     ArchivedAvailability, ArchivedAppointment)
+
+
+def archive_horizon(days=None):
+    '''Availabilities that ended before this moment are archived.'''
+    return timezone.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS if days is None else days)
+
+
+def copy_row(model, instance, **values):
+    '''An unsaved ``model`` row holding every column of ``instance`` (and ``values``).'''
+    columns = {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+    return model(**columns, **values)
+
+
+class Archiver:
+    '''Move the availabilities that ended before ``before`` to the archive tables.
+
+    Each batch locks its availabilities, copies them and their appointments
+    with two bulk inserts and removes the originals. Archiving is not a
+    cancellation: the rows are deleted without signals, so no outbox
+    events, sync tombstones, live messages or rollup refreshes are sent,
+    and the daily utilization of archived days is kept. Reminders of the
+    archived appointments are dropped.
+    '''
+
+    def __init__(self, before, batch_size=500, dry_run=False, progress=None):
+        self.before = before
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.progress = progress or (lambda done, total: None)
+
+    def due(self):
+        # availabilities never span more than a day: the start_time bound
+        # lets the scan use its index
+        return Availability.objects.filter(
+            start_time__lt=self.before, end_time__lt=self.before,
+        )
+
+    def run(self):
+        due = self.due()
+        total = due.count()
+        report = {
+            'availabilities': total,
+            'appointments': Appointment.objects.filter(availability__in=due).count(),
+            'dry_run': self.dry_run,
+        }
+        if self.dry_run or not total:
+            return report
+        done = 0
+        ids = due.order_by('pk').values_list('pk', flat=True)
+        for alias in sharding.each_shard():
+            with sharding.use_shard(alias):
+                last = 0
+                while batch := list(ids.filter(pk__gt=last)[:self.batch_size]):
+                    done += self.archive_batch(batch)
+                    last = batch[-1]
+                    self.progress(done, total)
+        return report
+
+    def archive_batch(self, ids):
+        with sharding.atomic():
+            availabilities = list(
+                self.due().select_for_update().filter(pk__in=ids).order_by('pk')
+            )
+            ids = [availability.pk for availability in availabilities]
+            appointments = list(Appointment.objects.filter(availability__in=ids).order_by('pk'))
+            appointment_ids = [appointment.pk for appointment in appointments]
+            now = timezone.now()
+
+            ArchivedAvailability.objects.bulk_create([
+                copy_row(ArchivedAvailability, availability, archived_at=now) for availability in availabilities
+            ])
+            ArchivedAppointment.objects.bulk_create([
+                copy_row(ArchivedAppointment, appointment, archived_at=now) for appointment in appointments
+            ])
+
+            # _raw_delete: a plain DELETE, without collecting rows or sending signals
+            for queryset in (
+                AppointmentReminder.objects.filter(appointment__in=appointment_ids),
+                Appointment.objects.filter(pk__in=appointment_ids),
+                Availability.objects.filter(pk__in=ids),
+            ):
+                queryset._raw_delete(queryset.db)
+        return len(ids)
+
+
+def archive(days=None, **options):
+    '''Archive the availabilities (and appointments) older than ``days``.'''
+    return Archiver(archive_horizon(days), **options).run()
+
+
+def history(querysets, field, before=None, before_id=None, limit=50):
+    '''One page of rows from ``querysets``, newest ``field`` first.
+
+    ``querysets`` hold the same kind of rows in different tables (hot and
+    archive); each is read with the same keyset condition, so every page
+    costs ``limit + 1`` rows per table whatever its depth. Returns
+    ``(rows, next)`` where ``next`` is the ``(before, before_id)`` cursor
+    of the following page, or ``None``.
+    '''
+    rows = []
+    for queryset in querysets:
+        if before is not None:
+            older = Q(**{f'{field}__lt': before})
+            if before_id is not None:
+                older |= Q(**{field: before, 'pk__lt': before_id})
+            queryset = queryset.filter(older)
+        rows += queryset.order_by(f'-{field}', '-pk')[:limit + 1]
+    rows.sort(key=lambda row: (getattr(row, field), row.pk), reverse=True)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, (getattr(rows[-1], field), rows[-1].pk)
@@ -0,0 +1,290 @@
+'''Micro-benchmarks run with ``manage.py benchmark <suite>``.
+
+Each suite creates its own rows inside a transaction that is rolled back
+at the end, so it can be pointed at any database without leaving data
+behind.
+'''
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, time as day_time
+
+from django.db import transaction
+from django.utils import timezone
+from sharding import routing as sharding
+from users.models import User, Doctor, Patient
+from .models import Clinic, Availability, Appointment
+
+SUITES = {}
+
+
+def suite(name):
+    '''Register a benchmark function under ``name``.'''
+    def register(function):
+        SUITES[name] = function
+        return function
+    return register
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def scratch_data():
+    '''Run the block in a transaction that is always rolled back.
+
+    With sharding on, the clinic data of the block goes to the first shard
+    and is rolled back together with the users.
+    '''
+    try:
+        with transaction.atomic(), sharding.atomic(sharding.each_shard()[0]):
+            yield
+            raise Rollback
+    except Rollback:
+        pass
+
+
+def timed(function, repeat):
+    '''Return the best wall time of ``repeat`` calls and the last result.'''
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def create_schedule_rows(rows, doctors=None, clinics=5):
+    '''Bulk-create ``rows`` availabilities spread over some doctors and clinics.'''
+    token = uuid.uuid4().hex[:6]
+    doctors = doctors or max(1, rows // 20)
+    users = User.objects.bulk_create(
+        User(
+            phone_number=f"09{index:09d}", first_name=f"First{index}", last_name=f"Last{index}",
+            slug=f"bench-{token}-{index}",
+        )
+        for index in range(doctors)
+    )
+    doctor_objects = Doctor.objects.bulk_create(
+        Doctor(user=user, medical_code=f"bench-{token}-{index}", specialty=f"Specialty {index % 7}",
+               photo=f"doctor_photos/bench_{index}.png")
+        for index, user in enumerate(users)
+    )
+    clinic_objects = Clinic.objects.bulk_create(
+        Clinic(name=f"Clinic {index}", address=f"Street {index}") for index in range(clinics)
+    )
+    first_day = timezone.localdate() + timedelta(days=1)
+    availabilities = []
+    for index in range(rows):
+        day = first_day + timedelta(days=index // doctors)
+        start = timezone.make_aware(datetime.combine(day, day_time(8, 0)))
+        availability = Availability(
+            doctor=doctor_objects[index % doctors], clinic=clinic_objects[index % clinics],
+            start_time=start, end_time=start + timedelta(hours=4),
+        )
+        availability.calculation_of_time_slots()
+        availabilities.append(availability)
+    Availability.objects.bulk_create(availabilities, batch_size=1000)
+    return doctor_objects
+
+
+@suite('list-renderers')
+def list_renderers(stdout, rows=2000, repeat=5, **options):
+    '''Compare AvailabilitySerializer with the values()-based projection.'''
+    from .projections import availability_rows
+    from .serializers import AvailabilitySerializer
+
+    with scratch_data():
+        doctors = create_schedule_rows(rows)
+        queryset = Availability.objects.filter(doctor__in=doctors).order_by('pk')
+        serializer_time, expected = timed(
+            lambda: AvailabilitySerializer(queryset.select_related('doctor__user', 'clinic'), many=True).data,
+            repeat,
+        )
+        projection_time, result = timed(lambda: availability_rows(queryset), repeat)
+    if [dict(row) for row in expected] != result:
+        stdout.write("WARNING: projection output differs from the serializer output")
+    stdout.write(f"rows: {rows}")
+    stdout.write(f"serializer: {rows / serializer_time:,.0f} rows/s ({serializer_time * 1000:.1f} ms)")
+    stdout.write(f"projection: {rows / projection_time:,.0f} rows/s ({projection_time * 1000:.1f} ms)")
+    stdout.write(f"speed-up: {serializer_time / projection_time:.1f}x")
+
+
+def create_appointment_rows(rows):
+    '''Book ``rows`` appointments, one per availability, for fresh patients.'''
+    token = uuid.uuid4().hex[:6]
+    availabilities = list(
+        Availability.objects.filter(doctor__in=create_schedule_rows(rows)).order_by('pk')
+    )
+    users = User.objects.bulk_create(
+        User(
+            phone_number=f"08{index:09d}", first_name=f"Patient{index}", last_name=f"Last{index}",
+            slug=f"bench-patient-{token}-{index}", date_of_birth=date(1980 + index % 30, 1, 1),
+        )
+        for index in range(rows)
+    )
+    patients = Patient.objects.bulk_create(Patient(user=user) for user in users)
+    Appointment.objects.bulk_create(
+        (
+            Appointment(
+                patient=patient, availability=availability,
+                selected_time=next(iter(availability.selectable_time_list)),
+                scheduled_at=availability.start_time,
+            )
+            for patient, availability in zip(patients, availabilities)
+        ),
+        batch_size=1000,
+    )
+    return patients
+
+
+@suite('json-render')
+def json_render(stdout, rows=1000, repeat=5, **options):
+    '''Compare DRF's JSONRenderer with the orjson renderer on AppointmentSerializer output.'''
+    from rest_framework.renderers import JSONRenderer
+    from healthcare_appointment_system import renderers
+    from .serializers import AppointmentSerializer
+
+    with scratch_data():
+        patients = create_appointment_rows(rows)
+        data = AppointmentSerializer(
+            Appointment.objects.filter(patient__in=patients)
+            .select_related('patient__user', 'availability__doctor__user', 'availability__clinic')
+            .order_by('pk'),
+            many=True,
+        ).data
+    stdlib_time, expected = timed(lambda: JSONRenderer().render(data), repeat)
+    orjson_time, result = timed(lambda: renderers.ORJSONRenderer().render(data), repeat)
+    if renderers.orjson is None:
+        stdout.write("WARNING: orjson is not installed, ORJSONRenderer used the stdlib fallback")
+    if expected != result:
+        stdout.write("WARNING: orjson output differs from the JSONRenderer output")
+    stdout.write(f"rows: {rows}, payload: {len(expected) / 1024:,.0f} KiB")
+    stdout.write(f"JSONRenderer: {stdlib_time * 1000:.1f} ms")
+    stdout.write(f"ORJSONRenderer: {orjson_time * 1000:.1f} ms")
+    stdout.write(f"speed-up: {stdlib_time / orjson_time:.1f}x")
+
+
+@suite('nearby')
+def nearby(stdout, rows=100000, repeat=5, searches=200, radius_km=5, **options):
+    '''Time nearby clinic searches over ``rows`` clinics against a full scan.'''
+    from diagnostics.traffic import percentile
+    from .geo import encode, haversine_km, nearby_clinics
+
+    generator = random.Random(42)
+    # spread over a country-sized box (Iran)
+    points = [(generator.uniform(25, 40), generator.uniform(44, 63)) for _ in range(rows)]
+    centres = [points[generator.randrange(rows)] for _ in range(searches)]
+    with scratch_data():
+        Clinic.objects.bulk_create(
+            (
+                Clinic(name=f"Clinic {index}", address=f"Street {index}",
+                       latitude=latitude, longitude=longitude, geohash=encode(latitude, longitude))
+                for index, (latitude, longitude) in enumerate(points)
+            ),
+            batch_size=2000,
+        )
+        latencies, found = [], 0
+        for latitude, longitude in centres:
+            started = time.perf_counter()
+            found += len(nearby_clinics(latitude, longitude, radius_km))
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+
+        def full_scan():
+            latitude, longitude = centres[0]
+            return sum(
+                1 for clinic_latitude, clinic_longitude in Clinic.objects.exclude(geohash='')
+                .values_list('latitude', 'longitude').iterator()
+                if haversine_km(latitude, longitude, clinic_latitude, clinic_longitude) <= radius_km
+            )
+        scan_time, _count = timed(full_scan, repeat)
+    stdout.write(f"clinics: {rows}, searches: {searches}, radius: {radius_km} km, "
+                 f"clinics found per search: {found / searches:.1f}")
+    stdout.write(f"geohash cells: p50 {percentile(latencies, 0.5):.2f} ms, "
+                 f"p95 {percentile(latencies, 0.95):.2f} ms, max {latencies[-1]:.2f} ms")
+    stdout.write(f"full scan: {scan_time * 1000:.1f} ms")
+
+
+@suite('doctor-search')
+def doctor_search(stdout, rows=20000, repeat=5, searches=200, **options):
+    '''Time doctor directory searches over ``rows`` doctors against ``icontains`` scans.'''
+    from django.db.models import Q
+    from diagnostics.traffic import percentile
+    from users.search import facets, index_doctors, search_doctors
+
+    generator = random.Random(42)
+    syllables = ['ka', 'ri', 'mi', 'sa', 'ra', 'ha', 'mo', 'ba', 'ze', 'na', 'ta', 'fa', 'ja', 'vi']
+
+    def name():
+        return ''.join(generator.choice(syllables) for _ in range(generator.randint(2, 4))).capitalize()
+
+    token = uuid.uuid4().hex[:6]
+    with scratch_data():
+        users = User.objects.bulk_create(
+            (User(phone_number=f"08{index:09d}", first_name=name(), last_name=name(), slug=f"search-{token}-{index}")
+             for index in range(rows)),
+            batch_size=2000,
+        )
+        doctors = Doctor.objects.bulk_create(
+            (Doctor(user=user, medical_code=f"search-{token}-{index}", specialty=f"Specialty {index % 25}",
+                    photo=f"doctor_photos/search_{index}.png")
+             for index, user in enumerate(users)),
+            batch_size=2000,
+        )
+        for start in range(0, rows, 2000):
+            index_doctors(doctors[start:start + 2000])
+        queries = [f"{generator.choice(syllables)}{generator.choice(syllables)}" for _ in range(searches)]
+
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            list(search_doctors(query).order_by('user__last_name', 'user__first_name', 'pk')
+                 .values_list('pk', flat=True)[:20])
+            facets(query)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+
+        def scan():
+            query = queries[0]
+            return list(
+                Doctor.objects.filter(
+                    Q(user__first_name__icontains=query) | Q(user__last_name__icontains=query)
+                    | Q(specialty__icontains=query)
+                ).order_by('user__last_name', 'user__first_name', 'pk').values_list('pk', flat=True)[:20]
+            )
+        scan_time, _rows = timed(scan, repeat)
+    stdout.write(f"doctors: {rows}, searches: {searches}")
+    stdout.write(f"token index (with facets): p50 {percentile(latencies, 0.5):.2f} ms, "
+                 f"p95 {percentile(latencies, 0.95):.2f} ms, max {latencies[-1]:.2f} ms")
+    stdout.write(f"icontains scan: {scan_time * 1000:.1f} ms")
+
+
+@suite('doctor-profile')
+def doctor_profile(stdout, rows=20000, repeat=5, **options):
+    '''Time slug resolution (cold and cached) and the next free slots of a doctor.'''
+    from django.core.cache import cache
+    from users.profiles import doctor_id_for_slug, next_free_slots, slug_key
+
+    with scratch_data():
+        doctors = create_schedule_rows(rows)
+        slugs = list(User.objects.filter(doctor__in=doctors).values_list('slug', flat=True))
+
+        def resolve_cold():
+            for slug in slugs[:100]:
+                cache.delete(slug_key(slug))
+                doctor_id_for_slug(slug)
+
+        def resolve_cached():
+            for slug in slugs[:100]:
+                doctor_id_for_slug(slug)
+
+        cold, _result = timed(resolve_cold, repeat)
+        cached, _result = timed(resolve_cached, repeat)
+        slots_time, slots = timed(lambda: next_free_slots(doctors[0].pk), repeat)
+    stdout.write(f"doctors: {len(doctors)}, availabilities: {rows}")
+    stdout.write(f"slug resolution: {cold * 10:.3f} ms cold, {cached * 10:.3f} ms cached")
+    stdout.write(f"next free slots ({len(slots)}): {slots_time * 1000:.2f} ms")
@@ -0,0 +1,144 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from sharding import routing as sharding
+
+from .models import Availability, Appointment, OutboxEvent
+from .signals import rows_changed, slots_changed
+
+
+def release_slots(availabilities, appointments):
+    '''Mark the slots of ``appointments`` selectable again on the locked availabilities.'''
+    by_id = {availability.pk: availability for availability in availabilities}
+    for appointment in appointments:
+        slots = by_id[appointment.availability_id].selectable_time_list or {}
+        if appointment.selected_time in slots:
+            slots[appointment.selected_time] = True
+    now = timezone.now()
+    for availability in availabilities:
+        availability.updated_at = now
+    Availability.objects.bulk_update(availabilities, ['selectable_time_list', 'updated_at'])
+    rows_changed.send(sender=Availability, instances=availabilities)
+
+
+class BulkCancellation:
+    '''Cancel a set of appointments in bounded transactional batches.
+
+    Each batch locks its availabilities in primary key order, releases the
+    booked slots with a single bulk update, queues one cancellation event
+    per appointment in the outbox (which is what notifies the patients) and
+    deletes the appointments with one statement.
+    '''
+
+    def __init__(self, appointments, batch_size=500, dry_run=False, reason='', progress=None):
+        self.appointments = appointments
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.reason = str(reason)
+        self.progress = progress or (lambda done, total: None)
+
+    def run(self):
+        total = self.appointments.count()
+        report = {
+            'appointments': total,
+            'availabilities': self.appointments.values('availability').distinct().count(),
+            'dry_run': self.dry_run,
+        }
+        if self.dry_run or not total:
+            return report
+        done = 0
+        ids = self.appointments.order_by('pk').values_list('pk', flat=True)
+        # a batch is one transaction, so it never spans shards
+        for alias in sharding.each_shard():
+            with sharding.use_shard(alias):
+                last = 0
+                while batch := list(ids.filter(pk__gt=last)[:self.batch_size]):
+                    self.cancel_batch(batch)
+                    last = batch[-1]
+                    done += len(batch)
+                    self.progress(done, total)
+        return report
+
+    def cancel_batch(self, ids):
+        with sharding.atomic():
+            appointments = list(Appointment.objects.filter(pk__in=ids).select_related('availability'))
+            availabilities = list(
+                Availability.objects.select_for_update()
+                .filter(pk__in={appointment.availability_id for appointment in appointments})
+                .order_by('pk')
+            )
+            release_slots(availabilities, appointments)
+            OutboxEvent.objects.bulk_create([
+                OutboxEvent(
+                    event_type=OutboxEvent.EventType.CANCELLED,
+                    payload=dict(appointment.event_payload(), reason=self.reason),
+                )
+                for appointment in appointments
+            ])
+            Appointment.objects.filter(pk__in=ids).delete()
+            slots_changed.send(sender=Availability, availabilities=availabilities)
+
+
+def delete_availabilities(availabilities, batch_size=500):
+    '''Delete availabilities in batches, keeping the rollups in sync.'''
+    deleted = 0
+    for alias in sharding.each_shard():
+        last = 0
+        with sharding.use_shard(alias):
+            while batch := list(availabilities.filter(pk__gt=last).order_by('pk')[:batch_size]):
+                with sharding.atomic():
+                    Availability.objects.filter(pk__in=[availability.pk for availability in batch]).delete()
+                    slots_changed.send(sender=Availability, availabilities=batch)
+                last = batch[-1].pk
+                deleted += len(batch)
+    return deleted
+
+
+def cancel_appointments(availability_ids=None, start=None, end=None, doctor=None, clinic=None, **options):
+    '''Cancel appointments on the given availabilities and/or days (inclusive).'''
+    appointments = Appointment.objects.all()
+    if availability_ids:
+        appointments = appointments.filter(availability__in=availability_ids)
+    if start:
+        appointments = appointments.filter(scheduled_at__gte=timezone.make_aware(datetime.combine(start, time.min)))
+    if end:
+        appointments = appointments.filter(
+            scheduled_at__lt=timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min))
+        )
+    if doctor:
+        appointments = appointments.filter(availability__doctor=doctor)
+    if clinic:
+        appointments = appointments.filter(availability__clinic=clinic)
+    return BulkCancellation(appointments, **options).run()
+
+
+def _decommission(availabilities, delete_object, obj, options):
+    now = timezone.now()
+    upcoming = availabilities.filter(end_time__gt=now)
+    report = BulkCancellation(
+        Appointment.objects.filter(availability__in=upcoming), **options
+    ).run()
+    report['removed_availabilities'] = upcoming.count()
+    if options.get('dry_run'):
+        return report
+    delete_availabilities(upcoming, batch_size=options.get('batch_size', 500))
+    if delete_object:
+        obj.delete()
+    return report
+
+
+def retire_doctor(doctor, delete=False, **options):
+    '''Cancel a doctor's upcoming appointments and remove their future schedule.
+
+    The doctor's account is deactivated, or deleted when ``delete`` is set.
+    '''
+    report = _decommission(Availability.objects.filter(doctor=doctor), delete, doctor, options)
+    if not delete and not options.get('dry_run'):
+        type(doctor.user).objects.filter(pk=doctor.user_id).update(is_active=False)
+    return report
+
+
+def close_clinic(clinic, delete=False, **options):
+    '''Cancel a clinic's upcoming appointments and remove its future schedule.'''
+    return _decommission(Availability.objects.filter(clinic=clinic), delete, clinic, options)
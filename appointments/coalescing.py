@@ -0,0 +1,162 @@
+'''Single-flight coalescing of identical concurrent read requests.
+
+``@coalesce()`` on a view method makes identical requests (same view,
+path, query string, negotiated media type and permission scope) that
+arrive while one of them is being computed wait for that computation and
+reuse its rendered bytes. The result stays reusable for
+``SINGLE_FLIGHT_WINDOW`` seconds after it finished, unless a write in this
+process (any save, delete or slot change) happened in the meantime.
+'''
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from users.models import Doctor
+from .models import Clinic, Availability
+from .signals import rows_changed, slots_changed
+
+
+class Flight:
+    '''One computation shared by every request with the same key.'''
+
+    def __init__(self, generation):
+        self.generation = generation
+        self.done = threading.Event()
+        self.finished_at = None
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.generation = 0
+        self.requests = 0
+        self.shared = 0
+
+    def invalidate(self):
+        '''Stop reusing finished results (called after writes).'''
+        with self._lock:
+            self.generation += 1
+
+    def do(self, key, function, window, timeout=30):
+        '''Return ``(result, shared)``; ``function`` runs once per flight.'''
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            flight = self._flights.get(key)
+            if flight is not None and not self._reusable(flight, now, window):
+                flight = None
+            if flight is None:
+                self._prune(now, window)
+                flight = self._flights[key] = Flight(self.generation)
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+
+        if not leader:
+            if not flight.done.wait(timeout):
+                return function(), False
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = function()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            flight.finished_at = time.monotonic()
+            flight.done.set()
+            if flight.error is not None or window <= 0:
+                with self._lock:
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+        return flight.result, False
+
+    def _reusable(self, flight, now, window):
+        if not flight.done.is_set():
+            return True
+        return (flight.error is None and flight.generation == self.generation
+                and now - flight.finished_at <= window)
+
+    def _prune(self, now, window):
+        stale = [key for key, flight in self._flights.items()
+                 if flight.done.is_set() and not self._reusable(flight, now, window)]
+        for key in stale:
+            del self._flights[key]
+
+    def ratio(self):
+        '''Share of requests answered by another request's computation.'''
+        return round(self.shared / self.requests, 4) if self.requests else 0.0
+
+
+single_flight = SingleFlight()
+
+
+def role_scope(request):
+    '''Permission scope shared by every user with the same role.'''
+    user = request.user
+    if not user.is_authenticated:
+        return 'anonymous'
+    if user.is_staff:
+        return 'staff'
+    return 'doctor' if user.is_doctor else 'patient'
+
+
+def user_scope(request):
+    return str(request.user.pk) if request.user.is_authenticated else 'anonymous'
+
+
+def coalesce(scope=role_scope, window=None):
+    '''Coalesce identical concurrent calls of a DRF view method.
+
+    Runs after authentication, permission checks and content negotiation,
+    so only requests allowed to see the same bytes share them; the active
+    language and the host are part of the key as well. Use
+    ``scope=user_scope`` when the response depends on the user.
+    '''
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            reuse = settings.SINGLE_FLIGHT_WINDOW if window is None else window
+            key = (
+                type(self).__qualname__, method.__name__, request.path,
+                tuple(sorted((name, tuple(values)) for name, values in request.query_params.lists())),
+                request.accepted_media_type, scope(request),
+                # the response carries translated messages and absolute urls
+                getattr(request, 'LANGUAGE_CODE', None), request.get_host(),
+            )
+
+            def render():
+                response = self.finalize_response(request, method(self, request, *args, **kwargs), *args, **kwargs)
+                response.render()
+                headers = {name: value for name, value in response.items() if name.lower() != 'content-length'}
+                return response.status_code, response.content, headers
+
+            (status, content, headers), shared = single_flight.do(key, render, reuse)
+            response = HttpResponse(content, status=status)
+            for name, value in headers.items():
+                response[name] = value
+            response['X-Single-Flight'] = 'shared' if shared else 'leader'
+            return response
+        return wrapper
+    return decorator
+
+
+@receiver(post_save)
+@receiver(slots_changed)
+@receiver(rows_changed)
+@receiver(post_delete, sender=Clinic)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Availability)
+def invalidate_flights(sender, **kwargs):
+    single_flight.invalidate()
@@ -0,0 +1,111 @@
+'''Nearby clinic search without a spatial database.
+
+Every clinic with coordinates stores the geohash of its location. A search
+picks the longest geohash precision whose cells are still at least as
+large as the radius; the circle then lies within the cell of the centre
+and its eight neighbours, so candidates are read with nine ``LIKE
+'prefix%'`` range scans of the geohash index. Candidates are then ranked
+by their haversine distance and the ones outside the circle are dropped.
+'''
+from math import asin, cos, radians, sin, sqrt
+
+from django.db.models import Q, Sum
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+GEOHASH_PRECISION = 9
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    '''Geohash of a point, ``precision`` characters long.'''
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    code, bits, value, even = [], 0, 0, True
+    while len(code) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            code.append(BASE32[value])
+            bits = value = 0
+    return ''.join(code)
+
+
+def cell_size(precision):
+    '''``(height, width)`` in degrees of a geohash cell.'''
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180 / 2 ** lat_bits, 360 / 2 ** lon_bits
+
+
+def covering_cells(latitude, longitude, radius_km):
+    '''Geohash prefixes whose cells cover the circle, or ``None`` for "everything".'''
+    # longitude degrees shrink towards the poles: measure them at the
+    # circle's edge nearest to the pole
+    edge = min(90.0, abs(latitude) + radius_km / KM_PER_DEGREE)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        if height * KM_PER_DEGREE >= radius_km and width * KM_PER_DEGREE * cos(radians(edge)) >= radius_km:
+            break
+    else:
+        return None
+    cells = set()
+    for lat_step in (-1, 0, 1):
+        for lon_step in (-1, 0, 1):
+            lat = latitude + lat_step * height
+            if not -90 <= lat <= 90:
+                continue
+            lon = (longitude + lon_step * width + 180) % 360 - 180
+            cells.add(encode(lat, lon, precision))
+    return sorted(cells)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    a = sin((lat2 - lat1) / 2) ** 2 + cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(sqrt(a))
+
+
+def nearby_clinics(latitude, longitude, radius_km, limit=None, clinics=None):
+    '''The clinics within ``radius_km`` of a point, nearest first.
+
+    Returns up to ``limit`` ``(clinic, distance_km)`` pairs; ``clinics``
+    narrows the search (defaults to every clinic).
+    '''
+    from .models import Clinic
+
+    clinics = Clinic.objects.all() if clinics is None else clinics
+    cells = covering_cells(latitude, longitude, radius_km)
+    if cells is None:
+        clinics = clinics.exclude(geohash='')
+    else:
+        # one index range per cell ('~' sorts after every BASE32 digit);
+        # SQLite cannot use an index for LIKE 'cell%'
+        clinics = clinics.filter(Q.create(
+            [Q(geohash__gte=cell, geohash__lt=cell + '~') for cell in cells], connector=Q.OR,
+        ))
+    found = []
+    for clinic in clinics.only('id', 'name', 'address', 'latitude', 'longitude'):
+        distance = haversine_km(latitude, longitude, clinic.latitude, clinic.longitude)
+        if distance <= radius_km:
+            found.append((clinic, distance))
+    found.sort(key=lambda item: (item[1], item[0].pk))
+    return found[:limit]
+
+
+def free_slots(clinic_ids, day, specialty=None):
+    '''``{clinic_id: free slots}`` on ``day``, from the daily rollups.'''
+    from analytics.models import DailyUtilization
+
+    rows = DailyUtilization.objects.filter(clinic_id__in=clinic_ids, date=day)
+    if specialty:
+        rows = rows.filter(specialty=specialty)
+    totals = rows.values('clinic_id').annotate(total=Sum('total_slots'), booked=Sum('booked_slots'))
+    return {row['clinic_id']: row['total'] - row['booked'] for row in totals}
@@ -0,0 +1,261 @@
+'''Live slot updates pushed to subscribed clients (server-sent events).
+
+Every committed change of an availability's slots (booking, cancellation,
+reschedule, slot edit, deletion) is published as a message holding the
+full slot map. Subscribers keep the last state they sent to the client and
+forward only the slots that changed, so messages can be coalesced or
+dropped without the client ever diverging.
+
+Messages travel through the broker configured in ``LIVE_SLOTS_BROKER``:
+``LocalBroker`` hands them straight to this process's ``Hub`` (single
+process deployments and tests), ``PostgresBroker`` sends them with
+``NOTIFY`` and every serving process ``LISTEN``s and feeds its own hub.
+'''
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Availability
+from .signals import slots_changed
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    '''Pending messages of one client, coalesced to the latest per availability.
+
+    ``push`` may be called from any thread; the messages are handed to the
+    subscriber's event loop.
+    '''
+
+    def __init__(self, ids, loop):
+        self.ids = frozenset(ids)
+        self.loop = loop
+        self.pending = {}
+        self.ready = asyncio.Event()
+
+    def push(self, message):
+        self.loop.call_soon_threadsafe(self._deliver, message)
+
+    def _deliver(self, message):
+        # a deletion sticks: slot messages of the same commit may follow it
+        if not self.pending.get(message['id'], {}).get('deleted'):
+            self.pending[message['id']] = message
+        self.ready.set()
+
+    def take(self):
+        messages, self.pending = list(self.pending.values()), {}
+        self.ready.clear()
+        return messages
+
+
+class Hub:
+    '''In-process registry of subscriptions, keyed by availability id.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, ids, loop):
+        subscription = Subscription(ids, loop)
+        with self._lock:
+            for availability_id in subscription.ids:
+                self._subscriptions[availability_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for availability_id in subscription.ids:
+                subscribers = self._subscriptions.get(availability_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscriptions[availability_id]
+
+    def dispatch(self, message):
+        with self._lock:
+            subscribers = list(self._subscriptions.get(message['id'], ()))
+        for subscription in subscribers:
+            try:
+                subscription.push(message)
+            except RuntimeError:
+                # the subscriber's event loop is closed; it unsubscribes on its way out
+                pass
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({subscription for subscribers in self._subscriptions.values() for subscription in subscribers})
+
+
+hub = Hub()
+
+
+class BaseBroker:
+    '''Carries slot messages to the hubs of every serving process.'''
+
+    def __init__(self, hub, **options):
+        self.hub = hub
+        self.options = options
+
+    def start(self):
+        '''Begin receiving messages from other processes (no-op by default).'''
+
+    def publish(self, messages):
+        raise NotImplementedError
+
+
+class LocalBroker(BaseBroker):
+    '''Deliver messages to this process only.'''
+
+    def publish(self, messages):
+        for message in messages:
+            self.hub.dispatch(message)
+
+
+class PostgresBroker(BaseBroker):
+    '''Fan messages out to every process with PostgreSQL ``LISTEN``/``NOTIFY``.
+
+    Publishing is a ``pg_notify`` on the regular connection. ``start`` opens
+    a dedicated autocommit connection in a daemon thread that listens on
+    the channel and feeds the local hub, reconnecting when it drops.
+    '''
+
+    def __init__(self, hub, channel='live_slots', using='default', reconnect_delay=2.0, **options):
+        super().__init__(hub, **options)
+        self.channel = channel
+        self.using = using
+        self.reconnect_delay = reconnect_delay
+        self._thread = None
+
+    def publish(self, messages):
+        with connections[self.using].cursor() as cursor:
+            for message in messages:
+                cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, json.dumps(message)])
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._listen_forever, name='live-slots', daemon=True)
+            self._thread.start()
+
+    def _listen_forever(self):
+        while True:
+            try:
+                self._listen()
+            except Exception:
+                logger.exception("Live slot listener lost its connection.")
+            time.sleep(self.reconnect_delay)
+
+    def _listen(self):
+        import psycopg2
+        from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+
+        connection = connections[self.using]
+        params = connection.get_connection_params()
+        listener = psycopg2.connect(**params)
+        listener.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        try:
+            with listener.cursor() as cursor:
+                cursor.execute(f'LISTEN "{self.channel}"')
+            while True:
+                if select.select([listener], [], [], 60) == ([], [], []):
+                    continue
+                listener.poll()
+                while listener.notifies:
+                    notify = listener.notifies.pop(0)
+                    self.hub.dispatch(json.loads(notify.payload))
+        finally:
+            listener.close()
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        config = settings.LIVE_SLOTS_BROKER
+        _broker = import_string(config['BACKEND'])(hub, **config.get('OPTIONS', {}))
+    return _broker
+
+
+def slot_message(availability):
+    # a copy: the instance's dict keeps being mutated by later bookings
+    return {'id': availability.pk, 'slots': dict(availability.selectable_time_list or {})}
+
+
+def publish_on_commit(messages, using=None):
+    if messages:
+        transaction.on_commit(lambda: get_broker().publish(messages), using=using)
+
+
+@receiver(slots_changed)
+def publish_slots(sender, availabilities, **kwargs):
+    # Availability.delete() clears the pk before sending; deletes are
+    # published from post_delete below.
+    saved = [availability for availability in availabilities if availability.pk]
+    if saved:
+        publish_on_commit([slot_message(availability) for availability in saved], using=saved[0]._state.db)
+
+
+@receiver(post_delete, sender=Availability)
+def publish_deleted(sender, instance, using, **kwargs):
+    publish_on_commit([{'id': instance.pk, 'deleted': True}], using=using)
+
+
+def slot_diff(previous, current):
+    '''Slots whose state differs; slots that no longer exist map to ``None``.'''
+    changed = {slot: state for slot, state in current.items() if previous.get(slot) != state}
+    changed.update({slot: None for slot in previous if slot not in current})
+    return changed
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def slot_stream(availability_ids):
+    '''Yield server-sent events for ``availability_ids`` until the client leaves.
+
+    The first event is a ``snapshot`` of the current slots; after that only
+    ``slots`` diffs and ``deleted`` notices are sent, with a comment line as
+    heartbeat so proxies keep the connection open.
+    '''
+    subscription = hub.subscribe(availability_ids, asyncio.get_running_loop())
+    try:
+        state = {
+            pk: slots or {}
+            async for pk, slots in Availability.objects.filter(pk__in=availability_ids)
+            .values_list('pk', 'selectable_time_list')
+        }
+        yield sse_event('snapshot', [{'id': pk, 'slots': slots} for pk, slots in sorted(state.items())])
+        while True:
+            try:
+                await asyncio.wait_for(subscription.ready.wait(), settings.LIVE_SLOTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield ': ping\n\n'
+                continue
+            for message in subscription.take():
+                availability_id = message['id']
+                if availability_id not in state:
+                    continue
+                if message.get('deleted'):
+                    del state[availability_id]
+                    yield sse_event('deleted', {'id': availability_id})
+                    continue
+                changed = slot_diff(state[availability_id], message['slots'])
+                if changed:
+                    state[availability_id] = message['slots']
+                    yield sse_event('slots', {'id': availability_id, 'changed': changed})
+    finally:
+        hub.unsubscribe(subscription)
+
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from appointments.archive import archive
+
+
+class Command(BaseCommand):
+    help = "Move past availabilities and their appointments to the archive tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+                            help="Archive availabilities that ended more than this many days ago.")
+        parser.add_argument('--batch-size', type=int, default=settings.ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be archived.")
+
+    def handle(self, *args, **options):
+        report = archive(
+            options['older_than'], batch_size=options['batch_size'], dry_run=options['dry_run'],
+            progress=lambda done, total: self.stdout.write(f"{done}/{total} availabilities archived"),
+        )
+        prefix = "Would archive" if report['dry_run'] else "Archived"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {report['availabilities']} availabilities and {report['appointments']} appointments."
+        ))
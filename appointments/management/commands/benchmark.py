@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from appointments.benchmarks import SUITES
+
+
+class Command(BaseCommand):
+    help = "Run a micro-benchmark suite against the configured database (data is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=sorted(SUITES))
+        parser.add_argument('--rows', type=int, help="Rows to generate (defaults to the suite's own size).")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        sizes = {'rows': options['rows']} if options['rows'] else {}
+        SUITES[options['suite']](self.stdout, repeat=options['repeat'], **sizes)
@@ -0,0 +1,54 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appointments.bulk import cancel_appointments, close_clinic, retire_doctor
+from appointments.models import Clinic
+from users.models import Doctor
+
+
+class Command(BaseCommand):
+    help = "Cancel appointments in bulk, retire a doctor or close a clinic."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--availability', type=int, action='append', dest='availabilities',
+                            help="Availability id (repeatable).")
+        parser.add_argument('--from', dest='start', help="First day (YYYY-MM-DD).")
+        parser.add_argument('--to', dest='end', help="Last day (YYYY-MM-DD).")
+        parser.add_argument('--doctor', type=int, help="Limit to a doctor id.")
+        parser.add_argument('--clinic', type=int, help="Limit to a clinic id.")
+        parser.add_argument('--retire-doctor', type=int, help="Doctor id to retire.")
+        parser.add_argument('--close-clinic', type=int, help="Clinic id to close.")
+        parser.add_argument('--reason', default='', help="Reason sent along with the notifications.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would change.")
+
+    def handle(self, *args, **options):
+        job_options = {
+            'batch_size': options['batch_size'],
+            'dry_run': options['dry_run'],
+            'reason': options['reason'],
+            'progress': lambda done, total: self.stdout.write(f"{done}/{total} appointments cancelled"),
+        }
+        try:
+            if options['retire_doctor']:
+                report = retire_doctor(Doctor.objects.get(pk=options['retire_doctor']), **job_options)
+            elif options['close_clinic']:
+                report = close_clinic(Clinic.objects.get(pk=options['close_clinic']), **job_options)
+            else:
+                start = date.fromisoformat(options['start']) if options['start'] else None
+                end = date.fromisoformat(options['end']) if options['end'] else None
+                if not (options['availabilities'] or start or end):
+                    raise CommandError("Give --availability, --from/--to, --retire-doctor or --close-clinic.")
+                report = cancel_appointments(
+                    availability_ids=options['availabilities'], start=start, end=end,
+                    doctor=options['doctor'], clinic=options['clinic'], **job_options
+                )
+        except (Doctor.DoesNotExist, Clinic.DoesNotExist, ValueError) as error:
+            raise CommandError(error)
+        prefix = "Would cancel" if report['dry_run'] else "Cancelled"
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} {report['appointments']} appointments on {report['availabilities']} availabilities."
+        ))
+        if 'removed_availabilities' in report:
+            self.stdout.write(f"Future availabilities removed: {report['removed_availabilities']}")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from appointments.outbox import OutboxDispatcher, lag, pending_events
+
+
+class Command(BaseCommand):
+    help = "Deliver pending appointment events from the outbox to the configured sinks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Deliver what is pending and exit.")
+        parser.add_argument('--batch-size', type=int, help="Events claimed per transaction.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Idle sleep in seconds.")
+        parser.add_argument('--stats', action='store_true', help="Only print the backlog and lag.")
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.stdout.write(f"pending={pending_events().count()} lag_seconds={lag():.1f}")
+            return
+        dispatcher = OutboxDispatcher(batch_size=options['batch_size'])
+        if not options['once']:
+            try:
+                dispatcher.run(interval=options['interval'])
+            except KeyboardInterrupt:
+                pass
+            return
+        total = 0
+        while handled := dispatcher.dispatch_batch():
+            total += handled
+        self.stdout.write(self.style.SUCCESS(f"Handled {total} outbox events, lag {lag():.1f}s."))
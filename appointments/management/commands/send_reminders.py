@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from appointments.reminders import ReminderScheduler
+
+
+class Command(BaseCommand):
+    help = "Send the SMS reminders of upcoming appointments that are due."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Appointments handled per query.")
+
+    def handle(self, *args, **options):
+        report = ReminderScheduler(batch_size=options['batch_size']).run()
+        for kind, (sent, failed) in report.items():
+            self.stdout.write(f"{kind}: {sent} sent, {failed} failed")
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.1 on 2026-10-19 00:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_type', models.CharField(choices=[('appointment.booked', 'Booked'), ('appointment.rescheduled', 'Rescheduled'), ('appointment.cancelled', 'Cancelled')], max_length=50, verbose_name='Event type')),
+                ('payload', models.JSONField(default=dict, verbose_name='Payload')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Available at')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('dispatched_at', models.DateTimeField(blank=True, null=True, verbose_name='Dispatched at')),
+                ('last_error', models.TextField(blank=True, verbose_name='Last error')),
+            ],
+            options={
+                'verbose_name': 'Outbox event',
+                'verbose_name_plural': 'Outbox events',
+                'indexes': [models.Index(condition=models.Q(('dispatched_at__isnull', True)), fields=['available_at'], name='outbox_pending_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.1 on 2026-10-19 00:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def fill_scheduled_at(apps, schema_editor):
+    Appointment = apps.get_model('appointments', 'Appointment')
+    appointments = (
+        Appointment.objects.filter(scheduled_at__isnull=True, selected_time__isnull=False)
+        .select_related('availability').only('id', 'selected_time', 'availability__start_time')
+    )
+    batch = []
+    for appointment in appointments.iterator(chunk_size=1000):
+        try:
+            hour, minute = (int(part) for part in appointment.selected_time.split(':'))
+        except ValueError:
+            continue
+        appointment.scheduled_at = appointment.availability.start_time.replace(
+            hour=hour, minute=minute, second=0, microsecond=0
+        )
+        batch.append(appointment)
+        if len(batch) == 1000:
+            Appointment.objects.bulk_update(batch, ['scheduled_at'])
+            batch = []
+    Appointment.objects.bulk_update(batch, ['scheduled_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0002_outboxevent'),
+        ('users', '0002_doctor_photo_thumbnails_patient_photo_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppointmentReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10, verbose_name='Kind')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Sent at')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+            ],
+            options={
+                'verbose_name': 'Appointment reminder',
+                'verbose_name_plural': 'Appointment reminders',
+            },
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='scheduled_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Scheduled at'),
+        ),
+        migrations.AddIndex(
+            model_name='appointment',
+            index=models.Index(fields=['scheduled_at', 'id'], name='appointment_schedul_d255fd_idx'),
+        ),
+        migrations.AddField(
+            model_name='appointmentreminder',
+            name='appointment',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reminders', to='appointments.appointment', verbose_name='Appointment'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='appointmentreminder',
+            unique_together={('appointment', 'kind')},
+        ),
+        migrations.RunPython(fill_scheduled_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.1 on 2026-10-19 00:06
+
+from django.db import migrations, models
+
+
+def overlapping_rows(availabilities):
+    '''``[(pk, other_pk, doctor_id), ...]`` of the stored windows that overlap.'''
+    overlaps = []
+    doctor_id, active = None, []
+    rows = (
+        availabilities.order_by('doctor_id', 'start_time', 'pk')
+        .values_list('pk', 'doctor_id', 'start_time', 'end_time')
+    )
+    for pk, row_doctor_id, start, end in rows.iterator():
+        if row_doctor_id != doctor_id:
+            doctor_id, active = row_doctor_id, []
+        active = [(other_pk, other_end) for other_pk, other_end in active if other_end > start]
+        overlaps.extend((other_pk, pk, doctor_id) for other_pk, _end in active)
+        active.append((pk, end))
+    return overlaps
+
+
+def add_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Availability = apps.get_model('appointments', 'Availability')
+    overlaps = overlapping_rows(Availability.objects.using(schema_editor.connection.alias))
+    if overlaps:
+        report = '\n'.join(
+            f"  doctor {doctor_id}: availability {pk} overlaps availability {other_pk}"
+            for pk, other_pk, doctor_id in overlaps[:100]
+        )
+        more = f"\n  ... and {len(overlaps) - 100} more" if len(overlaps) > 100 else ''
+        raise RuntimeError(
+            f"Cannot add the availability overlap constraint: {len(overlaps)} overlapping "
+            f"availabilities exist. Shorten or delete one of each pair and migrate again.\n{report}{more}"
+        )
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    schema_editor.execute(
+        'ALTER TABLE appointments_availability ADD CONSTRAINT availability_no_overlap '
+        "EXCLUDE USING gist (doctor_id WITH =, tstzrange(start_time, end_time, '[)') WITH &&)"
+    )
+
+
+def remove_exclusion_constraint(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('ALTER TABLE appointments_availability DROP CONSTRAINT IF EXISTS availability_no_overlap')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0003_appointment_scheduled_at'),
+        ('users', '0002_doctor_photo_thumbnails_patient_photo_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='availability',
+            index=models.Index(fields=['doctor', 'start_time'], name='appointment_doctor__3da6f4_idx'),
+        ),
+        migrations.RunPython(add_exclusion_constraint, remove_exclusion_constraint),
+    ]
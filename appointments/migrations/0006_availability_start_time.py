@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-19 01:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0005_appointment_updated_at_availability_updated_at_and_more'),
+        ('users', '0003_doctor_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='availability',
+            index=models.Index(fields=['start_time'], name='appointment_start_t_481033_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.1 on 2026-10-19 01:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_availability_start_time'),
+        ('users', '0003_doctor_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAvailability',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField(verbose_name='Start time')),
+                ('end_time', models.DateTimeField(verbose_name='End time')),
+                ('selectable_time_list', models.JSONField(blank=True, default=dict, null=True, verbose_name='Selectable times')),
+                ('updated_at', models.DateTimeField(verbose_name='Updated at')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Archived at')),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='appointments.clinic', verbose_name='Clinic')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.doctor', verbose_name='Doctor')),
+            ],
+            options={
+                'verbose_name': 'Archived availability',
+                'verbose_name_plural': 'Archived availabilities',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedAppointment',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('selected_time', models.CharField(blank=True, max_length=5, null=True, verbose_name='Selected Time')),
+                ('scheduled_at', models.DateTimeField(blank=True, null=True, verbose_name='Scheduled at')),
+                ('updated_at', models.DateTimeField(verbose_name='Updated at')),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Archived at')),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='users.patient', verbose_name='Patient')),
+                ('availability', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointments', to='appointments.archivedavailability', verbose_name='Availability')),
+            ],
+            options={
+                'verbose_name': 'Archived appointment',
+                'verbose_name_plural': 'Archived appointments',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedavailability',
+            index=models.Index(fields=['doctor', 'start_time'], name='appointment_doctor__b0bac1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedappointment',
+            index=models.Index(fields=['patient', 'scheduled_at'], name='appointment_patient_a6c08c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedappointment',
+            index=models.Index(fields=['scheduled_at', 'id'], name='appointment_schedul_8a82ee_idx'),
+        ),
+    ]
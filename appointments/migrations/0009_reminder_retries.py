@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-19 02:27
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def claimed_when_created(apps, schema_editor):
+    AppointmentReminder = apps.get_model('appointments', 'AppointmentReminder')
+    AppointmentReminder.objects.using(schema_editor.connection.alias).update(claimed_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0008_clinic_location'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentreminder',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=1, verbose_name='Attempts'),
+        ),
+        migrations.AddField(
+            model_name='appointmentreminder',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Claimed at'),
+        ),
+        migrations.RunPython(claimed_when_created, migrations.RunPython.noop),
+    ]
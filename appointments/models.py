@@ -1,15 +1,43 @@
-from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import IntegrityError, models
+from django.db.models import Q
 from django.utils import timezone
 from datetime import timedelta
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
+from sharding import routing as sharding
+from sharding.query import ShardedManager
 from users.models import Doctor, Patient
+from .geo import encode as geohash_encode
 from .validators import validate_same_day, validate_minimum_duration, validate_not_past_date
+from .signals import rows_changed, slots_changed
 
 
 class Clinic(models.Model):
     name = models.CharField(max_length=200, verbose_name=_("Name"))
     address = models.CharField(max_length=300, verbose_name=_("Address"))
+    latitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)],
+        verbose_name=_("Latitude")
+    )
+    longitude = models.FloatField(
+        null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)],
+        verbose_name=_("Longitude")
+    )
+    # kept in sync with the coordinates by save(); see appointments.geo
+    geohash = models.CharField(max_length=12, blank=True, default='', editable=False, db_index=True,
+                               verbose_name=_("Geohash"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Updated at"))
+
+    objects = ShardedManager()
+
+    def save(self, *args, **kwargs):
+        located = self.latitude is not None and self.longitude is not None
+        self.geohash = geohash_encode(self.latitude, self.longitude) if located else ''
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'geohash'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
@@ -19,6 +47,20 @@ class Clinic(models.Model):
         verbose_name_plural = _("Clinics")
 
 
+# Availabilities never span more than one day (see validate_same_day), so a
+# window overlapping [start, end) must start after ``start - MAX_AVAILABILITY_LENGTH``.
+# That bound turns the overlap test into a short range scan of the
+# (doctor, start_time) index instead of a walk over the doctor's history.
+MAX_AVAILABILITY_LENGTH = timedelta(days=1)
+
+
+def overlap_filter(doctor_id, start, end):
+    return Q(
+        doctor_id=doctor_id, start_time__gt=start - MAX_AVAILABILITY_LENGTH,
+        start_time__lt=end, end_time__gt=start,
+    )
+
+
 class Availability(models.Model):
     doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, verbose_name=_("Doctor"))
     clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, verbose_name=_("Clinic"))
@@ -28,16 +70,47 @@ class Availability(models.Model):
     )
     end_time = models.DateTimeField(verbose_name=_("End time"))
     selectable_time_list = models.JSONField(default=dict, null=True, blank=True, verbose_name=_("Selectable times"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Updated at"))
+
+    objects = ShardedManager()
 
     class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'start_time']),
+            # admin ordering and date hierarchy over every doctor
+            models.Index(fields=['start_time']),
+        ]
         verbose_name = _("Availability")
         verbose_name_plural = _("Availabilities")
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
     def clean(self):
         super().clean()
         if self.start_time and self.end_time:
             validate_same_day(self.start_time, self.end_time)
             validate_minimum_duration(self.start_time, self.end_time, visit_time=10)
+            if self.window_changed() and self.overlapping().exists():
+                raise ValidationError(_("This availability overlaps another availability of the doctor."))
+
+    def overlapping(self):
+        '''Other availabilities of the same doctor overlapping this one.'''
+        return Availability.objects.filter(
+            overlap_filter(self.doctor_id, self.start_time, self.end_time)
+        ).exclude(pk=self.pk)
+
+    def window_changed(self):
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded is None:
+            return True
+        return any(
+            loaded.get(name, getattr(self, name)) != getattr(self, name)
+            for name in ('doctor_id', 'start_time', 'end_time')
+        )
 
     def calculation_of_time_slots(self, visit_time=10, break_time=0):
         slots = {}
@@ -59,6 +132,13 @@ class Availability(models.Model):
         if not self.selectable_time_list :
             self.calculation_of_time_slots()
         super().save(*args, **kwargs)
+        slots_changed.send(sender=Availability, availabilities=[self])
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        slots_changed.send(sender=Availability, availabilities=[self])
+        return result
 
     def __str__(self):
         date = self.start_time.date()
@@ -71,9 +151,16 @@ class Appointment(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE, verbose_name=_("Patient"))
     availability = models.ForeignKey(Availability, on_delete=models.CASCADE, verbose_name=_("Availability"))
     selected_time = models.CharField(max_length=5, null=True, blank=True, verbose_name=_("Selected Time"))
+    scheduled_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name=_("Scheduled at"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Updated at"))
+
+    objects = ShardedManager()
 
     class Meta:
         unique_together = ('patient', 'availability')
+        indexes = [
+            models.Index(fields=['scheduled_at', 'id']),
+        ]
         verbose_name = _("Appointment")
         verbose_name_plural = _("Appointments")
 
@@ -85,20 +172,286 @@ class Appointment(models.Model):
         except Exception:
             raise ValidationError(_("Selected time could not be verified."))
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def event_payload(self):
+        return {
+            'appointment': self.pk,
+            'patient': self.patient_id,
+            'availability': self.availability_id,
+            'doctor': self.availability.doctor_id,
+            'clinic': self.availability.clinic_id,
+            'date': self.availability.start_time.date().isoformat(),
+            'selected_time': self.selected_time,
+        }
+
+    def compute_scheduled_at(self):
+        '''Combine the availability's day with the ``HH:MM`` selected time.'''
+        if not self.selected_time:
+            return None
+        hour, minute = (int(part) for part in self.selected_time.split(':'))
+        return self.availability.start_time.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
     def save(self, *args, **kwargs):
         self.clean()
-        super().save(*args, **kwargs)
-        selectable_slots = self.availability.selectable_time_list
-        if self.selected_time in selectable_slots:
-            selectable_slots[self.selected_time] = False
-            self.availability.save()
+        self.scheduled_at = self.compute_scheduled_at()
+        adding = self._state.adding
+        loaded = getattr(self, '_loaded_values', {})
+        previous = {
+            'availability': loaded.get('availability_id', self.availability_id),
+            'selected_time': loaded.get('selected_time', self.selected_time),
+        }
+        moved = not adding and previous != {'availability': self.availability_id, 'selected_time': self.selected_time}
+        with sharding.atomic(self):
+            super().save(*args, **kwargs)
+            if moved:
+                self.release_slot(previous['availability'], previous['selected_time'])
+            selectable_slots = self.availability.selectable_time_list
+            if self.selected_time in selectable_slots:
+                selectable_slots[self.selected_time] = False
+                self.availability.save()
+            if adding:
+                OutboxEvent.record(OutboxEvent.EventType.BOOKED, self.event_payload())
+            elif moved:
+                self.reminders.all().delete()
+                OutboxEvent.record(
+                    OutboxEvent.EventType.RESCHEDULED,
+                    dict(self.event_payload(), previous=previous),
+                )
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+
+    def release_slot(self, availability_id, selected_time):
+        if availability_id == self.availability_id:
+            availability = self.availability
+        else:
+            availability = Availability.objects.get(pk=availability_id)
+        selectable_slots = availability.selectable_time_list or {}
+        if selected_time in selectable_slots:
+            selectable_slots[selected_time] = True
+            availability.save()
+
+    def reschedule(self, availability_id, selected_time):
+        '''Move the appointment to another slot of the same or another availability.
+
+        The appointment row is locked and re-read first, so concurrent
+        reschedules of it release its current slot only once; then both
+        availabilities are locked in primary key order, the old slot is
+        released and the new one claimed with a single bulk update, and one
+        ``appointment.rescheduled`` event is recorded. The query count does
+        not depend on the size of either availability.
+        '''
+        original = (self.availability_id, self.selected_time, self.scheduled_at)
+        if original[:2] == (availability_id, selected_time):
+            return self
+        try:
+            with sharding.atomic(self):
+                current = (
+                    Appointment.objects.select_for_update().filter(pk=self.pk)
+                    .values_list('availability_id', 'selected_time').first()
+                )
+                if current is None:
+                    raise ValidationError(_("Appointment does not exist."))
+                self.availability_id, self.selected_time = current
+                previous = {'availability': self.availability_id, 'selected_time': self.selected_time}
+                if current == (availability_id, selected_time):
+                    self.scheduled_at = self.compute_scheduled_at()
+                    return self
+                locked = {
+                    availability.pk: availability
+                    for availability in Availability.objects.select_for_update()
+                    .filter(pk__in={self.availability_id, availability_id}).order_by('pk')
+                }
+                if availability_id not in locked:
+                    raise ValidationError(_("Availability does not exist."))
+                target = locked[availability_id]
+                target_slots = target.selectable_time_list or {}
+                if not target_slots.get(selected_time, False):
+                    raise ValidationError(_("Selected time is not available."))
+                source_slots = locked[self.availability_id].selectable_time_list or {}
+                if self.selected_time in source_slots:
+                    source_slots[self.selected_time] = True
+                target_slots[selected_time] = False
+                target.selectable_time_list = target_slots
+                now = timezone.now()
+                for availability in locked.values():
+                    availability.updated_at = now
+                Availability.objects.bulk_update(list(locked.values()), ['selectable_time_list', 'updated_at'])
+
+                self.availability = target
+                self.selected_time = selected_time
+                self.scheduled_at = self.compute_scheduled_at()
+                self.updated_at = now
+                Appointment.objects.filter(pk=self.pk).update(
+                    availability=target, selected_time=selected_time, scheduled_at=self.scheduled_at,
+                    updated_at=now,
+                )
+                AppointmentReminder.objects.filter(appointment=self).delete()
+                OutboxEvent.record(
+                    OutboxEvent.EventType.RESCHEDULED,
+                    dict(self.event_payload(), previous=previous),
+                )
+                slots_changed.send(sender=Availability, availabilities=list(locked.values()))
+                rows_changed.send(sender=Availability, instances=list(locked.values()))
+                rows_changed.send(sender=Appointment, instances=[self])
+        except (IntegrityError, ValidationError) as error:
+            self.availability_id, self.selected_time, self.scheduled_at = original
+            if isinstance(error, ValidationError):
+                raise
+            raise ValidationError(_("The patient already has an appointment on this availability."))
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
+        return self
+
+    @property
+    def user(self):
+        return self.patient.user
 
     def delete(self, *args, **kwargs):
-        selectable_slots = self.availability.selectable_time_list
-        if self.selected_time in selectable_slots:
-            selectable_slots[self.selected_time] = True
-            self.availability.save()
-        super().delete(*args, **kwargs)
+        payload = self.event_payload()
+        with sharding.atomic(self):
+            selectable_slots = self.availability.selectable_time_list
+            if self.selected_time in selectable_slots:
+                selectable_slots[self.selected_time] = True
+                self.availability.save()
+            result = super().delete(*args, **kwargs)
+            OutboxEvent.record(OutboxEvent.EventType.CANCELLED, payload)
+        return result
 
     def __str__(self):
         return f"{self.patient} - {self.availability.doctor}"
+
+
+class ArchivedAvailability(models.Model):
+    '''An availability moved out of the hot table by ``appointments.archive``.
+
+    Rows keep the primary key they had as an ``Availability``.
+    '''
+
+    id = models.BigIntegerField(primary_key=True, verbose_name=_("ID"))
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, verbose_name=_("Doctor"))
+    clinic = models.ForeignKey(Clinic, on_delete=models.CASCADE, verbose_name=_("Clinic"))
+    start_time = models.DateTimeField(verbose_name=_("Start time"))
+    end_time = models.DateTimeField(verbose_name=_("End time"))
+    selectable_time_list = models.JSONField(default=dict, null=True, blank=True, verbose_name=_("Selectable times"))
+    updated_at = models.DateTimeField(verbose_name=_("Updated at"))
+    archived_at = models.DateTimeField(default=timezone.now, verbose_name=_("Archived at"))
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'start_time']),
+        ]
+        verbose_name = _("Archived availability")
+        verbose_name_plural = _("Archived availabilities")
+
+    def __str__(self):
+        return f"{self.doctor_id}@{self.clinic_id} {self.start_time:%Y-%m-%d %H:%M}"
+
+
+class ArchivedAppointment(models.Model):
+    '''An appointment archived together with its availability.'''
+
+    id = models.BigIntegerField(primary_key=True, verbose_name=_("ID"))
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, verbose_name=_("Patient"))
+    availability = models.ForeignKey(
+        ArchivedAvailability, on_delete=models.CASCADE,
+        related_name='appointments', verbose_name=_("Availability")
+    )
+    selected_time = models.CharField(max_length=5, null=True, blank=True, verbose_name=_("Selected Time"))
+    scheduled_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Scheduled at"))
+    updated_at = models.DateTimeField(verbose_name=_("Updated at"))
+    archived_at = models.DateTimeField(default=timezone.now, verbose_name=_("Archived at"))
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['patient', 'scheduled_at']),
+            models.Index(fields=['scheduled_at', 'id']),
+        ]
+        verbose_name = _("Archived appointment")
+        verbose_name_plural = _("Archived appointments")
+
+    def __str__(self):
+        return f"#{self.pk} {self.patient_id} {self.scheduled_at}"
+
+
+class AppointmentReminder(models.Model):
+    '''A reminder claimed (and usually sent) for one appointment and lead time.
+
+    A failed send is claimed again after ``REMINDER_RETRY_SECONDS``, up to
+    ``REMINDER_MAX_ATTEMPTS`` attempts in all.
+    '''
+
+    appointment = models.ForeignKey(
+        Appointment, on_delete=models.CASCADE,
+        related_name='reminders', verbose_name=_("Appointment")
+    )
+    kind = models.CharField(max_length=10, verbose_name=_("Kind"))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Created at"))
+    claimed_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Claimed at"))
+    attempts = models.PositiveSmallIntegerField(default=1, verbose_name=_("Attempts"))
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Sent at"))
+    error = models.TextField(blank=True, verbose_name=_("Error"))
+
+    objects = ShardedManager()
+
+    class Meta:
+        unique_together = ('appointment', 'kind')
+        verbose_name = _("Appointment reminder")
+        verbose_name_plural = _("Appointment reminders")
+
+    def __str__(self):
+        return f"{self.kind} reminder for appointment #{self.appointment_id}"
+
+
+class OutboxEvent(models.Model):
+    '''Appointment change waiting to be delivered to downstream systems.
+
+    Events are written in the same transaction as the change itself and
+    delivered later by ``appointments.outbox.OutboxDispatcher``.
+    '''
+
+    class EventType(models.TextChoices):
+        BOOKED = 'appointment.booked', _('Booked')
+        RESCHEDULED = 'appointment.rescheduled', _('Rescheduled')
+        CANCELLED = 'appointment.cancelled', _('Cancelled')
+
+    event_type = models.CharField(max_length=50, choices=EventType.choices, verbose_name=_("Event type"))
+    payload = models.JSONField(default=dict, verbose_name=_("Payload"))
+    created_at = models.DateTimeField(default=timezone.now, verbose_name=_("Created at"))
+    available_at = models.DateTimeField(default=timezone.now, verbose_name=_("Available at"))
+    attempts = models.PositiveIntegerField(default=0, verbose_name=_("Attempts"))
+    dispatched_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Dispatched at"))
+    last_error = models.TextField(blank=True, verbose_name=_("Last error"))
+
+    objects = ShardedManager()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['available_at'], condition=Q(dispatched_at__isnull=True),
+                name='outbox_pending_idx',
+            ),
+        ]
+        verbose_name = _("Outbox event")
+        verbose_name_plural = _("Outbox events")
+
+    @classmethod
+    def record(cls, event_type, payload):
+        return cls.objects.create(event_type=event_type, payload=payload)
+
+    def as_message(self):
+        return {
+            'id': self.pk,
+            'type': self.event_type,
+            'created_at': self.created_at.isoformat(),
+            'payload': self.payload,
+        }
+
+    def __str__(self):
+        return f"{self.event_type} #{self.pk}"
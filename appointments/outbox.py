@@ -0,0 +1,154 @@
+import json
+import logging
+import os
+import random
+import threading
+import urllib.request
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from sharding import routing as sharding
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+
+class BaseSink:
+    '''Destination of outbox events. ``send`` receives a list of messages
+    and must raise on failure; delivery is at-least-once, so sinks should
+    deduplicate on the message ``id``.'''
+
+    def __init__(self, **options):
+        self.options = options
+
+    def send(self, messages):
+        raise NotImplementedError
+
+
+class FileSink(BaseSink):
+    '''Append every message as one JSON line to a local file.'''
+
+    def __init__(self, path, **options):
+        super().__init__(**options)
+        self.path = path
+
+    def send(self, messages):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as file:
+            for message in messages:
+                file.write(json.dumps(message, ensure_ascii=False) + '\n')
+
+
+class WebhookSink(BaseSink):
+    '''POST each batch as a JSON array to an HTTP endpoint.'''
+
+    def __init__(self, url, timeout=5, headers=None, **options):
+        super().__init__(**options)
+        self.url = url
+        self.timeout = timeout
+        self.headers = {'Content-Type': 'application/json', **(headers or {})}
+
+    def send(self, messages):
+        request = urllib.request.Request(
+            self.url, data=json.dumps(messages).encode('utf-8'),
+            headers=self.headers, method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if response.status >= 300:
+                raise OSError(f"Webhook answered {response.status}")
+
+
+class LocMemSink(BaseSink):
+    '''Keep delivered messages in memory, for tests and local runs.'''
+
+    messages = []
+
+    def send(self, messages):
+        LocMemSink.messages.extend(messages)
+
+
+def get_sinks():
+    return [
+        import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+        for config in settings.OUTBOX_SINKS
+    ]
+
+
+def pending_events():
+    return OutboxEvent.objects.filter(dispatched_at__isnull=True)
+
+
+def lag():
+    '''Age in seconds of the oldest undelivered event (0 when caught up).'''
+    oldest = pending_events().aggregate(oldest=Min('created_at'))['oldest']
+    return (timezone.now() - oldest).total_seconds() if oldest else 0.0
+
+
+class OutboxDispatcher:
+    '''Deliver pending outbox events to the configured sinks in batches.
+
+    Rows are claimed with ``SELECT ... FOR UPDATE SKIP LOCKED`` so several
+    dispatchers can run side by side. A failing batch is retried with an
+    exponential, jittered backoff capped at ``max_delay`` seconds.
+    '''
+
+    def __init__(self, sinks=None, batch_size=None, base_delay=2, max_delay=3600):
+        self.sinks = get_sinks() if sinks is None else sinks
+        self.batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempts):
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+    def dispatch_batch(self):
+        '''Deliver one batch per shard. Returns the number of events handled.'''
+        return sum(self.dispatch_shard(alias) for alias in sharding.each_shard())
+
+    def dispatch_shard(self, alias):
+        now = timezone.now()
+        with sharding.atomic(alias):
+            events = list(
+                pending_events().select_for_update(skip_locked=True)
+                .filter(available_at__lte=now).order_by('pk')[:self.batch_size]
+            )
+            if not events:
+                return 0
+            try:
+                messages = [event.as_message() for event in events]
+                for sink in self.sinks:
+                    sink.send(messages)
+            except Exception as error:
+                logger.warning("Outbox delivery of %d events failed: %s", len(events), error)
+                for event in events:
+                    event.attempts += 1
+                    event.available_at = now + self.backoff(event.attempts)
+                    event.last_error = str(error)[:1000]
+                OutboxEvent.objects.bulk_update(events, ['attempts', 'available_at', 'last_error'])
+            else:
+                pending_events().filter(pk__in=[event.pk for event in events]).update(
+                    dispatched_at=now, last_error=''
+                )
+        return len(events)
+
+    def run(self, interval=1.0, stop_event=None):
+        '''Dispatch until ``stop_event`` is set, sleeping when idle.'''
+        stop_event = stop_event or threading.Event()
+        while not stop_event.is_set():
+            if not self.dispatch_batch():
+                stop_event.wait(interval)
+
+    def start(self, interval=1.0):
+        '''Run the dispatcher in a daemon thread; returns its stop event.'''
+        stop_event = threading.Event()
+        threading.Thread(
+            target=self.run, args=(interval, stop_event),
+            name='outbox-dispatcher', daemon=True,
+        ).start()
+        return stop_event
@@ -0,0 +1,100 @@
+'''Serializer-free read paths for the hot list endpoints.
+
+The functions below read exactly the columns the list serializers need
+with ``values_list`` (one joined query) and build the response dicts
+directly, skipping DRF field construction and ``to_representation`` per
+row. The output must stay identical to ``AvailabilitySerializer`` and
+``DoctorSerializer``; ``ProjectionParityTests`` guards that, so a field
+added to one of those serializers has to be added here as well.
+'''
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from users.thumbnails import thumbnail_url
+
+DOCTOR_COLUMNS = (
+    'user__first_name', 'user__last_name', 'user__gender', 'user__slug',
+    'medical_code', 'specialty', 'photo', 'photo_thumbnails',
+)
+
+AVAILABILITY_COLUMNS = (
+    'id', 'clinic_id', 'clinic__name', 'clinic__address', 'clinic__latitude', 'clinic__longitude',
+    'start_time', 'end_time', 'selectable_time_list', 'doctor_id',
+) + tuple(f'doctor__{column}' for column in DOCTOR_COLUMNS)
+
+
+def _datetime_formatter():
+    '''Same output as ``serializers.DateTimeField().to_representation``.
+
+    The ISO 8601 case is inlined with the current time zone resolved once
+    per response; other ``DATETIME_FORMAT`` settings use the DRF field.
+    '''
+    if api_settings.DATETIME_FORMAT != ISO_8601 or not settings.USE_TZ:
+        return serializers.DateTimeField().to_representation
+    current = timezone.get_current_timezone()
+
+    def format_datetime(value):
+        if not value:
+            return None
+        value = value.astimezone(current).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return format_datetime
+
+
+def _url_builder(request):
+    if request is None:
+        return lambda url: url
+    return request.build_absolute_uri
+
+
+def _doctor_builder(request):
+    '''Return a function turning a ``DOCTOR_COLUMNS`` tuple into a DoctorSerializer dict.'''
+    absolute = _url_builder(request)
+    params = getattr(request, 'query_params', None) or {}
+    variant, extension = params.get('photo_variant'), params.get('photo_format')
+
+    def build(first_name, last_name, gender, slug, medical_code, specialty, photo, thumbnails):
+        thumbnail = thumbnail_url(thumbnails, variant, extension)
+        return {
+            'user': {'first_name': first_name, 'last_name': last_name, 'gender': gender, 'slug': slug},
+            'medical_code': medical_code,
+            'specialty': specialty,
+            'photo': absolute(default_storage.url(photo)) if photo else None,
+            'photo_thumbnail': absolute(thumbnail) if thumbnail else None,
+        }
+    return build
+
+
+def doctor_rows(queryset, request=None):
+    '''Rows of ``queryset`` (Doctor) in the shape of ``DoctorSerializer``.'''
+    build = _doctor_builder(request)
+    return [build(*row) for row in queryset.values_list(*DOCTOR_COLUMNS)]
+
+
+def availability_rows(queryset, request=None):
+    '''Rows of ``queryset`` (Availability) in the shape of ``AvailabilitySerializer``.
+
+    Rows of the same doctor share one (read-only) doctor dict.
+    '''
+    build = _doctor_builder(request)
+    doctors = {}
+
+    def build_doctor(doctor_id, *columns):
+        if doctor_id not in doctors:
+            doctors[doctor_id] = build(*columns)
+        return doctors[doctor_id]
+
+    datetime = _datetime_formatter()
+    return [
+        {
+            'id': row[0],
+            'doctor': build_doctor(*row[9:]),
+            'clinic': {'id': row[1], 'name': row[2], 'address': row[3], 'latitude': row[4], 'longitude': row[5]},
+            'start_time': datetime(row[6]),
+            'end_time': datetime(row[7]),
+            'selectable_time_list': row[8],
+        }
+        for row in queryset.values_list(*AVAILABILITY_COLUMNS)
+    ]
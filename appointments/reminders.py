@@ -0,0 +1,183 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext as _
+
+from sharding import routing as sharding
+
+from .models import Appointment, AppointmentReminder
+
+logger = logging.getLogger(__name__)
+
+
+class BaseSender:
+    '''Delivers reminder texts to a phone number. ``send`` must raise on failure.'''
+
+    def __init__(self, **options):
+        self.options = options
+
+    def send(self, phone_number, text):
+        raise NotImplementedError
+
+
+class ConsoleSender(BaseSender):
+    '''Log reminders instead of sending them.'''
+
+    def send(self, phone_number, text):
+        logger.info("SMS to %s: %s", phone_number, text)
+
+
+class LocMemSender(BaseSender):
+    '''Keep reminders in memory, for tests and local runs.'''
+
+    outbox = []
+
+    def send(self, phone_number, text):
+        LocMemSender.outbox.append((phone_number, text))
+
+
+def get_sender():
+    config = settings.REMINDER_SENDER
+    return import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+
+
+def reminder_text(row):
+    scheduled_at = timezone.localtime(row['scheduled_at'])
+    return _("Reminder: your appointment with Dr. %(doctor)s at %(clinic)s is on %(date)s at %(time)s.") % {
+        'doctor': row['availability__doctor__user__last_name'],
+        'clinic': row['availability__clinic__name'],
+        'date': scheduled_at.date().isoformat(),
+        'time': row['selected_time'],
+    }
+
+
+class ReminderScheduler:
+    '''Send each configured reminder once per appointment.
+
+    ``REMINDER_WINDOWS`` maps a reminder kind to its lead time in minutes.
+    A kind covers the appointments between the next shorter lead time and
+    its own, so a late booking only gets the closest reminder. Due rows are
+    walked with keyset pagination over the (scheduled_at, id) index and a
+    reminder row is claimed before sending, so at most one SMS goes out per
+    appointment and kind even when runs overlap. A reminder whose send
+    failed (or whose run died) is claimed again once its claim is
+    ``REMINDER_RETRY_SECONDS`` old, until ``REMINDER_MAX_ATTEMPTS``.
+    '''
+
+    def __init__(self, sender=None, batch_size=None):
+        self.sender = sender or get_sender()
+        self.batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+
+    def windows(self, now):
+        lower = now
+        for kind, minutes in sorted(settings.REMINDER_WINDOWS.items(), key=lambda item: item[1]):
+            upper = now + timedelta(minutes=minutes)
+            yield kind, lower, upper
+            lower = upper
+
+    def settled(self, kind, now):
+        '''Reminders of ``kind`` that are sent, claimed recently or out of attempts.'''
+        return AppointmentReminder.objects.filter(kind=kind).filter(
+            Q(sent_at__isnull=False)
+            | Q(claimed_at__gt=now - timedelta(seconds=settings.REMINDER_RETRY_SECONDS))
+            | Q(attempts__gte=settings.REMINDER_MAX_ATTEMPTS)
+        )
+
+    def due(self, kind, lower, upper, now=None):
+        '''Yield batches of due appointment rows without loading them all.'''
+        now = now or timezone.now()
+        queryset = (
+            Appointment.objects.filter(scheduled_at__gt=lower, scheduled_at__lte=upper)
+            .filter(~Exists(self.settled(kind, now).filter(appointment=OuterRef('pk'))))
+            .order_by('scheduled_at', 'pk')
+            .values(
+                'pk', 'scheduled_at', 'selected_time', 'patient__user__phone_number',
+                'availability__doctor__user__last_name', 'availability__clinic__name',
+            )
+        )
+        cursor = None
+        while True:
+            batch = queryset
+            if cursor:
+                batch = batch.filter(
+                    Q(scheduled_at__gt=cursor[0]) | Q(scheduled_at=cursor[0], pk__gt=cursor[1])
+                )
+            rows = list(batch[:self.batch_size])
+            if not rows:
+                return
+            yield rows
+            cursor = (rows[-1]['scheduled_at'], rows[-1]['pk'])
+
+    def claim(self, kind, rows, now):
+        '''Create or re-claim the reminder rows of a batch; return the rows this run owns.'''
+        retries = {
+            reminder.appointment_id: reminder
+            for reminder in AppointmentReminder.objects.filter(
+                kind=kind, appointment_id__in=[row['pk'] for row in rows],
+            )
+        }
+        claimed = []
+        for row in rows:
+            reminder = retries.get(row['pk'])
+            if reminder is None:
+                continue
+            # the claim only holds if no other run re-claimed the row meanwhile
+            if AppointmentReminder.objects.filter(
+                pk=reminder.pk, sent_at__isnull=True, attempts=reminder.attempts,
+            ).update(claimed_at=now, attempts=F('attempts') + 1):
+                reminder.attempts += 1
+                claimed.append((row, reminder))
+        new_rows = [row for row in rows if row['pk'] not in retries]
+        reminders = [AppointmentReminder(appointment_id=row['pk'], kind=kind, claimed_at=now) for row in new_rows]
+        try:
+            with sharding.atomic():
+                AppointmentReminder.objects.bulk_create(reminders)
+            return claimed + list(zip(new_rows, reminders))
+        except IntegrityError:
+            for row, reminder in zip(new_rows, reminders):
+                try:
+                    with sharding.atomic():
+                        reminder.save()
+                    claimed.append((row, reminder))
+                except IntegrityError:
+                    continue
+            return claimed
+
+    def send_due(self, kind, lower, upper, now=None):
+        '''Send the due reminders of one kind. Returns ``(sent, failed)``.'''
+        now = now or timezone.now()
+        sent = failed = 0
+        for rows in self.due(kind, lower, upper, now):
+            claimed = self.claim(kind, rows, now)
+            for row, reminder in claimed:
+                try:
+                    self.sender.send(row['patient__user__phone_number'], reminder_text(row))
+                    reminder.sent_at = timezone.now()
+                    reminder.error = ''
+                    sent += 1
+                except Exception as error:
+                    reminder.error = str(error)[:1000]
+                    failed += 1
+            AppointmentReminder.objects.bulk_update(
+                [reminder for _row, reminder in claimed], ['sent_at', 'error']
+            )
+        return sent, failed
+
+    def run(self, now=None):
+        '''Send every due reminder. Returns ``{kind: (sent, failed)}``.'''
+        now = now or timezone.now()
+        report = {}
+        for kind, lower, upper in self.windows(now):
+            sent = failed = 0
+            for alias in sharding.each_shard():
+                with sharding.use_shard(alias):
+                    shard_sent, shard_failed = self.send_due(kind, lower, upper, now)
+                sent += shard_sent
+                failed += shard_failed
+            report[kind] = (sent, failed)
+        return report
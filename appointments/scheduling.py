@@ -0,0 +1,90 @@
+from functools import reduce
+from operator import or_
+
+from django.db import IntegrityError
+
+from sharding import routing as sharding
+
+from .models import Availability, overlap_filter
+from .signals import rows_changed, slots_changed
+
+
+def find_conflicts(windows):
+    '''Check a batch of proposed ``(doctor_id, start, end)`` windows at once.
+
+    Existing availabilities of all involved doctors are read with a single
+    indexed query, then a sweep over the sorted intervals finds overlaps
+    with stored rows and between the proposed windows themselves. Returns
+    a list of ``{'index': i, 'availability': pk}`` or ``{'index': i,
+    'other_index': j}`` entries.
+    '''
+    if not windows:
+        return []
+    spans = {}
+    for doctor_id, start, end in windows:
+        low, high = spans.get(doctor_id, (start, end))
+        spans[doctor_id] = (min(low, start), max(high, end))
+    existing = Availability.objects.filter(
+        reduce(or_, (overlap_filter(doctor_id, low, high) for doctor_id, (low, high) in spans.items()))
+    ).values_list('pk', 'doctor_id', 'start_time', 'end_time')
+
+    intervals = {}
+    for pk, doctor_id, start, end in existing:
+        intervals.setdefault(doctor_id, []).append((start, end, 'availability', pk))
+    for index, (doctor_id, start, end) in enumerate(windows):
+        intervals.setdefault(doctor_id, []).append((start, end, 'index', index))
+
+    conflicts = []
+    for doctor_intervals in intervals.values():
+        doctor_intervals.sort(key=lambda interval: interval[0])
+        active = []
+        for start, end, kind, key in doctor_intervals:
+            active = [interval for interval in active if interval[1] > start]
+            for _start, _end, other_kind, other_key in active:
+                if kind == 'index' and other_kind == 'index':
+                    conflicts.append({'index': key, 'other_index': other_key})
+                elif kind == 'index':
+                    conflicts.append({'index': key, 'availability': other_key})
+                elif other_kind == 'index':
+                    conflicts.append({'index': other_key, 'availability': key})
+            active.append((start, end, kind, key))
+    return sorted(conflicts, key=lambda conflict: conflict['index'])
+
+
+def create_schedule(doctor, windows, batch_size=500):
+    '''Create many availabilities for ``doctor`` if none of them overlap.
+
+    ``windows`` is a list of dicts with ``clinic``, ``start_time`` and
+    ``end_time``. Returns ``(created, conflicts)``; nothing is written when
+    there is any conflict, including one with an availability inserted
+    concurrently (caught by the exclusion constraint on PostgreSQL).
+    '''
+    proposed = [(doctor.pk, window['start_time'], window['end_time']) for window in windows]
+    conflicts = find_conflicts(proposed)
+    if conflicts:
+        return [], conflicts
+    availabilities = []
+    for window in windows:
+        availability = Availability(doctor=doctor, **window)
+        availability.clean_fields(exclude=['doctor', 'clinic', 'selectable_time_list'])
+        availability.calculation_of_time_slots()
+        availabilities.append(availability)
+    created = {}
+    # one transaction per shard: the schedule may span clinics on several
+    for alias, group in sharding.group_by_shard(availabilities).items():
+        try:
+            with sharding.atomic(alias):
+                group = Availability.objects.bulk_create(group, batch_size=batch_size)
+                slots_changed.send(sender=Availability, availabilities=group)
+                rows_changed.send(sender=Availability, instances=group)
+        except IntegrityError:
+            conflicts = find_conflicts(proposed)
+            if not conflicts:
+                raise
+            for done_alias, done in created.items():
+                with sharding.atomic(done_alias):
+                    Availability.objects.filter(pk__in=[availability.pk for availability in done]).delete()
+                    slots_changed.send(sender=Availability, availabilities=done)
+            return [], conflicts
+        created[alias] = group
+    return [availability for group in created.values() for availability in group], []
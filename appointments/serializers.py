@@ -1,22 +1,37 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils.translation import gettext_lazy as _
+from django.db import IntegrityError
 from rest_framework import serializers
+from healthcare_appointment_system.fieldsets import SparseFieldsetMixin
 from users.serializers import DoctorSerializer, LimitPatientSerializer
-from .models import Clinic, Availability, Appointment
+from .models import Clinic, Availability, Appointment, ArchivedAvailability, ArchivedAppointment
+from .validators import validate_same_day, validate_minimum_duration, validate_not_past_date
 
 
-class ClinicSerializer(serializers.ModelSerializer):
+class ClinicSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     '''Clinicserializer to serve clinic data.
 
      ## Fields:
      - id: Clinic ID (automatically)
      - name: Clinic name
      - address: Clinic address
+     - latitude: Latitude of the clinic (optional, with longitude)
+     - longitude: Longitude of the clinic (optional, with latitude)
     '''
     class Meta:
         model = Clinic
-        fields = '__all__'
+        exclude = ['updated_at', 'geohash']
 
+    def validate(self, attrs):
+        latitude = attrs.get('latitude', getattr(self.instance, 'latitude', None))
+        longitude = attrs.get('longitude', getattr(self.instance, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError(_("Give both latitude and longitude, or neither."))
+        return attrs
 
-class AvailabilitySerializer(serializers.ModelSerializer):
+
+class AvailabilitySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     '''
     AvailabilitySerializer for serializing the availability data of doctors.
 
@@ -33,12 +48,81 @@ class AvailabilitySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Availability
-        fields = '__all__'
+        exclude = ['updated_at']
+
+
+class AvailabilityWriteSerializer(serializers.ModelSerializer):
+    '''
+    AvailabilityWriteSerializer for creating and updating a doctor's availability.
+
+     ## Fields:
+     - id: Access ID (automatically)
+     - clinic: ID of the clinic
+     - start_time: Start time of availability
+     - end_time: End time of availability
+
+    The times of an availability with appointments cannot change; otherwise
+    its slots are rebuilt for the new window.
+    '''
+    start_time = serializers.DateTimeField(validators=[validate_not_past_date])
+
+    class Meta:
+        model = Availability
+        fields = ['id', 'clinic', 'start_time', 'end_time']
+        read_only_fields = ['id']
+
+    def save_checked(self, save, *args):
+        try:
+            return save(*args)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError({'non_field_errors': error.messages})
+        except IntegrityError:
+            raise serializers.ValidationError(
+                {'non_field_errors': [_("This availability overlaps another availability of the doctor.")]}
+            )
+
+    def create(self, validated_data):
+        return self.save_checked(super().create, validated_data)
+
+    def update(self, instance, validated_data):
+        if any(validated_data.get(name, getattr(instance, name)) != getattr(instance, name)
+               for name in ('start_time', 'end_time')):
+            if instance.appointment_set.exists():
+                raise serializers.ValidationError(
+                    {'non_field_errors': [_("The times of an availability with appointments cannot change.")]}
+                )
+            # emptied so that save() rebuilds them for the new window
+            instance.selectable_time_list = {}
+        return self.save_checked(super().update, instance, validated_data)
 
 
-class SelectableTimeListSerializer(serializers.ModelSerializer):
+class AvailabilityWindowSerializer(serializers.Serializer):
+    '''
+    AvailabilityWindowSerializer for one window of a bulk schedule.
+
+     ## Fields:
+     - clinic: ID of the clinic
+     - start_time: Start time of availability
+     - end_time: End time of availability
+    '''
+
+    clinic = serializers.PrimaryKeyRelatedField(queryset=Clinic.objects.all())
+    start_time = serializers.DateTimeField(validators=[validate_not_past_date])
+    end_time = serializers.DateTimeField()
+
+    def validate(self, attrs):
+        try:
+            validate_same_day(attrs['start_time'], attrs['end_time'])
+            validate_minimum_duration(attrs['start_time'], attrs['end_time'], visit_time=10)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError(error.messages)
+        return attrs
+
+
+class SelectableTimeListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     doctor = DoctorSerializer()
     clinic_name = serializers.SerializerMethodField()
+    sparse_sources = {'clinic_name': ['clinic__name']}
 
     class Meta:
         model = Availability
@@ -54,7 +138,7 @@ class SelectableTimeListSerializer(serializers.ModelSerializer):
         return instance
 
 
-class AppointmentSerializer(serializers.ModelSerializer):
+class AppointmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     '''
     AppointmentSerializer for serializing appointment data.
 
@@ -79,6 +163,198 @@ class AppointmentSerializer(serializers.ModelSerializer):
         return appointment
 
     def update(self, instance, validated_data):
-        instance.selected_time = validated_data.get('selected_time', instance.selected_time)
-        instance.save()
-        return instance
+        selected_time = validated_data.get('selected_time', instance.selected_time)
+        try:
+            return instance.reschedule(instance.availability_id, selected_time)
+        except DjangoValidationError as error:
+            raise serializers.ValidationError({'selected_time': error.messages})
+
+
+class RescheduleSerializer(serializers.Serializer):
+    '''
+    RescheduleSerializer for moving an appointment to another slot.
+
+    ## Fields:
+    - availability: Target availability ID (defaults to the current one)
+    - selected_time: Target slot time (HH:MM)
+    '''
+
+    availability = serializers.IntegerField(required=False)
+    selected_time = serializers.CharField(max_length=5)
+
+
+class BulkCancelSerializer(serializers.Serializer):
+    '''
+    BulkCancelSerializer for validating a bulk cancellation request.
+
+    ## Fields:
+    - availabilities: Ids of the availabilities to clear
+    - start: First day of the appointments to cancel
+    - end: Last day of the appointments to cancel
+    - doctor: Only cancel appointments of this doctor
+    - clinic: Only cancel appointments at this clinic
+    - reason: Reason sent to the patients
+    - dry_run: Only report what would be cancelled
+    '''
+
+    availabilities = serializers.ListField(child=serializers.IntegerField(), required=False)
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    doctor = serializers.IntegerField(required=False)
+    clinic = serializers.IntegerField(required=False)
+    reason = serializers.CharField(required=False, default='', allow_blank=True)
+    dry_run = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if not (attrs.get('availabilities') or attrs.get('start') or attrs.get('end')):
+            raise serializers.ValidationError(_("Give availabilities or a date range."))
+        if attrs.get('start') and attrs.get('end') and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError(_("Start date must not be after end date."))
+        return attrs
+
+
+class HistoryQuerySerializer(serializers.Serializer):
+    '''
+    HistoryQuerySerializer for validating history paging parameters.
+
+    ## Fields:
+    - before: Time of the last row of the previous page
+    - before_id: ID of the last row of the previous page
+    - limit: Maximum number of rows in the page
+    '''
+
+    before = serializers.DateTimeField(required=False)
+    before_id = serializers.IntegerField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=settings.HISTORY_MAX_PAGE_SIZE,
+                                     default=settings.HISTORY_PAGE_SIZE)
+
+    def validate(self, attrs):
+        if 'before_id' in attrs and 'before' not in attrs:
+            raise serializers.ValidationError(_("before_id requires before."))
+        return attrs
+
+
+class AvailabilityHistorySerializer(serializers.Serializer):
+    '''
+    AvailabilityHistorySerializer for one past availability, live or archived.
+
+    ## Fields:
+    - id: Availability ID
+    - doctor: ID of the doctor
+    - clinic: ID of the clinic
+    - start_time: Start time of availability
+    - end_time: End time of availability
+    - total_slots: Number of slots
+    - booked_slots: Number of booked slots
+    - archived: Whether the availability has been archived
+    '''
+
+    id = serializers.IntegerField()
+    doctor = serializers.IntegerField(source='doctor_id')
+    clinic = serializers.IntegerField(source='clinic_id')
+    start_time = serializers.DateTimeField()
+    end_time = serializers.DateTimeField()
+    total_slots = serializers.SerializerMethodField()
+    booked_slots = serializers.SerializerMethodField()
+    archived = serializers.SerializerMethodField()
+
+    def get_archived(self, obj):
+        return isinstance(obj, ArchivedAvailability)
+
+    def get_total_slots(self, obj):
+        return len(obj.selectable_time_list or {})
+
+    def get_booked_slots(self, obj):
+        return sum(1 for is_selectable in (obj.selectable_time_list or {}).values() if not is_selectable)
+
+
+class AppointmentHistorySerializer(serializers.Serializer):
+    '''
+    AppointmentHistorySerializer for one past appointment, live or archived.
+
+    ## Fields:
+    - id: Appointment ID
+    - patient: ID of the patient
+    - availability: ID of the availability
+    - doctor: ID of the doctor
+    - clinic: ID of the clinic
+    - scheduled_at: Time of the appointment
+    - selected_time: Selected time for the appointment
+    - archived: Whether the appointment has been archived
+    '''
+
+    id = serializers.IntegerField()
+    patient = serializers.IntegerField(source='patient_id')
+    availability = serializers.IntegerField(source='availability_id')
+    doctor = serializers.IntegerField(source='availability.doctor_id')
+    clinic = serializers.IntegerField(source='availability.clinic_id')
+    scheduled_at = serializers.DateTimeField()
+    selected_time = serializers.CharField()
+    archived = serializers.SerializerMethodField()
+
+    def get_archived(self, obj):
+        return isinstance(obj, ArchivedAppointment)
+
+
+class HistoryPageSerializer(serializers.Serializer):
+    '''
+    HistoryPageSerializer documenting one page of history.
+
+    ## Fields:
+    - results: Rows of the page, newest first
+    - next: Parameters of the next page (before, before_id), or null on the last page
+    '''
+
+    results = serializers.ListField(child=serializers.DictField())
+    next = serializers.DictField(allow_null=True)
+
+
+class NearbyQuerySerializer(serializers.Serializer):
+    '''
+    NearbyQuerySerializer for validating a nearby clinic search.
+
+    ## Fields:
+    - lat: Latitude of the search centre
+    - lon: Longitude of the search centre
+    - radius: Search radius in kilometres
+    - date: Only clinics with free slots on this day
+    - specialty: Only count free slots of doctors with this specialty (with date)
+    - limit: Maximum number of clinics
+    '''
+
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+    radius = serializers.FloatField(min_value=0.1, max_value=settings.NEARBY_MAX_RADIUS_KM,
+                                    default=settings.NEARBY_RADIUS_KM)
+    date = serializers.DateField(required=False)
+    specialty = serializers.CharField(required=False, max_length=100)
+    limit = serializers.IntegerField(min_value=1, max_value=settings.NEARBY_MAX_PAGE_SIZE,
+                                     default=settings.NEARBY_PAGE_SIZE)
+
+    def validate(self, attrs):
+        if 'specialty' in attrs and 'date' not in attrs:
+            raise serializers.ValidationError(_("specialty requires date."))
+        return attrs
+
+
+class NearbyClinicSerializer(serializers.Serializer):
+    '''
+    NearbyClinicSerializer for one clinic of a nearby search.
+
+    ## Fields:
+    - id: Clinic ID
+    - name: Clinic name
+    - address: Clinic address
+    - latitude: Latitude of the clinic
+    - longitude: Longitude of the clinic
+    - distance_km: Distance from the search centre in kilometres
+    - free_slots: Free slots on the requested date (null without date)
+    '''
+
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    address = serializers.CharField()
+    latitude = serializers.FloatField()
+    longitude = serializers.FloatField()
+    distance_km = serializers.FloatField()
+    free_slots = serializers.IntegerField(allow_null=True)
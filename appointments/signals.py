@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+# Sent after the slot flags of one or more availabilities changed (booking,
+# cancellation, slot edits, deletion). Receivers get ``availabilities``, a
+# list of the affected Availability instances.
+slots_changed = Signal()
+
+# Sent after rows were written with set-based operations that bypass
+# post_save (bulk_create, bulk_update, QuerySet.update). Receivers get
+# ``instances``, the affected model instances of ``sender``.
+rows_changed = Signal()
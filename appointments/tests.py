@@ -0,0 +1,978 @@
+import asyncio
+import importlib
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from math import cos, radians, sin
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.models import Doctor
+from users.serializers import DoctorSerializer
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ParseError
+from healthcare_appointment_system import apidocs, parsers, renderers
+from healthcare_appointment_system.urls import schema_view
+from healthcare_appointment_system.warmup import warm_up
+from healthcare_appointment_system.paginators import EstimatedCountPaginator, estimated_count
+from healthcare_appointment_system.parsers import ORJSONParser
+from healthcare_appointment_system.renderers import ORJSONRenderer
+from users.models import User
+from .models import (Clinic, Availability, Appointment, AppointmentReminder, OutboxEvent,
+                     ArchivedAppointment)
+from .archive import archive
+from .outbox import BaseSink, LocMemSink, OutboxDispatcher, lag
+from .reminders import LocMemSender, ReminderScheduler
+from .bulk import cancel_appointments, close_clinic, retire_doctor
+from .scheduling import find_conflicts
+from .projections import availability_rows, doctor_rows
+from .live import hub, slot_diff, slot_stream
+from .coalescing import SingleFlight, single_flight
+from .geo import covering_cells, encode, haversine_km
+from .serializers import AppointmentSerializer, AvailabilitySerializer, ClinicSerializer
+
+
+class AppointmentFixtures:
+
+    def setUp(self):
+        doctor_user = User.objects.create_user(
+            phone_number='09121000001', password='securepassword',
+            first_name='Sara', last_name='Rad', is_doctor=True
+        )
+        self.doctor = doctor_user.doctor
+        self.doctor.medical_code = 'MC-100'
+        self.doctor.specialty = 'Cardiology'
+        self.doctor.save()
+        self.patient = User.objects.create_user(
+            phone_number='09121000002', password='securepassword',
+            first_name='Ali', last_name='Karimi', date_of_birth='1990-01-01'
+        ).patient
+        self.clinic = Clinic.objects.create(name='Central', address='Main street')
+        self.day = timezone.localdate() + timedelta(days=1)
+        self.availability = self.create_availability(self.day, time(10, 0), time(11, 0))
+
+    def create_availability(self, day, start, end, doctor=None, clinic=None):
+        return Availability.objects.create(
+            doctor=doctor or self.doctor, clinic=clinic or self.clinic,
+            start_time=timezone.make_aware(datetime.combine(day, start)),
+            end_time=timezone.make_aware(datetime.combine(day, end)),
+        )
+
+    def book(self, selected_time='10:00', availability=None, patient=None):
+        return Appointment.objects.create(
+            patient=patient or self.patient,
+            availability=availability or self.availability,
+            selected_time=selected_time,
+        )
+
+
+class FailingSink(BaseSink):
+
+    def send(self, messages):
+        raise OSError("sink is down")
+
+
+class OutboxTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        LocMemSink.messages = []
+
+    def test_appointment_changes_are_recorded(self):
+        appointment = self.book('10:00')
+        appointment.selected_time = '10:20'
+        appointment.save()
+        appointment.delete()
+        events = list(OutboxEvent.objects.order_by('pk'))
+        self.assertEqual(
+            [event.event_type for event in events],
+            ['appointment.booked', 'appointment.rescheduled', 'appointment.cancelled']
+        )
+        self.assertEqual(events[1].payload['previous']['selected_time'], '10:00')
+        self.assertEqual(events[2].payload['selected_time'], '10:20')
+
+    def test_dispatcher_delivers_in_batches(self):
+        self.book('10:00')
+        self.book('10:10', patient=User.objects.create_user(
+            phone_number='09121000003', password='securepassword',
+            first_name='Reza', last_name='Amini'
+        ).patient)
+        dispatcher = OutboxDispatcher(sinks=[LocMemSink()], batch_size=1)
+        self.assertEqual(dispatcher.dispatch_batch(), 1)
+        self.assertEqual(dispatcher.dispatch_batch(), 1)
+        self.assertEqual(dispatcher.dispatch_batch(), 0)
+        self.assertEqual([message['type'] for message in LocMemSink.messages], ['appointment.booked'] * 2)
+        self.assertFalse(OutboxEvent.objects.filter(dispatched_at__isnull=True).exists())
+        self.assertEqual(lag(), 0.0)
+
+    def test_failed_delivery_is_retried_later(self):
+        self.book('10:00')
+        dispatcher = OutboxDispatcher(sinks=[FailingSink()])
+        self.assertEqual(dispatcher.dispatch_batch(), 1)
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertIsNone(event.dispatched_at)
+        self.assertGreater(event.available_at, timezone.now())
+        self.assertEqual(event.last_error, 'sink is down')
+        self.assertEqual(dispatcher.dispatch_batch(), 0)
+        self.assertGreater(lag(), 0.0)
+
+
+@override_settings(REMINDER_WINDOWS={'24h': 24 * 60, '2h': 2 * 60})
+class ReminderTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        LocMemSender.outbox = []
+        self.appointment = self.book('10:30')
+
+    def test_scheduled_at_is_stored(self):
+        self.assertEqual(
+            self.appointment.scheduled_at,
+            timezone.make_aware(datetime.combine(self.day, time(10, 30)))
+        )
+
+    def test_each_reminder_is_sent_once(self):
+        scheduler = ReminderScheduler(sender=LocMemSender(), batch_size=1)
+        now = self.appointment.scheduled_at - timedelta(hours=20)
+        self.assertEqual(scheduler.run(now=now), {'2h': (0, 0), '24h': (1, 0)})
+        self.assertEqual(scheduler.run(now=now), {'2h': (0, 0), '24h': (0, 0)})
+        self.assertEqual(LocMemSender.outbox[0][0], '09121000002')
+        self.assertIn('10:30', LocMemSender.outbox[0][1])
+
+        now = self.appointment.scheduled_at - timedelta(hours=1)
+        self.assertEqual(scheduler.run(now=now), {'2h': (1, 0), '24h': (0, 0)})
+        self.assertEqual(AppointmentReminder.objects.filter(sent_at__isnull=False).count(), 2)
+
+    def test_late_booking_only_gets_closest_reminder(self):
+        scheduler = ReminderScheduler(sender=LocMemSender())
+        now = self.appointment.scheduled_at - timedelta(minutes=90)
+        self.assertEqual(scheduler.run(now=now), {'2h': (1, 0), '24h': (0, 0)})
+
+    @override_settings(REMINDER_RETRY_SECONDS=600, REMINDER_MAX_ATTEMPTS=2)
+    def test_failed_reminder_is_retried(self):
+        failing = ReminderScheduler(sender=LocMemSender())
+        now = self.appointment.scheduled_at - timedelta(hours=20)
+        with mock.patch.object(LocMemSender, 'send', side_effect=RuntimeError('gateway down')):
+            self.assertEqual(failing.run(now=now), {'2h': (0, 0), '24h': (0, 1)})
+            # still claimed by the failed attempt
+            self.assertEqual(failing.run(now=now + timedelta(minutes=5)), {'2h': (0, 0), '24h': (0, 0)})
+            self.assertEqual(failing.run(now=now + timedelta(minutes=11)), {'2h': (0, 0), '24h': (0, 1)})
+        # out of attempts
+        self.assertEqual(failing.run(now=now + timedelta(minutes=30)), {'2h': (0, 0), '24h': (0, 0)})
+        reminder = self.appointment.reminders.get(kind='24h')
+        self.assertEqual((reminder.attempts, reminder.sent_at, reminder.error), (2, None, 'gateway down'))
+
+    @override_settings(REMINDER_RETRY_SECONDS=600)
+    def test_retry_that_succeeds_clears_the_error(self):
+        scheduler = ReminderScheduler(sender=LocMemSender())
+        now = self.appointment.scheduled_at - timedelta(hours=20)
+        with mock.patch.object(LocMemSender, 'send', side_effect=RuntimeError('gateway down')):
+            scheduler.run(now=now)
+        self.assertEqual(scheduler.run(now=now + timedelta(minutes=11)), {'2h': (0, 0), '24h': (1, 0)})
+        reminder = self.appointment.reminders.get(kind='24h')
+        self.assertEqual(reminder.error, '')
+        self.assertIsNotNone(reminder.sent_at)
+
+    def test_reschedule_resets_reminders(self):
+        ReminderScheduler(sender=LocMemSender()).run(now=self.appointment.scheduled_at - timedelta(hours=1))
+        self.appointment.selected_time = '10:40'
+        self.appointment.save()
+        self.assertFalse(self.appointment.reminders.exists())
+
+
+class BulkCancellationTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.other_patient = User.objects.create_user(
+            phone_number='09121000004', password='securepassword',
+            first_name='Mina', last_name='Jafari'
+        ).patient
+        self.book('10:00')
+        self.book('10:10', patient=self.other_patient)
+
+    def test_dry_run_changes_nothing(self):
+        report = cancel_appointments(availability_ids=[self.availability.pk], dry_run=True)
+        self.assertEqual(report, {'appointments': 2, 'availabilities': 1, 'dry_run': True})
+        self.assertEqual(Appointment.objects.count(), 2)
+
+    def test_cancel_releases_slots_in_batches(self):
+        progress = []
+        report = cancel_appointments(
+            start=self.day, end=self.day, batch_size=1,
+            progress=lambda done, total: progress.append((done, total))
+        )
+        self.assertEqual(report['appointments'], 2)
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+        self.assertFalse(Appointment.objects.exists())
+        self.availability.refresh_from_db()
+        self.assertTrue(all(self.availability.selectable_time_list.values()))
+        self.assertEqual(OutboxEvent.objects.filter(event_type='appointment.cancelled').count(), 2)
+
+    def test_retire_doctor(self):
+        retire_doctor(self.doctor, reason='sick')
+        self.assertFalse(Availability.objects.exists())
+        self.doctor.user.refresh_from_db()
+        self.assertFalse(self.doctor.user.is_active)
+        self.assertEqual(
+            set(OutboxEvent.objects.filter(event_type='appointment.cancelled').values_list('payload__reason', flat=True)),
+            {'sick'}
+        )
+
+    def test_close_clinic_endpoint(self):
+        admin = User.objects.create_superuser(
+            phone_number='09121000005', password='securepassword',
+            first_name='Admin', last_name='User'
+        )
+        self.client.force_login(admin)
+        response = self.client.delete(f'/clinics/{self.clinic.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Clinic.objects.exists())
+        self.assertEqual(OutboxEvent.objects.filter(event_type='appointment.cancelled').count(), 2)
+
+    def test_bulk_cancel_endpoint(self):
+        admin = User.objects.create_superuser(
+            phone_number='09121000005', password='securepassword',
+            first_name='Admin', last_name='User'
+        )
+        self.client.force_login(admin)
+        response = self.client.post(
+            '/appointments/bulk-cancel/', {'availabilities': [self.availability.pk]}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['appointments'], 2)
+        self.assertFalse(Appointment.objects.exists())
+
+
+class RescheduleTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.appointment = self.book('10:00')
+        self.other = self.create_availability(self.day, time(14, 0), time(18, 0))
+        OutboxEvent.objects.all().delete()
+
+    def slots(self, availability):
+        availability.refresh_from_db()
+        return availability.selectable_time_list
+
+    def test_reschedule_within_availability(self):
+        self.appointment.reschedule(self.availability.pk, '10:30')
+        slots = self.slots(self.availability)
+        self.assertTrue(slots['10:00'])
+        self.assertFalse(slots['10:30'])
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.scheduled_at.strftime('%H:%M'), '10:30')
+
+    def test_reschedule_to_other_availability_emits_one_event(self):
+        self.appointment.reschedule(self.other.pk, '15:00')
+        self.assertTrue(self.slots(self.availability)['10:00'])
+        self.assertFalse(self.slots(self.other)['15:00'])
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.event_type, 'appointment.rescheduled')
+        self.assertEqual(event.payload['previous'], {'availability': self.availability.pk, 'selected_time': '10:00'})
+
+    def test_taken_slot_is_rejected(self):
+        self.book('15:00', availability=self.other, patient=User.objects.create_user(
+            phone_number='09121000006', password='securepassword',
+            first_name='Neda', last_name='Azizi'
+        ).patient)
+        with self.assertRaises(ValidationError):
+            self.appointment.reschedule(self.other.pk, '15:00')
+        self.assertFalse(self.slots(self.availability)['10:00'])
+
+    def test_query_count_does_not_depend_on_slots(self):
+        # lock and re-read the appointment, lock the availabilities, one bulk
+        # update, the appointment update, reminders, the event and the rollup
+        with self.assertNumQueries(13):
+            self.appointment.reschedule(self.availability.pk, '10:40')
+        with self.assertNumQueries(13):
+            self.appointment.reschedule(self.other.pk, '17:50')
+        with self.assertNumQueries(13):
+            self.appointment.reschedule(self.availability.pk, '10:00')
+
+    def test_stale_copy_does_not_release_the_slot_twice(self):
+        stale = Appointment.objects.get(pk=self.appointment.pk)
+        self.appointment.reschedule(self.other.pk, '15:00')
+        newcomer = User.objects.create_user(
+            phone_number='09121000008', password='securepassword',
+            first_name='Mina', last_name='Sadeghi'
+        ).patient
+        self.book('10:00', availability=Availability.objects.get(pk=self.availability.pk), patient=newcomer)
+        stale.reschedule(self.other.pk, '16:00')
+        self.assertEqual(stale.selected_time, '16:00')
+        self.assertFalse(self.slots(self.availability)['10:00'])
+        slots = self.slots(self.other)
+        self.assertTrue(slots['15:00'])
+        self.assertFalse(slots['16:00'])
+        self.assertTrue(newcomer.appointment_set.filter(availability=self.availability).exists())
+
+    def test_reschedule_endpoint_checks_owner(self):
+        stranger = User.objects.create_user(
+            phone_number='09121000007', password='securepassword',
+            first_name='Omid', last_name='Nouri'
+        )
+        url = f'/appointments/{self.appointment.pk}/reschedule/'
+        body = {'availability': self.other.pk, 'selected_time': '14:00'}
+        self.client.force_login(stranger)
+        self.assertEqual(self.client.post(url, body, content_type='application/json').status_code, 403)
+        self.client.force_login(self.patient.user)
+        response = self.client.post(url, body, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['selected_time'], '14:00')
+
+
+class OverlapTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def test_overlapping_availability_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            self.create_availability(self.day, time(10, 30), time(11, 30))
+        other_clinic = Clinic.objects.create(name='North', address='Hill road')
+        with self.assertRaises(ValidationError):
+            self.create_availability(self.day, time(9, 0), time(10, 30), clinic=other_clinic)
+
+    def test_back_to_back_availabilities_are_allowed(self):
+        self.create_availability(self.day, time(11, 0), time(12, 0))
+        self.create_availability(self.day, time(9, 0), time(10, 0))
+        self.assertEqual(Availability.objects.count(), 3)
+
+    def test_booking_does_not_recheck_overlaps(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.availability.save()
+        self.assertFalse(any('"end_time" >' in query['sql'] for query in queries.captured_queries))
+
+    def test_find_conflicts_uses_one_query(self):
+        windows = [
+            (self.doctor.pk, self.at(9), self.at(10)),
+            (self.doctor.pk, self.at(10, 30), self.at(12)),
+            (self.doctor.pk, self.at(11, 30), self.at(13)),
+        ]
+        with self.assertNumQueries(1):
+            conflicts = find_conflicts(windows)
+        self.assertEqual(conflicts, [
+            {'index': 1, 'availability': self.availability.pk},
+            {'index': 2, 'other_index': 1},
+        ])
+
+    def test_create_endpoint_reports_overlap(self):
+        self.client.force_login(self.doctor.user)
+        response = self.client.post('/availabilities/', {
+            'clinic': self.clinic.pk, 'start_time': self.at(10, 30).isoformat(), 'end_time': self.at(12).isoformat(),
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/availabilities/', {
+            'clinic': self.clinic.pk, 'start_time': self.at(12).isoformat(), 'end_time': self.at(13).isoformat(),
+        }, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['selectable_time_list']), 6)
+
+    def put_window(self, availability, start, end):
+        return self.client.put(f'/availabilities/{availability.pk}/', {
+            'clinic': self.clinic.pk, 'start_time': start.isoformat(), 'end_time': end.isoformat(),
+        }, content_type='application/json')
+
+    def test_update_endpoint_rebuilds_slots_of_own_availability(self):
+        other = User.objects.create_user(
+            phone_number='09121000006', password='securepassword',
+            first_name='Reza', last_name='Amini', is_doctor=True,
+        )
+        self.client.force_login(other)
+        self.assertEqual(self.put_window(self.availability, self.at(14), self.at(16)).status_code, 404)
+
+        self.client.force_login(self.doctor.user)
+        response = self.put_window(self.availability, self.at(14), self.at(15))
+        self.assertEqual(response.status_code, 200, response.content)
+        self.availability.refresh_from_db()
+        self.assertEqual(list(self.availability.selectable_time_list)[:2], ['14:00', '14:10'])
+        self.assertNotIn('10:00', self.availability.selectable_time_list)
+
+        past = timezone.now() - timedelta(days=1)
+        self.assertEqual(self.put_window(self.availability, past, past + timedelta(hours=1)).status_code, 400)
+
+    def test_update_endpoint_keeps_booked_window(self):
+        self.book('10:00')
+        self.client.force_login(self.doctor.user)
+        response = self.put_window(self.availability, self.at(14), self.at(15))
+        self.assertEqual(response.status_code, 400)
+        self.availability.refresh_from_db()
+        self.assertEqual(self.availability.start_time, self.at(10))
+
+    def test_bulk_endpoint(self):
+        self.client.force_login(self.doctor.user)
+        windows = [
+            {'clinic': self.clinic.pk, 'start_time': self.at(hour).isoformat(), 'end_time': self.at(hour + 1).isoformat()}
+            for hour in (12, 13, 10)
+        ]
+        response = self.client.post('/availabilities/bulk/', windows, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'conflicts': [{'index': 2, 'availability': self.availability.pk}]})
+        response = self.client.post('/availabilities/bulk/', windows[:2], content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Availability.objects.count(), 3)
+
+    def test_bulk_endpoint_reports_concurrent_overlap(self):
+        # the row was inserted after the check: PostgreSQL's exclusion constraint rejects the batch
+        self.client.force_login(self.doctor.user)
+        windows = [{'clinic': self.clinic.pk, 'start_time': self.at(10).isoformat(), 'end_time': self.at(11).isoformat()}]
+        checks = []
+
+        def check_after_insert(proposed):
+            checks.append(proposed)
+            return [] if len(checks) == 1 else find_conflicts(proposed)
+
+        with mock.patch('appointments.scheduling.find_conflicts', side_effect=check_after_insert), \
+                mock.patch.object(Availability.objects, 'bulk_create', side_effect=IntegrityError):
+            response = self.client.post('/availabilities/bulk/', windows, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'conflicts': [{'index': 0, 'availability': self.availability.pk}]})
+
+    def test_migration_reports_existing_overlaps(self):
+        migration = importlib.import_module('appointments.migrations.0004_availability_overlap')
+        self.assertEqual(migration.overlapping_rows(Availability.objects.all()), [])
+        overlapping = Availability.objects.bulk_create([Availability(
+            doctor=self.doctor, clinic=self.clinic, start_time=self.at(10, 30), end_time=self.at(11, 30),
+        )])[0]
+        self.assertEqual(
+            migration.overlapping_rows(Availability.objects.all()),
+            [(self.availability.pk, overlapping.pk, self.doctor.pk)],
+        )
+
+
+class ProjectionParityTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.doctor.photo_thumbnails = {'hash': 'abc', 'variants': {'small': {'webp': 'thumbnails/abc_small.webp'}}}
+        self.doctor.save()
+        self.book('10:20')
+        other = User.objects.create_user(
+            phone_number='09121000008', password='securepassword',
+            first_name='Bahar', last_name='Moradi', is_doctor=True
+        ).doctor
+        other.medical_code = 'MC-200'
+        other.save()
+        Doctor.objects.filter(pk=other.pk).update(photo='')
+        self.create_availability(self.day, time(16, 0), time(17, 30), doctor=other)
+
+    def render(self, data):
+        return JSONRenderer().render(data)
+
+    def test_availability_rows_match_serializer(self):
+        queryset = Availability.objects.order_by('pk')
+        request = Request(APIRequestFactory().get('/availabilities/', {'photo_format': 'webp'}))
+        for context in ({}, {'request': request}):
+            self.assertEqual(
+                self.render(availability_rows(queryset, context.get('request'))),
+                self.render(AvailabilitySerializer(queryset, many=True, context=context).data)
+            )
+
+    def test_doctor_rows_match_serializer(self):
+        queryset = Doctor.objects.order_by('pk')
+        request = Request(APIRequestFactory().get('/doctors/'))
+        for context in ({}, {'request': request}):
+            self.assertEqual(
+                self.render(doctor_rows(queryset, context.get('request'))),
+                self.render(DoctorSerializer(queryset, many=True, context=context).data)
+            )
+
+    def test_list_endpoint_uses_one_query(self):
+        self.client.force_login(self.patient.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/availabilities/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len([query for query in queries if 'appointments_availability' in query['sql']]), 1)
+
+
+class ORJSONTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.appointment = Appointment.objects.create(
+            patient=self.patient, availability=self.availability, selected_time='10:00'
+        )
+        self.appointment.refresh_from_db()
+        self.data = {
+            'appointment': AppointmentSerializer(self.appointment).data,
+            'user': self.patient.user.id,
+            'created': timezone.now(),
+            'label': _('Cardiology'),
+            'amount': Decimal('12.50'),
+            'text': 'line\u2028separator',
+        }
+
+    def test_output_matches_json_renderer(self):
+        self.assertEqual(ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+
+    def test_indent_and_missing_orjson_use_stdlib(self):
+        self.assertEqual(
+            ORJSONRenderer().render(self.data, 'application/json; indent=2'),
+            JSONRenderer().render(self.data, 'application/json; indent=2')
+        )
+        with mock.patch.object(renderers, 'orjson', None), mock.patch.object(parsers, 'orjson', None):
+            self.assertEqual(ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+            self.assertEqual(ORJSONParser().parse(io.BytesIO(b'{"a": [1, 2]}')), {'a': [1, 2]})
+
+    def test_parser(self):
+        self.assertEqual(ORJSONParser().parse(io.BytesIO('{"name": "سارا"}'.encode())), {'name': 'سارا'})
+        with self.assertRaises(ParseError):
+            ORJSONParser().parse(io.BytesIO(b'{"a": NaN}'))
+
+    def test_api_round_trip(self):
+        self.client.force_login(self.patient.user)
+        response = self.client.patch(
+            f'/appointments/{self.appointment.pk}/', {'selected_time': '10:20'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['selected_time'], '10:20')
+
+
+class SparseFieldsetTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.appointment = self.book('10:00')
+        self.client.force_login(self.patient.user)
+
+    def test_without_parameters_output_is_unchanged(self):
+        appointment = Appointment.objects.get(pk=self.appointment.pk)
+        response = self.client.get(f'/appointments/{appointment.pk}/')
+        self.assertEqual(response.json(), json.loads(JSONRenderer().render(AppointmentSerializer(appointment).data)))
+
+    def test_nested_objects_collapse_to_ids(self):
+        response = self.client.get('/appointments/', {'fields': 'id,patient,availability'})
+        self.assertEqual(response.json(), [
+            {'id': self.appointment.pk, 'patient': self.patient.pk, 'availability': self.availability.pk}
+        ])
+
+    def test_dotted_fields_and_expand(self):
+        response = self.client.get('/appointments/', {
+            'fields': 'selected_time,availability.start_time,availability.doctor',
+            'expand': 'availability.doctor',
+        })
+        doctor = response.json()[0]['availability']['doctor']
+        self.assertEqual(set(response.json()[0]), {'selected_time', 'availability'})
+        self.assertEqual(set(response.json()[0]['availability']), {'start_time', 'doctor'})
+        self.assertEqual(doctor['user'], str(self.doctor.user.pk))
+        self.assertEqual(doctor['medical_code'], 'MC-100')
+
+    def test_unrequested_columns_are_not_loaded(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/appointments/', {
+                'fields': 'selected_time,availability.start_time,patient.user.first_name',
+            })
+        self.assertEqual(response.json(), [{
+            'selected_time': '10:00',
+            'availability': {'start_time': response.json()[0]['availability']['start_time']},
+            'patient': {'user': {'first_name': 'Ali'}},
+        }])
+        [query] = [query['sql'] for query in queries if 'appointments_appointment' in query['sql']]
+        self.assertIn('INNER JOIN "appointments_availability"', query)
+        self.assertNotIn('selectable_time_list', query)
+        self.assertNotIn('"users_user"."password"', query)
+
+    def test_users_serializers(self):
+        response = self.client.get('/doctors/', {'fields': 'medical_code,user'})
+        self.assertEqual(response.json(), [{'medical_code': 'MC-100', 'user': str(self.doctor.user.pk)}])
+
+
+class LiveSlotTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def book_committed(self, selected_time):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.book(selected_time)
+
+    def test_slot_diff(self):
+        self.assertEqual(
+            slot_diff({'10:00': True, '10:10': True}, {'10:00': False, '10:10': True, '10:20': True}),
+            {'10:00': False, '10:20': True}
+        )
+        self.assertEqual(slot_diff({'10:00': True}, {}), {'10:00': None})
+
+    def test_requires_authentication(self):
+        response = self.client.get('/availabilities/live/', {'ids': self.availability.pk})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_stream_pushes_slot_diffs(self):
+        await self.async_client.aforce_login(self.patient.user)
+        response = await self.async_client.get('/availabilities/live/', {'ids': f'{self.availability.pk},999999'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = aiter(response.streaming_content)
+        snapshot = (await anext(events)).decode()
+        self.assertTrue(snapshot.startswith('event: snapshot\n'))
+        self.assertEqual(json.loads(snapshot.split('data: ')[1])[0]['slots']['10:10'], True)
+
+        appointment = await sync_to_async(self.book_committed)('10:10')
+        event = (await asyncio.wait_for(anext(events), 5)).decode()
+        self.assertEqual(event, 'event: slots\ndata: %s\n\n' % json.dumps(
+            {'id': self.availability.pk, 'changed': {'10:10': False}}
+        ))
+
+        def cancel():
+            with self.captureOnCommitCallbacks(execute=True):
+                appointment.delete()
+        await sync_to_async(cancel)()
+        event = (await asyncio.wait_for(anext(events), 5)).decode()
+        self.assertIn('"changed": {"10:10": true}', event)
+
+    async def test_stream_unsubscribes_when_closed(self):
+        before = hub.subscriber_count()
+        stream = slot_stream([self.availability.pk])
+        await anext(stream)
+        self.assertEqual(hub.subscriber_count(), before + 1)
+        await stream.aclose()
+        self.assertEqual(hub.subscriber_count(), before)
+
+
+class SingleFlightTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def test_concurrent_calls_share_one_computation(self):
+        flights, calls, release = SingleFlight(), [], threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return 'rows'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flights.do('key', compute, 0)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while flights.requests < 5:
+            pass
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('rows', False)] + [('rows', True)] * 4)
+        self.assertEqual(flights.ratio(), 0.8)
+
+    def test_result_reused_within_window_until_a_write(self):
+        flights = SingleFlight()
+        self.assertEqual(flights.do('key', lambda: 1, 60), (1, False))
+        self.assertEqual(flights.do('key', lambda: 2, 60), (1, True))
+        flights.invalidate()
+        self.assertEqual(flights.do('key', lambda: 3, 60), (3, False))
+        self.assertEqual(flights.do('other', lambda: 4, 0), (4, False))
+        self.assertEqual(flights.do('other', lambda: 5, 0), (5, False))
+
+    @override_settings(SINGLE_FLIGHT_WINDOW=60)
+    def test_endpoint_shares_rendered_response(self):
+        single_flight.invalidate()
+        self.client.force_login(self.patient.user)
+        url = f'/availabilities/{self.availability.pk}/'
+        first = self.client.get(url)
+        second = self.client.get(url)
+        self.assertEqual(first['X-Single-Flight'], 'leader')
+        self.assertEqual(second['X-Single-Flight'], 'shared')
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+
+        self.book('10:10')
+        third = self.client.get(url)
+        self.assertEqual(third['X-Single-Flight'], 'leader')
+        self.assertFalse(third.json()['selectable_time_list']['10:10'])
+
+    @override_settings(SINGLE_FLIGHT_WINDOW=60, ALLOWED_HOSTS=['testserver', 'api.example.com'])
+    def test_language_and_host_are_not_shared(self):
+        single_flight.invalidate()
+        self.client.force_login(self.patient.user)
+        url = f'/availabilities/{self.availability.pk}/'
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT_LANGUAGE='en')['X-Single-Flight'], 'leader')
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT_LANGUAGE='fa')['X-Single-Flight'], 'leader')
+        self.assertEqual(
+            self.client.get(url, HTTP_ACCEPT_LANGUAGE='en', HTTP_HOST='api.example.com')['X-Single-Flight'], 'leader'
+        )
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT_LANGUAGE='fa')['X-Single-Flight'], 'shared')
+
+
+class ApiDocsTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        schema_view.clear()
+        self.addCleanup(schema_view.clear)
+
+    def test_deferred_openapi_values(self):
+        parameter = apidocs.openapi.Parameter('day', apidocs.openapi.IN_QUERY, type=apidocs.openapi.TYPE_STRING)
+        resolved = apidocs.resolve({'manual_parameters': [parameter]})['manual_parameters'][0]
+        self.assertEqual((resolved.name, resolved.in_, resolved.type), ('day', 'query', 'string'))
+
+    def test_schema_keeps_recorded_overrides(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(API_SCHEMA_DIR=directory):
+            with self.assertLogs('healthcare_appointment_system.apidocs', level='WARNING'):
+                response = self.client.get('/swagger/', {'format': 'openapi'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(apidocs.is_loaded())
+        schema = json.loads(response.content)
+        operation = schema['paths']['/appointments/']['get']
+        self.assertIn('fields', [parameter['name'] for parameter in operation['parameters']])
+        self.assertEqual(operation['description'], 'Retrieve a list of appointments.')
+        self.assertIn('error', schema['paths']['/clinics/{id}/']['get']['responses']['404']['schema']['properties'])
+
+    def test_schema_document_is_cached_with_etag(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(API_SCHEMA_DIR=directory):
+            with self.assertLogs('healthcare_appointment_system.apidocs', level='WARNING'):
+                response = self.client.get('/swagger.json', HTTP_ACCEPT_LANGUAGE='en')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('max-age=300', response['Cache-Control'])
+            etag = response['ETag']
+
+            not_modified = self.client.get('/swagger.json', HTTP_ACCEPT_LANGUAGE='en', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(not_modified.status_code, 304)
+            spec = self.client.get('/swagger/', {'format': 'openapi'}, HTTP_ACCEPT_LANGUAGE='en')
+            self.assertEqual((spec['ETag'], spec.content), (etag, response.content))
+
+    def test_build_schema_writes_every_language(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(API_SCHEMA_DIR=directory):
+            call_command('build_schema', stdout=io.StringIO())
+            self.assertEqual(sorted(os.listdir(directory)), ['openapi.en.json', 'openapi.fa.json'])
+            with open(os.path.join(directory, 'openapi.fa.json'), 'rb') as file:
+                built = file.read()
+            schema = json.loads(built)
+            self.assertIn('fields', [parameter['name'] for parameter in schema['paths']['/appointments/']['get']['parameters']])
+
+            with self.assertNoLogs('healthcare_appointment_system.apidocs', level='WARNING'):
+                response = self.client.get('/swagger.json', HTTP_ACCEPT_LANGUAGE='fa-IR')
+            self.assertEqual(response.content, built)
+            english = self.client.get('/swagger.json', HTTP_ACCEPT_LANGUAGE='en')
+            self.assertNotEqual(english['ETag'], response['ETag'])
+
+
+class WarmUpTests(TestCase):
+    databases = '__all__'
+
+    def test_warm_up_runs_every_step(self):
+        with self.assertNoLogs('healthcare_appointment_system.warmup', level='ERROR'):
+            timings = warm_up()
+        self.assertEqual(list(timings), ['urlconf', 'serializers', 'templates', 'translations'])
+
+
+class AdminTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        self.admin = User.objects.create_superuser(
+            phone_number='09121000009', password='securepassword', first_name='Admin', last_name='Staff',
+        )
+        self.client.force_login(self.admin)
+
+    def add_bookings(self, count):
+        for _index in range(count):
+            number = Availability.objects.count()
+            patient = User.objects.create_user(
+                phone_number=f'0912200{number:04d}', password='securepassword',
+                first_name='Patient', last_name=str(number),
+            ).patient
+            availability = self.create_availability(self.day + timedelta(days=number), time(9, 0), time(10, 0))
+            self.book('09:00', availability=availability, patient=patient)
+
+    def count_queries(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_change_lists_run_a_bounded_number_of_queries(self):
+        self.add_bookings(2)
+        few = {url: self.count_queries(url) for url in (
+            '/admin/appointments/appointment/', '/admin/appointments/availability/',
+            '/admin/users/doctor/', '/admin/users/patient/',
+        )}
+        self.add_bookings(8)
+        for url, expected in few.items():
+            self.assertEqual(self.count_queries(url), expected, url)
+
+    def test_change_forms_and_autocomplete_run_a_bounded_number_of_queries(self):
+        appointment = self.book()
+        self.add_bookings(2)
+        self.client.get(f'/admin/appointments/appointment/{appointment.pk}/change/')
+        form = self.count_queries(f'/admin/appointments/appointment/{appointment.pk}/change/')
+        autocomplete = self.count_queries(
+            '/admin/autocomplete/', app_label='appointments', model_name='appointment', field_name='availability',
+        )
+        self.add_bookings(8)
+        self.assertEqual(self.count_queries(f'/admin/appointments/appointment/{appointment.pk}/change/'), form)
+        self.assertEqual(self.count_queries(
+            '/admin/autocomplete/', app_label='appointments', model_name='appointment', field_name='availability',
+        ), autocomplete)
+
+    def test_paginator_uses_estimate_for_large_unfiltered_tables(self):
+        self.add_bookings(2)
+        queryset = Appointment.objects.order_by('pk')
+        with mock.patch('healthcare_appointment_system.paginators.estimated_count', return_value=250000):
+            self.assertEqual(EstimatedCountPaginator(queryset, 50).count, 250000)
+        with mock.patch('healthcare_appointment_system.paginators.estimated_count', return_value=10):
+            self.assertEqual(EstimatedCountPaginator(queryset, 50).count, 2)
+        # no estimate on SQLite, nor for filtered querysets
+        self.assertIsNone(estimated_count(queryset))
+        self.assertEqual(EstimatedCountPaginator(queryset.filter(selected_time='09:00'), 50).count, 2)
+
+
+class ArchiveTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        today = timezone.localdate()
+        self.old = self.create_availability(today - timedelta(days=200), time(10, 0), time(11, 0))
+        self.old_appointment = self.book('10:00', availability=self.old)
+        AppointmentReminder.objects.create(appointment=self.old_appointment, kind='24h')
+        self.recent = self.create_availability(today - timedelta(days=10), time(10, 0), time(11, 0))
+        self.recent_appointment = self.book('10:30', availability=self.recent)
+        self.upcoming_appointment = self.book('10:00')
+
+    def test_archive_moves_old_rows_without_cancelling(self):
+        events = OutboxEvent.objects.count()
+        self.assertEqual(archive(90, dry_run=True), {'availabilities': 1, 'appointments': 1, 'dry_run': True})
+        self.assertTrue(Availability.objects.filter(pk=self.old.pk).exists())
+
+        out = io.StringIO()
+        call_command('archive', '--older-than', '90', stdout=out)
+        self.assertIn("Archived 1 availabilities and 1 appointments.", out.getvalue())
+
+        self.assertFalse(Availability.objects.filter(pk=self.old.pk).exists())
+        self.assertFalse(Appointment.objects.filter(pk=self.old_appointment.pk).exists())
+        self.assertFalse(AppointmentReminder.objects.exists())
+        archived = ArchivedAppointment.objects.select_related('availability').get(pk=self.old_appointment.pk)
+        self.assertEqual(archived.availability.pk, self.old.pk)
+        self.assertEqual(archived.availability.selectable_time_list['10:00'], False)
+        self.assertEqual(archived.scheduled_at, self.old_appointment.scheduled_at)
+        self.assertEqual(OutboxEvent.objects.count(), events)
+        self.assertEqual(
+            set(Availability.objects.values_list('pk', flat=True)), {self.availability.pk, self.recent.pk}
+        )
+        self.assertEqual(archive(90)['availabilities'], 0)
+
+    def test_history_reads_hot_and_archived_rows(self):
+        archive(90)
+        self.client.force_login(self.patient.user)
+        response = self.client.get('/appointments/history/')
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual(
+            [(row['id'], row['archived']) for row in results],
+            [(self.recent_appointment.pk, False), (self.old_appointment.pk, True)],
+        )
+        self.assertEqual(results[1]['doctor'], self.doctor.pk)
+        self.assertIsNone(response.json()['next'])
+
+        first = self.client.get('/appointments/history/', {'limit': 1}).json()
+        self.assertEqual([row['id'] for row in first['results']], [self.recent_appointment.pk])
+        second = self.client.get('/appointments/history/', dict(first['next'], limit=1)).json()
+        self.assertEqual([row['id'] for row in second['results']], [self.old_appointment.pk])
+        self.assertIsNone(second['next'])
+
+        self.assertEqual(self.client.get('/availabilities/history/').status_code, 403)
+        self.client.force_login(self.doctor.user)
+        rows = self.client.get('/availabilities/history/').json()['results']
+        self.assertEqual(
+            [(row['id'], row['archived'], row['booked_slots']) for row in rows],
+            [(self.recent.pk, False, 1), (self.old.pk, True, 1)],
+        )
+        self.assertEqual(len(self.client.get('/appointments/history/').json()['results']), 2)
+
+    def test_history_rejects_bad_cursor(self):
+        self.client.force_login(self.patient.user)
+        response = self.client.get('/appointments/history/', {'before_id': 3})
+        self.assertEqual(response.status_code, 400)
+
+
+class NearbyClinicTests(AppointmentFixtures, TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        super().setUp()
+        # around Vanak square, Tehran
+        self.clinic.latitude, self.clinic.longitude = 35.7575, 51.4100
+        self.clinic.save(update_fields=['latitude', 'longitude'])
+        self.close = Clinic.objects.create(name='Close', address='Valiasr', latitude=35.7600, longitude=51.4110)
+        self.further = Clinic.objects.create(name='Further', address='Tajrish', latitude=35.8040, longitude=51.4330)
+        self.elsewhere = Clinic.objects.create(name='Isfahan', address='Naqsh-e Jahan', latitude=32.6575, longitude=51.6776)
+        Clinic.objects.create(name='Unplaced', address='Nowhere')
+
+    def test_geohash(self):
+        self.assertEqual(encode(42.6, -5.6, 5), 'ezs42')
+        self.assertEqual(self.close.geohash, encode(35.7600, 51.4110))
+        self.clinic.latitude = None
+        self.clinic.longitude = None
+        self.clinic.save(update_fields=['latitude', 'longitude'])
+        self.clinic.refresh_from_db()
+        self.assertEqual(self.clinic.geohash, '')
+
+    def test_covering_cells_contain_the_circle(self):
+        cells = covering_cells(35.7575, 51.41, 5)
+        self.assertEqual(len(cells), 9)
+        self.assertEqual(len({len(cell) for cell in cells}), 1)
+        for bearing in range(0, 360, 15):
+            latitude = 35.7575 + 4.99 / 111.32 * cos(radians(bearing))
+            longitude = 51.41 + 4.99 / (111.32 * cos(radians(35.7575))) * sin(radians(bearing))
+            self.assertTrue(encode(latitude, longitude).startswith(tuple(cells)))
+        self.assertIsNone(covering_cells(35.7575, 51.41, 10000))
+
+    def test_nearest_first_within_the_radius(self):
+        self.client.force_login(self.patient.user)
+        response = self.client.get('/clinics/nearby/', {'lat': 35.7575, 'lon': 51.41, 'radius': 10})
+        self.assertEqual(response.status_code, 200)
+        rows = response.json()
+        self.assertEqual([row['id'] for row in rows], [self.clinic.pk, self.close.pk, self.further.pk])
+        self.assertEqual(rows[0]['distance_km'], 0)
+        self.assertAlmostEqual(rows[2]['distance_km'], haversine_km(35.7575, 51.41, 35.804, 51.433), places=3)
+        self.assertIsNone(rows[0]['free_slots'])
+
+        rows = self.client.get('/clinics/nearby/', {'lat': 35.7575, 'lon': 51.41, 'limit': 1}).json()
+        self.assertEqual([row['id'] for row in rows], [self.clinic.pk])
+
+    def test_only_clinics_with_free_slots_on_a_day(self):
+        self.create_availability(self.day, time(9, 0), time(10, 0), clinic=self.further)
+        self.book('10:00')
+        self.client.force_login(self.patient.user)
+        rows = self.client.get('/clinics/nearby/', {
+            'lat': 35.7575, 'lon': 51.41, 'radius': 10, 'date': self.day.isoformat(),
+        }).json()
+        self.assertEqual([(row['id'], row['free_slots']) for row in rows],
+                         [(self.clinic.pk, 5), (self.further.pk, 6)])
+        rows = self.client.get('/clinics/nearby/', {
+            'lat': 35.7575, 'lon': 51.41, 'radius': 10, 'date': self.day.isoformat(), 'specialty': 'Dermatology',
+        }).json()
+        self.assertEqual(rows, [])
+
+    def test_rejects_bad_parameters(self):
+        self.client.force_login(self.patient.user)
+        for params in ({'lat': 35.7}, {'lat': 91, 'lon': 51}, {'lat': 35.7, 'lon': 51.4, 'radius': 500},
+                       {'lat': 35.7, 'lon': 51.4, 'specialty': 'Cardiology'}):
+            self.assertEqual(self.client.get('/clinics/nearby/', params).status_code, 400, params)
+
+    def test_coordinates_come_in_pairs(self):
+        serializer = ClinicSerializer(data={'name': 'Half', 'address': 'Somewhere', 'latitude': 35.7})
+        self.assertFalse(serializer.is_valid())
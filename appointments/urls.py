@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ClinicViewSet, AvailabilityViewSet, AppointmentViewSet
+from .views import ClinicViewSet, AvailabilityViewSet, AppointmentViewSet, live_slots
 
 router = DefaultRouter()
 router.register(r'clinics', ClinicViewSet, basename='clinics')
@@ -8,5 +8,7 @@ router.register(r'availabilities', AvailabilityViewSet, basename='availabilities
 router.register(r'appointments', AppointmentViewSet, basename='appointments')
 
 urlpatterns = [
+    # before the router, whose detail route would take "live" for a pk
+    path('availabilities/live/', live_slots, name='availabilities-live'),
     path('', include(router.urls)),
 ]
@@ -1,18 +1,60 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import JsonResponse, StreamingHttpResponse
+from django.db.models import Q
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.http import require_safe
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
-from rest_framework import status,views
+from rest_framework import serializers, status, views
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from users.permissions import IsOwner, IsDoctor
 from django.utils.translation import gettext_lazy as _
-from .models import Clinic, Availability, Appointment
+from .models import Clinic, Availability, Appointment, ArchivedAvailability, ArchivedAppointment
 from .serializers import (ClinicSerializer,
                           AvailabilitySerializer,
+                          AvailabilityWriteSerializer,
+                          AvailabilityWindowSerializer,
                           SelectableTimeListSerializer,
-                          AppointmentSerializer
+                          AppointmentSerializer,
+                          BulkCancelSerializer,
+                          RescheduleSerializer,
+                          HistoryQuerySerializer,
+                          HistoryPageSerializer,
+                          AvailabilityHistorySerializer,
+                          AppointmentHistorySerializer,
+                          NearbyQuerySerializer,
+                          NearbyClinicSerializer
                           )
-from drf_yasg.utils import swagger_auto_schema
-from drf_yasg import openapi
+from .archive import history
+from .geo import free_slots, nearby_clinics
+from .bulk import cancel_appointments, close_clinic
+from .scheduling import create_schedule
+from .projections import availability_rows
+from .live import get_broker, slot_stream
+from .coalescing import coalesce
+from healthcare_appointment_system.fieldsets import SPARSE_PARAMETERS, sparse_fieldset
+from healthcare_appointment_system.apidocs import openapi, swagger_auto_schema
+
+
+def history_response(request, querysets, field, serializer_class):
+    '''One page of past rows from the hot and the archive tables, newest first.'''
+    query = HistoryQuerySerializer(data=request.query_params)
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+    rows, cursor = history(querysets, field, **query.validated_data)
+    next_page = None
+    if cursor:
+        # full precision: the JSON encoder would cut the cursor to milliseconds
+        next_page = {'before': serializers.DateTimeField().to_representation(cursor[0]), 'before_id': cursor[1]}
+    return Response({'results': serializer_class(rows, many=True).data, 'next': next_page},
+                    status=status.HTTP_200_OK)
 
 
 class ClinicViewSet(ViewSet):
@@ -25,6 +67,7 @@ class ClinicViewSet(ViewSet):
         'update': [IsDoctor | IsAdminUser, IsAuthenticated],
         'partial_update': [IsAdminUser, IsAuthenticated],
         'destroy': [IsAdminUser, IsAuthenticated],
+        'nearby': [IsAuthenticated],
     }
 
     serializer_class = ClinicSerializer
@@ -39,15 +82,46 @@ class ClinicViewSet(ViewSet):
 
     @swagger_auto_schema(
         responses={200: ClinicSerializer(many=True)},
+        manual_parameters=SPARSE_PARAMETERS,
         operation_description=_('Retrieve a list of clinics.')
     )
+    @coalesce()
     def list(self, request):
         '''Retrieve a list of clinics.'''
         clinics = Clinic.objects.all()
         serializer = self.get_serializer_class()
-        data = serializer(clinics, many=True).data
+        data = serializer(clinics, many=True, **sparse_fieldset(request)).data
         return Response(data, status=status.HTTP_200_OK)
 
+    @swagger_auto_schema(
+        query_serializer=NearbyQuerySerializer,
+        responses={200: NearbyClinicSerializer(many=True)},
+        operation_description=_('Clinics within a radius of a point, nearest first, optionally only those '
+                                'with free slots on a day.')
+    )
+    @action(detail=False, methods=['get'])
+    @coalesce()
+    def nearby(self, request):
+        '''Find the clinics near a point.'''
+        query = NearbyQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        found = nearby_clinics(params['lat'], params['lon'], params['radius'])
+        free = {}
+        if 'date' in params:
+            free = free_slots([clinic.pk for clinic, _distance in found], params['date'], params.get('specialty'))
+            found = [(clinic, distance) for clinic, distance in found if free.get(clinic.pk, 0) > 0]
+        rows = [
+            {
+                'id': clinic.pk, 'name': clinic.name, 'address': clinic.address,
+                'latitude': clinic.latitude, 'longitude': clinic.longitude,
+                'distance_km': round(distance, 3), 'free_slots': free.get(clinic.pk),
+            }
+            for clinic, distance in found[:params['limit']]
+        ]
+        return Response(NearbyClinicSerializer(rows, many=True).data, status=status.HTTP_200_OK)
+
     @swagger_auto_schema(
         request_body=ClinicSerializer,
         responses={
@@ -73,12 +147,14 @@ class ClinicViewSet(ViewSet):
                 'error': openapi.Schema(type=openapi.TYPE_STRING)
             })),
         },
+        manual_parameters=SPARSE_PARAMETERS,
         operation_description=_('Retrieve a specific clinic by ID.')
     )
+    @coalesce()
     def retrieve(self, request, pk=None):
         '''Retrieve a specific clinic by ID.'''
         clinic = get_object_or_404(Clinic, pk=pk)
-        serializer = self.get_serializer_class()(clinic)
+        serializer = self.get_serializer_class()(clinic, **sparse_fieldset(request))
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
@@ -135,9 +211,9 @@ class ClinicViewSet(ViewSet):
         operation_description=_('Delete a specific clinic.')
     )
     def destroy(self, request, pk=None):
-        '''Delete a specific clinic.'''
+        '''Delete a specific clinic, cancelling its upcoming appointments first.'''
         clinic = get_object_or_404(Clinic, pk=pk)
-        clinic.delete()
+        close_clinic(clinic, delete=True, reason=_('The clinic has been closed.'))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -148,18 +224,22 @@ class AvailabilityViewSet(ViewSet):
         'list': [IsAuthenticated],
         'create': [IsDoctor, IsAuthenticated],
         'retrieve': [IsAuthenticated],
-        'update': [IsDoctor, IsOwner, IsAuthenticated],
+        'update': [IsDoctor, IsAuthenticated],
         'partial_update': [IsAuthenticated],
         'destroy': [IsDoctor, IsAuthenticated],
+        'bulk_create': [IsDoctor, IsAuthenticated],
+        'history': [IsDoctor | IsAdminUser, IsAuthenticated],
     }
 
     serializer_classes_by_action = {
         'list': AvailabilitySerializer,
-        'create': AvailabilitySerializer,
+        'create': AvailabilityWriteSerializer,
         'retrieve': SelectableTimeListSerializer,
-        'update': AvailabilitySerializer,
+        'update': AvailabilityWriteSerializer,
         'partial_update': SelectableTimeListSerializer,
         'destroy': None,
+        'bulk_create': AvailabilityWindowSerializer,
+        'history': AvailabilityHistorySerializer,
     }
 
     def get_permissions(self):
@@ -172,16 +252,20 @@ class AvailabilityViewSet(ViewSet):
 
     @swagger_auto_schema(
         responses={200: AvailabilitySerializer(many=True)},
+        manual_parameters=SPARSE_PARAMETERS,
         operation_description=_('Retrieve a list of availabilities.')
     )
+    @coalesce()
     def list(self, request):
         '''List all availabilities.'''
-        availabilities = Availability.objects.all()
-        serializer = self.get_serializer_class()(availabilities, many=True)
-        return Response(serializer.data)
+        availabilities = Availability.objects.order_by('pk')
+        fieldset = sparse_fieldset(request)
+        if fieldset:
+            return Response(self.get_serializer_class()(availabilities, many=True, **fieldset).data)
+        return Response(availability_rows(availabilities))
 
     @swagger_auto_schema(
-        request_body=AvailabilitySerializer,
+        request_body=AvailabilityWriteSerializer,
         responses={
             201: AvailabilitySerializer,
             400: openapi.Response('Bad Request', schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
@@ -191,13 +275,49 @@ class AvailabilityViewSet(ViewSet):
         operation_description=_('Create a new availability.')
     )
     def create(self, request):
-        '''Create a new availability.'''
+        '''Create a new availability for the requesting doctor.'''
         serializer = self.get_serializer_class()(data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            availability = serializer.save(doctor=request.user.doctor)
+            return Response(AvailabilitySerializer(availability).data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @swagger_auto_schema(
+        request_body=AvailabilityWindowSerializer(many=True),
+        responses={
+            201: AvailabilitySerializer(many=True),
+            400: openapi.Response('Bad Request', schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+                'conflicts': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_OBJECT))
+            })),
+        },
+        operation_description=_('Create many availabilities at once, reporting every overlap.')
+    )
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_create(self, request):
+        '''Create a batch of availabilities for the requesting doctor.'''
+        serializer = self.get_serializer_class()(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        created, conflicts = create_schedule(request.user.doctor, serializer.validated_data)
+        if conflicts:
+            return Response({'conflicts': conflicts}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(AvailabilitySerializer(created, many=True).data, status=status.HTTP_201_CREATED)
+
+    @swagger_auto_schema(
+        query_serializer=HistoryQuerySerializer,
+        responses={200: HistoryPageSerializer},
+        operation_description=_('Past availabilities of the requesting doctor (every doctor for staff), '
+                                'archived ones included, newest first.')
+    )
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        '''Page through past availabilities.'''
+        now = timezone.now()
+        querysets = [Availability.objects.filter(end_time__lt=now), ArchivedAvailability.objects.all()]
+        if not request.user.is_staff:
+            querysets = [queryset.filter(doctor__user=request.user) for queryset in querysets]
+        return history_response(request, querysets, 'start_time', self.get_serializer_class())
+
     @swagger_auto_schema(
         responses={
             200: SelectableTimeListSerializer,
@@ -205,16 +325,18 @@ class AvailabilityViewSet(ViewSet):
                 'error': openapi.Schema(type=openapi.TYPE_STRING)
             })),
         },
+        manual_parameters=SPARSE_PARAMETERS,
         operation_description='Retrieve a specific availability.'
     )
+    @coalesce()
     def retrieve(self, request, pk=None):
         '''Retrieve a specific availability.'''
-        availability = get_object_or_404(Availability, pk=pk)
-        serializer = self.get_serializer_class()(availability)
+        serializer = self.get_serializer_class()(**sparse_fieldset(request))
+        serializer.instance = get_object_or_404(serializer.narrow_queryset(Availability.objects.all()), pk=pk)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
-        request_body=AvailabilitySerializer,
+        request_body=AvailabilityWriteSerializer,
         responses={
             200: AvailabilitySerializer,
             400: openapi.Response('Bad Request', schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
@@ -227,12 +349,12 @@ class AvailabilityViewSet(ViewSet):
         operation_description='Update a specific availability.'
     )
     def update(self, request, pk=None):
-        '''Update a specific availability.'''
-        availability = get_object_or_404(Availability, pk=pk)
+        '''Update a specific availability of the requesting doctor.'''
+        availability = get_object_or_404(Availability, pk=pk, doctor__user=request.user)
         serializer = self.get_serializer_class()(availability, data=request.data)
         if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            availability = serializer.save()
+            return Response(AvailabilitySerializer(availability).data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @swagger_auto_schema(
@@ -280,6 +402,9 @@ class AppointmentViewSet(ViewSet):
         'update': [IsOwner, IsAuthenticated],
         'partial_update': [IsOwner, IsAuthenticated],
         'destroy': [IsOwner, IsAuthenticated],
+        'bulk_cancel': [IsAdminUser, IsAuthenticated],
+        'reschedule': [IsOwner, IsAuthenticated],
+        'history': [IsAuthenticated],
     }
 
     serializer_class = AppointmentSerializer
@@ -294,15 +419,36 @@ class AppointmentViewSet(ViewSet):
 
     @swagger_auto_schema(
         responses={200: AppointmentSerializer(many=True)},
+        manual_parameters=SPARSE_PARAMETERS,
         operation_description='Retrieve a list of appointments.'
     )
     def list(self, request):
         '''Retrieve a list of appointments.'''
         appointments = Appointment.objects.all()
         serializer = self.get_serializer_class()
-        data = serializer(appointments, many=True).data
+        data = serializer(appointments, many=True, **sparse_fieldset(request)).data
         return Response(data, status=status.HTTP_200_OK)
 
+    @swagger_auto_schema(
+        query_serializer=HistoryQuerySerializer,
+        responses={200: HistoryPageSerializer},
+        operation_description=_("Past appointments of the requesting patient or doctor (all of them for staff), "
+                                "archived ones included, newest first.")
+    )
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        '''Page through past appointments.'''
+        querysets = [
+            Appointment.objects.filter(scheduled_at__lt=timezone.now()),
+            ArchivedAppointment.objects.filter(scheduled_at__isnull=False),
+        ]
+        user = request.user
+        if not user.is_staff:
+            owner = Q(availability__doctor__user=user) if user.is_doctor else Q(patient__user=user)
+            querysets = [queryset.filter(owner) for queryset in querysets]
+        querysets = [queryset.select_related('availability') for queryset in querysets]
+        return history_response(request, querysets, 'scheduled_at', AppointmentHistorySerializer)
+
     @swagger_auto_schema(
         request_body=AppointmentSerializer,
         responses={
@@ -328,12 +474,13 @@ class AppointmentViewSet(ViewSet):
                 'error': openapi.Schema(type=openapi.TYPE_STRING)
             })),
         },
+        manual_parameters=SPARSE_PARAMETERS,
         operation_description='Retrieve a specific appointment by ID.'
     )
     def retrieve(self, request, pk=None):
         '''Retrieve a specific appointment by ID.'''
-        appointment = get_object_or_404(Appointment, pk=pk)
-        serializer = self.get_serializer_class()(appointment)
+        serializer = self.get_serializer_class()(**sparse_fieldset(request))
+        serializer.instance = get_object_or_404(serializer.narrow_queryset(Appointment.objects.all()), pk=pk)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
@@ -394,3 +541,97 @@ class AppointmentViewSet(ViewSet):
         appointment = get_object_or_404(Appointment, pk=pk)
         appointment.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @swagger_auto_schema(
+        request_body=BulkCancelSerializer,
+        responses={
+            200: openapi.Response('Cancellation report', schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+                'appointments': openapi.Schema(type=openapi.TYPE_INTEGER),
+                'availabilities': openapi.Schema(type=openapi.TYPE_INTEGER),
+                'dry_run': openapi.Schema(type=openapi.TYPE_BOOLEAN),
+            })),
+            400: openapi.Response('Bad Request', schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+                'error': openapi.Schema(type=openapi.TYPE_STRING)
+            })),
+        },
+        operation_description='Cancel every appointment on a set of availabilities or a date range.'
+    )
+    @action(detail=False, methods=['post'], url_path='bulk-cancel')
+    def bulk_cancel(self, request):
+        '''Cancel appointments in bulk.'''
+        serializer = BulkCancelSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        report = cancel_appointments(
+            availability_ids=data.get('availabilities'), start=data.get('start'), end=data.get('end'),
+            doctor=data.get('doctor'), clinic=data.get('clinic'),
+            reason=data['reason'], dry_run=data['dry_run'],
+        )
+        return Response(report, status=status.HTTP_200_OK)
+
+    @swagger_auto_schema(
+        request_body=RescheduleSerializer,
+        responses={
+            200: AppointmentSerializer,
+            400: openapi.Response('Bad Request', schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+                'error': openapi.Schema(type=openapi.TYPE_STRING)
+            })),
+            404: openapi.Response('Not Found', schema=openapi.Schema(type=openapi.TYPE_OBJECT, properties={
+                'error': openapi.Schema(type=openapi.TYPE_STRING)
+            })),
+        },
+        operation_description='Move an appointment to another slot of the same or another availability.'
+    )
+    @action(detail=True, methods=['post'])
+    def reschedule(self, request, pk=None):
+        '''Release the current slot and claim the requested one atomically.'''
+        appointment = get_object_or_404(Appointment.objects.select_related('patient__user'), pk=pk)
+        self.check_object_permissions(request, appointment)
+        serializer = RescheduleSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        try:
+            appointment.reschedule(data.get('availability', appointment.availability_id), data['selected_time'])
+        except DjangoValidationError as error:
+            return Response({'error': error.messages}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(self.get_serializer_class()(appointment).data, status=status.HTTP_200_OK)
+
+
+async def authenticated_user(request):
+    '''Session user, or the user of a JWT ``Authorization`` header.'''
+    user = await request.auser()
+    if user.is_authenticated:
+        return user
+    try:
+        result = await sync_to_async(JWTAuthentication().authenticate)(Request(request))
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+@require_safe
+async def live_slots(request):
+    '''Stream slot changes of ``?ids=1,2,3`` as server-sent events.
+
+    Serve it through the ASGI application: under WSGI every open stream
+    holds a worker thread.
+    '''
+    if await authenticated_user(request) is None:
+        return JsonResponse({'error': _('Authentication credentials were not provided.')}, status=401)
+    try:
+        ids = sorted({int(value) for value in request.GET.get('ids', '').split(',') if value.strip()})
+    except ValueError:
+        return JsonResponse({'error': _('ids must be a comma separated list of availability IDs.')}, status=400)
+    if not ids or len(ids) > settings.LIVE_SLOTS_MAX_SUBSCRIPTIONS:
+        return JsonResponse(
+            {'error': _('Subscribe to between 1 and %(max)s availabilities.') % {
+                'max': settings.LIVE_SLOTS_MAX_SUBSCRIPTIONS}},
+            status=400,
+        )
+    get_broker().start()
+    response = StreamingHttpResponse(slot_stream(ids), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
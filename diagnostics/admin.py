@@ -0,0 +1,54 @@
+import os
+
+from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from django.utils.translation import gettext_lazy as _
+from .models import ProfileCapture
+from .profiling import profile_dir
+
+
+@admin.register(ProfileCapture)
+class ProfileCaptureAdmin(admin.ModelAdmin):
+    list_display = (
+        'created_at', 'method', 'path', 'view', 'action', 'status_code', 'duration_ms', 'trigger', 'downloads'
+    )
+    list_filter = ('trigger', 'method', 'view')
+    search_fields = ('path', 'view')
+    date_hierarchy = 'created_at'
+    list_select_related = ('user',)
+    readonly_fields = [field.name for field in ProfileCapture._meta.fields] + ['downloads']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description=_("Files"))
+    def downloads(self, obj):
+        return format_html(
+            '<a href="{}">pstats</a> | <a href="{}">collapsed</a>',
+            reverse('admin:diagnostics_profilecapture_download', args=[obj.pk, 'stats']),
+            reverse('admin:diagnostics_profilecapture_download', args=[obj.pk, 'stacks']),
+        )
+
+    def get_urls(self):
+        return [
+            path(
+                '<int:pk>/download/<str:kind>/', self.admin_site.admin_view(self.download),
+                name='diagnostics_profilecapture_download',
+            ),
+        ] + super().get_urls()
+
+    def download(self, request, pk, kind):
+        capture = self.get_object(request, pk)
+        if capture is None or kind not in ('stats', 'stacks') or not self.has_view_permission(request, capture):
+            raise Http404
+        name = capture.stats_file if kind == 'stats' else capture.stacks_file
+        try:
+            file = open(os.path.join(profile_dir(), name), 'rb')
+        except FileNotFoundError:
+            raise Http404
+        return FileResponse(file, as_attachment=True, filename=name)
@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+from django.utils.translation import gettext_lazy as _
+
+
+class DiagnosticsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'diagnostics'
+    verbose_name = _("diagnostics")
+
+    def ready(self):
+        import tracemalloc
+        from . import metrics
+        metrics.register(
+            'tracemalloc_traced_bytes',
+            lambda: tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+        )
@@ -0,0 +1,31 @@
+'''Append-only JSON lines files shared by the diagnostics recorders.'''
+import json
+import os
+import threading
+
+_lock = threading.Lock()
+
+
+def append_jsonl(path, records):
+    '''Append ``records`` to ``path``, one JSON document per line.'''
+    if not records:
+        return
+    path = os.fspath(path)
+    lines = ''.join(json.dumps(record, default=str) + '\n' for record in records)
+    with _lock:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a') as file:
+            file.write(lines)
+
+
+def read_jsonl(path):
+    '''Yield the records of ``path``, skipping torn or invalid lines.'''
+    path = os.fspath(path)
+    if not os.path.exists(path):
+        return
+    with open(path) as file:
+        for line in file:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
@@ -0,0 +1,27 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from healthcare_appointment_system.apidocs import schema_path
+
+
+class Command(BaseCommand):
+    help = "Build the OpenAPI schema of every language into API_SCHEMA_DIR (run at deploy time)."
+
+    def handle(self, *args, **options):
+        if not settings.API_DOCS_ENABLED:
+            raise CommandError("API documentation is disabled (API_DOCS_ENABLED).")
+        from healthcare_appointment_system.urls import schema_view
+
+        os.makedirs(settings.API_SCHEMA_DIR, exist_ok=True)
+        for language, _ in settings.LANGUAGES:
+            content = schema_view.generate(language)
+            path = schema_path(language)
+            # write next to the target and rename, so workers never read half a file
+            with open(f"{path}.tmp", 'wb') as file:
+                file.write(content)
+            os.replace(f"{path}.tmp", path)
+            self.stdout.write(f"{path}: {len(content):,} bytes")
+        schema_view.clear()
+        self.stdout.write(self.style.SUCCESS("API schema built."))
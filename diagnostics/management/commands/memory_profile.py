@@ -0,0 +1,65 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from django.urls import Resolver404
+
+from appointments.benchmarks import create_appointment_rows, scratch_data
+from diagnostics.memory import GROUP_BY, profile_endpoint
+from users.models import User
+
+
+def megabytes(size):
+    return f"{size / 1024 / 1024:,.2f} MiB"
+
+
+class Command(BaseCommand):
+    help = "Run an endpoint under tracemalloc and report its top allocation sites (data is rolled back)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Endpoint path with query string, e.g. /appointments/?fields=id.")
+        parser.add_argument('--method', default='GET')
+        parser.add_argument('--data', help="JSON request body.")
+        parser.add_argument('--user', help="Phone number of the user to call as (default: a scratch superuser).")
+        parser.add_argument('--rows', type=int, default=0, help="Scratch appointments to create first.")
+        parser.add_argument('--group-by', choices=GROUP_BY, default='lineno')
+        parser.add_argument('--limit', type=int, default=15)
+
+    def handle(self, *args, **options):
+        try:
+            data = json.dumps(json.loads(options['data'])) if options['data'] else None
+        except ValueError as error:
+            raise CommandError(f"--data is not valid JSON: {error}")
+
+        # every call has to run the view, not reuse a coalesced response
+        with scratch_data(), override_settings(SINGLE_FLIGHT_WINDOW=0):
+            if options['rows']:
+                create_appointment_rows(options['rows'])
+            try:
+                user = self.get_user(options['user'])
+                report = profile_endpoint(
+                    options['method'], options['path'], user, data,
+                    group_by=options['group_by'], limit=options['limit'],
+                )
+            except (User.DoesNotExist, Resolver404) as error:
+                raise CommandError(error)
+
+        self.stdout.write(
+            f"{options['method'].upper()} {options['path']} -> {report['status']}, "
+            f"{report['content_bytes']:,} bytes"
+        )
+        self.stdout.write(f"peak: {megabytes(report['peak_bytes'])}, "
+                          f"held by the response: {megabytes(report['retained_bytes'])}")
+        self.stdout.write("top allocation sites:")
+        for site in report['sites']:
+            self.stdout.write(
+                f"  {megabytes(site['size_diff']):>12}  {site['count_diff']:>+8,} blocks  {site['site'][-1]}"
+            )
+
+    def get_user(self, phone_number):
+        if phone_number:
+            return User.objects.get(phone_number=phone_number)
+        # the benchmark rows use the 08/09 prefixes
+        return User.objects.create(
+            phone_number='07000000000', first_name='Memory', last_name='Profile', is_staff=True, is_superuser=True
+        )
@@ -0,0 +1,81 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from diagnostics.traffic import ClientTarget, ServerTarget, read_records, replay
+from users.models import User
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def role_pairs(values, option):
+    pairs = {}
+    for value in values or ():
+        role, separator, credential = value.partition('=')
+        if not separator:
+            raise CommandError(f"{option} takes role=value, got {value!r}.")
+        pairs[role] = credential
+    return pairs
+
+
+class Command(BaseCommand):
+    help = "Replay captured traffic and report latency and error rates per endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('file', nargs='?', help="Capture file (defaults to TRAFFIC_CAPTURE_FILE).")
+        parser.add_argument('--url', help="Base URL of a running server; without it the Django test client "
+                                          "is used against the configured database.")
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help="Time scale (2 = twice as fast, 0 = as fast as possible).")
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--limit', type=int, help="Replay only the first N records.")
+        parser.add_argument('--include-writes', action='store_true',
+                            help="Also replay POST/PUT/PATCH/DELETE requests (they change data).")
+        parser.add_argument('--user', action='append', metavar='ROLE=PHONE',
+                            help="Test client: user to log in as for a role (repeatable).")
+        parser.add_argument('--token', action='append', metavar='ROLE=TOKEN',
+                            help="Server: JWT access token for a role (repeatable).")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        records = read_records(options['file'])
+        if not options['include_writes']:
+            records = [record for record in records if record['method'] in SAFE_METHODS]
+        records = records[:options['limit']] if options['limit'] else records
+        if not records:
+            raise CommandError("No records to replay.")
+        if options['concurrency'] < 1 or options['speed'] < 0:
+            raise CommandError("--concurrency must be at least 1 and --speed not negative.")
+
+        if options['url']:
+            target = ServerTarget(options['url'], role_pairs(options['token'], '--token'))
+            result = replay(records, target, options['speed'], options['concurrency'])
+        else:
+            try:
+                users = {
+                    role: User.objects.get(phone_number=phone)
+                    for role, phone in role_pairs(options['user'], '--user').items()
+                }
+            except User.DoesNotExist as error:
+                raise CommandError(error)
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                result = replay(records, ClientTarget(users), options['speed'], options['concurrency'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(result, indent=2))
+            return
+        self.stdout.write(
+            f"{result['requests']} requests in {result['elapsed_s']:.1f} s "
+            f"({result['throughput_rps']} req/s), max lag {result['lag_ms']:.0f} ms"
+        )
+        self.stdout.write(f"{'endpoint':<50} {'n':>6} {'5xx':>7} {'4xx':>7} "
+                          f"{'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}")
+        for row in result['endpoints']:
+            line = (
+                f"{row['endpoint'][:50]:<50} {row['requests']:>6} {row['error_rate']:>7.1%} "
+                f"{row['client_error_rate']:>7.1%} {row['p50_ms']:>9.1f} {row['p90_ms']:>9.1f} "
+                f"{row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}"
+            )
+            self.stdout.write(self.style.ERROR(line) if row['error_rate'] else line)
@@ -0,0 +1,47 @@
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from diagnostics.queries import read_entries, report
+
+
+class Command(BaseCommand):
+    help = "Report the heaviest slow query and N+1 fingerprints of the slow query log."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--kind', choices=['slow', 'n+1'], help="Only one kind of entry.")
+        parser.add_argument('--since', help="Only entries from this time on (ISO date or datetime).")
+        parser.add_argument('--log', help="Log file (defaults to SLOW_QUERY_LOG).")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.fromisoformat(options['since'])
+            except ValueError as error:
+                raise CommandError(error)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since)
+            since = since.astimezone(dt_timezone.utc)
+        rows = report(read_entries(options['log'], since), top=options['top'], kind=options['kind'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(rows, indent=2))
+            return
+        if not rows:
+            self.stdout.write("No slow queries logged.")
+            return
+        for row in rows:
+            self.stdout.write(self.style.WARNING(
+                f"[{row['kind']}] {row['fingerprint']}  total {row['total_ms']:,.1f} ms, "
+                f"{row['queries']} queries in {row['occurrences']} entries, "
+                f"mean {row['mean_ms']:.2f} ms, max {row['max_ms']:.2f} ms"
+            ))
+            self.stdout.write(f"  {row['sql'][:300]}")
+            self.stdout.write(f"  views: {', '.join(row['views'])}")
+            for frame in row['stack']:
+                self.stdout.write(f"    {frame}")
@@ -0,0 +1,75 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def parse_importtime(output):
+    '''Return ``[(module, self_us, cumulative_us, depth)]`` from ``-X importtime`` output.'''
+    modules = []
+    for line in output.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            modules.append((module, int(own), int(cumulative), len(indent) // 2))
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Measure a fresh worker's start-up: phases, first requests and import time per package."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help="Packages and modules to list.")
+        parser.add_argument('--no-warmup', action='store_true', help="Measure without the warm-up step.")
+        parser.add_argument('--path', default='/clinics/', help="Path of the first requests.")
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        command = [sys.executable, '-X', 'importtime', '-m', 'diagnostics.startup', '--path', options['path']]
+        if options['no_warmup']:
+            command.append('--no-warmup')
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings.SETTINGS_MODULE}
+        result = subprocess.run(command, cwd=settings.BASE_DIR, env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed')
+        phases = json.loads(result.stdout.strip().splitlines()[-1])
+
+        modules = parse_importtime(result.stderr)
+        packages = defaultdict(int)
+        for module, own, _, _ in modules:
+            packages[module.split('.')[0]] += own
+        report = {
+            'phases': phases,
+            'import_total_ms': round(sum(own for _, own, _, _ in modules) / 1000, 1),
+            'packages_ms': {
+                package: round(own / 1000, 1)
+                for package, own in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options['top']]
+            },
+            'modules_ms': {
+                module: round(cumulative / 1000, 1)
+                for module, _, cumulative, depth in sorted(modules, key=lambda item: item[2], reverse=True)
+                if depth == 0
+            },
+        }
+        report['modules_ms'] = dict(list(report['modules_ms'].items())[:options['top']])
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write("phases:")
+        for name, seconds in phases.items():
+            self.stdout.write(f"  {name:<36} {seconds * 1000:>9.1f} ms")
+        self.stdout.write(f"imports: {report['import_total_ms']:,.1f} ms in {len(modules)} modules")
+        self.stdout.write("by package (own time):")
+        for package, ms in report['packages_ms'].items():
+            self.stdout.write(f"  {package:<36} {ms:>9.1f} ms")
+        self.stdout.write("heaviest top-level imports (cumulative):")
+        for module, ms in report['modules_ms'].items():
+            self.stdout.write(f"  {module:<36} {ms:>9.1f} ms")
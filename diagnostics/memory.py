@@ -0,0 +1,172 @@
+'''Allocation tracking with ``tracemalloc``.
+
+Tracing is opt-in (``TRACEMALLOC_ENABLED``): it slows every allocation down
+and keeps a traceback per live block. Snapshots and per-view peaks live in
+the memory of the serving process, so with several workers each one
+answers for itself.
+'''
+import itertools
+import threading
+import tracemalloc
+
+from django.conf import settings
+from django.utils import timezone
+
+GROUP_BY = ('lineno', 'filename', 'traceback')
+
+# allocations made by tracemalloc itself and the import machinery are noise
+NOISE = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+
+def start():
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(settings.TRACEMALLOC_FRAMES)
+
+
+def take_snapshot():
+    return tracemalloc.take_snapshot().filter_traces(NOISE)
+
+
+def allocation_sites(statistics, limit):
+    '''JSON-friendly rows for ``Snapshot.statistics()``/``compare_to()`` results.'''
+    rows = []
+    for stat in statistics[:limit]:
+        row = {
+            'site': [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback],
+            'size': stat.size,
+            'count': stat.count,
+        }
+        if isinstance(stat, tracemalloc.StatisticDiff):
+            row.update(size_diff=stat.size_diff, count_diff=stat.count_diff)
+        rows.append(row)
+    return rows
+
+
+def diff(older, newer, group_by='lineno', limit=20):
+    '''Top allocation sites that grew (or shrank) between two snapshots.'''
+    return allocation_sites(newer.compare_to(older, group_by), limit)
+
+
+class SnapshotStore:
+    '''The last ``TRACEMALLOC_MAX_SNAPSHOTS`` snapshots of this process, by id.'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._snapshots = {}
+
+    def take(self):
+        snapshot = take_snapshot()
+        record = {
+            'id': next(self._ids),
+            'taken_at': timezone.now(),
+            'traced_bytes': tracemalloc.get_traced_memory()[0],
+        }
+        with self._lock:
+            self._snapshots[record['id']] = (record, snapshot)
+            while len(self._snapshots) > settings.TRACEMALLOC_MAX_SNAPSHOTS:
+                del self._snapshots[min(self._snapshots)]
+        return record
+
+    def get(self, snapshot_id):
+        with self._lock:
+            entry = self._snapshots.get(snapshot_id)
+        return entry[1] if entry else None
+
+    def records(self):
+        with self._lock:
+            return [record for record, _ in self._snapshots.values()]
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
+
+
+snapshots = SnapshotStore()
+
+
+class RequestPeaks:
+    '''Peak allocation per view: count, last, max and mean bytes.
+
+    The peak is process-wide, so requests served concurrently by other
+    threads are counted in each other's peaks.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def record(self, view, peak):
+        with self._lock:
+            entry = self._views.setdefault(view, {'requests': 0, 'total_bytes': 0, 'max_bytes': 0})
+            entry['requests'] += 1
+            entry['total_bytes'] += peak
+            entry['max_bytes'] = max(entry['max_bytes'], peak)
+            entry['last_bytes'] = peak
+
+    def rows(self):
+        with self._lock:
+            rows = [
+                {'view': view, 'requests': entry['requests'], 'last_bytes': entry['last_bytes'],
+                 'max_bytes': entry['max_bytes'], 'mean_bytes': entry['total_bytes'] // entry['requests']}
+                for view, entry in self._views.items()
+            ]
+        return sorted(rows, key=lambda row: row['max_bytes'], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self._views.clear()
+
+
+request_peaks = RequestPeaks()
+
+
+def call_endpoint(method, path, user=None, data=None):
+    '''Call the view behind ``path`` directly (no middleware) and render the response.'''
+    from urllib.parse import urlsplit
+    from django.urls import resolve
+    from rest_framework.test import APIRequestFactory, force_authenticate
+
+    request = APIRequestFactory().generic(method.upper(), path, data or '', content_type='application/json')
+    if user is not None:
+        force_authenticate(request, user=user)
+    match = resolve(urlsplit(path).path)
+    response = match.func(request, *match.args, **match.kwargs)
+    if hasattr(response, 'render'):
+        response.render()
+    return response
+
+
+def profile_endpoint(method, path, user=None, data=None, group_by='lineno', limit=15):
+    '''Run an endpoint under tracemalloc and return its allocation report.
+
+    The endpoint is called once untraced to warm caches and imports. The
+    reported sites are the allocations still alive while the response is
+    held (serializer output, rendered body, querysets it kept), ``peak``
+    covers the temporary ones as well.
+    '''
+    call_endpoint(method, path, user, data)
+    was_tracing = tracemalloc.is_tracing()
+    start()
+    try:
+        before = take_snapshot()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        response = call_endpoint(method, path, user, data)
+        current, peak = tracemalloc.get_traced_memory()
+        after = take_snapshot()
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    return {
+        'status': response.status_code,
+        'content_bytes': len(response.content),
+        'peak_bytes': peak - baseline,
+        'retained_bytes': current - baseline,
+        'sites': diff(before, after, group_by, limit),
+    }
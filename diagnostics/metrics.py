@@ -0,0 +1,22 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+_gauges = {}
+
+
+def register(name, callback):
+    '''Expose ``callback()`` as the value of the metric ``name``.'''
+    _gauges[name] = callback
+
+
+def collect():
+    '''Return the current value of every registered metric.'''
+    values = {}
+    for name, callback in sorted(_gauges.items()):
+        try:
+            values[name] = callback()
+        except Exception:
+            logger.exception("Metric %s could not be collected.", name)
+            values[name] = None
+    return values
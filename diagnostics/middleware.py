@@ -0,0 +1,227 @@
+import cProfile
+import random
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from appointments.coalescing import role_scope
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from . import memory
+from .models import ProfileCapture
+from .profiling import save_capture
+from .queries import QueryRecorder
+from .traffic import capture_record, has_captured_body, write_records
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+
+
+def describe_view(request, view_func):
+    '''Return ``(dotted view name, action)`` of the view serving ``request``.
+
+    The action is the ViewSet action (``list``, ``retrieve``...) or the
+    lowercased HTTP method for other class based views.
+    '''
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return f"{view_func.__module__}.{view_func.__qualname__}", ''
+    actions = getattr(view_func, 'actions', None) or {}
+    method = request.method.lower()
+    return f"{view_class.__module__}.{view_class.__qualname__}", actions.get(method, method)
+
+
+def is_staff_request(request):
+    '''Whether the session user or the JWT ``Authorization`` user is staff.'''
+    if request.user.is_authenticated:
+        return request.user.is_staff
+    try:
+        result = JWTAuthentication().authenticate(Request(request))
+    except AuthenticationFailed:
+        return False
+    return bool(result) and result[0].is_staff
+
+
+class ProfilingMiddleware:
+    '''Profile a sample of requests with cProfile.
+
+    ``PROFILING_SAMPLE_RATE`` (0..1) of the requests are profiled, and with
+    ``PROFILING_ON_DEMAND`` staff can profile any request by sending an
+    ``X-Profile: 1`` header (the capture id comes back in ``X-Profile-Id``).
+    With both off the middleware removes itself at startup. Async requests
+    (live slot streams) are passed through untouched.
+    '''
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if settings.PROFILING_SAMPLE_RATE <= 0 and not settings.PROFILING_ON_DEMAND:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.on_demand = settings.PROFILING_ON_DEMAND
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        trigger = self.trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        request._profiled_view = ('', '')
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+        finally:
+            profiler.disable()
+        duration = time.perf_counter() - started
+
+        view, action = request._profiled_view
+        capture = save_capture(
+            profiler, trigger=trigger, request=request, response=response,
+            duration=duration, view=view, action=action,
+        )
+        if trigger == ProfileCapture.Trigger.ON_DEMAND:
+            response['X-Profile-Id'] = str(capture.pk)
+        return response
+
+    def trigger(self, request):
+        if self.on_demand and request.META.get(PROFILE_HEADER) and is_staff_request(request):
+            return ProfileCapture.Trigger.ON_DEMAND
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return ProfileCapture.Trigger.SAMPLED
+        return None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_profiled_view'):
+            request._profiled_view = describe_view(request, view_func)
+        return None
+
+
+class MemoryTrackingMiddleware:
+    '''Record the peak traced allocation of every request, per view.
+
+    Opt-in with ``TRACEMALLOC_ENABLED``, which also starts ``tracemalloc``;
+    otherwise the middleware removes itself at startup. The peaks are
+    served by ``/diagnostics/memory/``. Async requests are passed through.
+    '''
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.TRACEMALLOC_ENABLED:
+            raise MiddlewareNotUsed
+        memory.start()
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self) or not tracemalloc.is_tracing():
+            return self.get_response(request)
+        request._memory_view = None
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        response = self.get_response(request)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        if request._memory_view is not None:
+            memory.request_peaks.record(request._memory_view, peak)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_memory_view'):
+            view, action = describe_view(request, view_func)
+            request._memory_view = f"{view}.{action}" if action else view
+        return None
+
+
+class SlowQueryMiddleware:
+    '''Record slow and repeated (N+1) queries of every request.
+
+    Opt-in with ``SLOW_QUERY_ENABLED``; otherwise the middleware removes
+    itself at startup. See ``diagnostics.queries``. Async requests are
+    passed through.
+    '''
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        recorder = request._query_recorder = QueryRecorder(request.method, request.path)
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        recorder.finish()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        recorder = getattr(request, '_query_recorder', None)
+        if recorder is not None:
+            recorder.view, recorder.action = describe_view(request, view_func)
+        return None
+
+
+class TrafficCaptureMiddleware:
+    '''Append a sanitized record of sampled requests for ``manage.py replay``.
+
+    Opt-in with ``TRAFFIC_CAPTURE_ENABLED``; otherwise the middleware
+    removes itself at startup. See ``diagnostics.traffic`` for the record
+    format. Paths under ``TRAFFIC_CAPTURE_EXCLUDE`` and async requests are
+    not captured.
+    '''
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.TRAFFIC_CAPTURE_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.TRAFFIC_CAPTURE_SAMPLE_RATE
+        self.exclude = tuple(settings.TRAFFIC_CAPTURE_EXCLUDE)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self) or request.path.startswith(self.exclude):
+            return self.get_response(request)
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+        request._captured_view = ('', '')
+        if has_captured_body(request):
+            # read before the view consumes the stream
+            request.body
+        started = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - started
+        view, action = request._captured_view
+        write_records([capture_record(request, response, duration, view, action, role_scope(request))])
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, '_captured_view'):
+            request._captured_view = describe_view(request, view_func)
+        return None
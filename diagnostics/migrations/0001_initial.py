@@ -0,0 +1,40 @@
+# Generated by Django 5.1.1 on 2026-10-19 00:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileCapture',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+                ('trigger', models.CharField(choices=[('sampled', 'Sampled'), ('on_demand', 'On demand')], max_length=10, verbose_name='Trigger')),
+                ('method', models.CharField(max_length=10, verbose_name='Method')),
+                ('path', models.CharField(max_length=500, verbose_name='Path')),
+                ('view', models.CharField(blank=True, max_length=200, verbose_name='View')),
+                ('action', models.CharField(blank=True, max_length=50, verbose_name='Action')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Status code')),
+                ('duration_ms', models.FloatField(verbose_name='Duration (ms)')),
+                ('stats_file', models.CharField(max_length=200, verbose_name='pstats file')),
+                ('stacks_file', models.CharField(max_length=200, verbose_name='Collapsed stacks file')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Profile capture',
+                'verbose_name_plural': 'Profile captures',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
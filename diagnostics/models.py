@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class ProfileCapture(models.Model):
+    '''A cProfile capture of one request, written to ``PROFILING_DIR``.
+
+    ``stats_file`` holds the raw ``pstats`` dump (``python -m pstats``,
+    snakeviz...), ``stacks_file`` the same profile as collapsed stacks for
+    ``flamegraph.pl``/speedscope. Both are names relative to ``PROFILING_DIR``.
+    '''
+
+    class Trigger(models.TextChoices):
+        SAMPLED = 'sampled', _('Sampled')
+        ON_DEMAND = 'on_demand', _('On demand')
+
+    created_at = models.DateTimeField(default=timezone.now, verbose_name=_("Created at"))
+    trigger = models.CharField(max_length=10, choices=Trigger.choices, verbose_name=_("Trigger"))
+    method = models.CharField(max_length=10, verbose_name=_("Method"))
+    path = models.CharField(max_length=500, verbose_name=_("Path"))
+    view = models.CharField(max_length=200, blank=True, verbose_name=_("View"))
+    action = models.CharField(max_length=50, blank=True, verbose_name=_("Action"))
+    status_code = models.PositiveSmallIntegerField(verbose_name=_("Status code"))
+    duration_ms = models.FloatField(verbose_name=_("Duration (ms)"))
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, verbose_name=_("User")
+    )
+    stats_file = models.CharField(max_length=200, verbose_name=_("pstats file"))
+    stacks_file = models.CharField(max_length=200, verbose_name=_("Collapsed stacks file"))
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = _("Profile capture")
+        verbose_name_plural = _("Profile captures")
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms:.0f} ms)"
@@ -0,0 +1,119 @@
+'''Per-request CPU profiles: cProfile runs turned into stored captures.
+
+cProfile records caller/callee edges, not whole stacks. ``collapsed_stacks``
+rebuilds stacks by walking the call graph from its roots and splitting each
+function's cumulative time between its callees in proportion to the time
+spent on every edge, which is what flame graph tools expect as input.
+Branches worth less than ``MIN_SHARE`` of the profile are folded into their
+caller, which keeps the walk linear in practice (Django's call graph has far
+too many distinct paths to enumerate).
+'''
+import os
+import pstats
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ProfileCapture
+
+MAX_DEPTH = 128
+MIN_SHARE = 0.0005
+
+
+def frame_label(function):
+    filename, lineno, name = function
+    if filename == '~':
+        label = name
+    else:
+        label = f"{name} ({os.path.basename(filename)}:{lineno})"
+    return label.replace(';', ':').replace(' ', '_')
+
+
+def collapsed_stacks(stats):
+    '''Return ``{"root;...;leaf": microseconds}`` for a ``pstats.Stats``.'''
+    children = defaultdict(dict)
+    roots = []
+    for function, (*_, callers) in stats.stats.items():
+        if not callers:
+            roots.append(function)
+        for caller, edge in callers.items():
+            children[caller][function] = edge[3]
+
+    stacks = defaultdict(int)
+    total = sum(stats.stats[root][3] for root in roots)
+    threshold = max(total * MIN_SHARE, 1e-6)
+
+    def walk(function, budget, stack):
+        cumulative = stats.stats[function][3]
+        stack = stack + [frame_label(function)]
+        scale = budget / cumulative if cumulative else 0
+        spent = 0
+        if len(stack) < MAX_DEPTH:
+            for child, edge_time in children[function].items():
+                if edge_time <= 0 or frame_label(child) in stack:
+                    continue
+                share = edge_time * scale
+                if share < threshold:
+                    continue
+                spent += share
+                walk(child, share, stack)
+        self_time = max(budget - spent, 0)
+        micros = round(self_time * 1_000_000)
+        if micros:
+            stacks[';'.join(stack)] += micros
+
+    for root in roots:
+        walk(root, stats.stats[root][3], [])
+    return dict(stacks)
+
+
+def profile_dir():
+    return os.fspath(settings.PROFILING_DIR)
+
+
+def save_capture(profiler, *, trigger, request, response, duration, view='', action=''):
+    '''Write ``profiler``'s artifacts and record a ``ProfileCapture``.'''
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    base = f"{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+    stats_file = f"{base}.prof"
+    profiler.dump_stats(os.path.join(directory, stats_file))
+
+    stacks_file = f"{base}.collapsed"
+    stacks = collapsed_stacks(pstats.Stats(profiler))
+    with open(os.path.join(directory, stacks_file), 'w') as file:
+        for stack, micros in sorted(stacks.items()):
+            file.write(f"{stack} {micros}\n")
+
+    user = getattr(request, 'user', None)
+    capture = ProfileCapture.objects.create(
+        trigger=trigger, method=request.method, path=request.path[:500],
+        view=view, action=action, status_code=response.status_code,
+        duration_ms=round(duration * 1000, 3),
+        user=user if user is not None and user.is_authenticated else None,
+        stats_file=stats_file, stacks_file=stacks_file,
+    )
+    prune_captures()
+    return capture
+
+
+def prune_captures(keep=None):
+    '''Delete all but the newest ``PROFILING_MAX_CAPTURES`` captures and their files.'''
+    keep = settings.PROFILING_MAX_CAPTURES if keep is None else keep
+    stale = list(ProfileCapture.objects.order_by('-created_at', '-id')[keep:].values_list(
+        'id', 'stats_file', 'stacks_file'
+    ))
+    if not stale:
+        return 0
+    directory = profile_dir()
+    for _, *files in stale:
+        for name in files:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+    ProfileCapture.objects.filter(id__in=[row[0] for row in stale]).delete()
+    return len(stale)
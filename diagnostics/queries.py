@@ -0,0 +1,140 @@
+'''Slow query and N+1 recording through ``connection.execute_wrapper``.
+
+Every query of a request is fingerprinted (literals and placeholders
+replaced, ``IN``/``VALUES`` lists collapsed). Queries slower than
+``SLOW_QUERY_THRESHOLD_MS`` and fingerprints repeated more than
+``SLOW_QUERY_N_PLUS_ONE`` times in one request are appended to the JSON
+lines file ``SLOW_QUERY_LOG`` with the DRF view/action and the part of the
+Python stack that runs in ``SLOW_QUERY_STACK_APPS``. ``manage.py
+slow_queries`` aggregates that file into a top-N report.
+'''
+import hashlib
+import os
+import re
+import time
+import traceback
+from collections import Counter, defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils import timezone
+
+from .logfiles import append_jsonl, read_jsonl
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'(?<![\w."])-?\d+(?:\.\d+)?\b')
+PLACEHOLDER = re.compile(r'%s|\?')
+LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+ROWS = re.compile(r'(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+')
+SPACE = re.compile(r'\s+')
+
+@lru_cache(maxsize=2048)
+def normalize(sql):
+    '''Replace literals with ``?`` and collapse value lists to ``(...)``.'''
+    sql = STRING.sub('?', sql)
+    sql = PLACEHOLDER.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    sql = LIST.sub('(...)', sql)
+    sql = ROWS.sub(r'\1', sql)
+    return SPACE.sub(' ', sql).strip()
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(normalized):
+    return hashlib.md5(normalized.encode(), usedforsecurity=False).hexdigest()[:12]
+
+
+def app_stack():
+    '''The innermost ``SLOW_QUERY_STACK_DEPTH`` frames that run in ``SLOW_QUERY_STACK_APPS``.'''
+    base = os.fspath(settings.BASE_DIR) + os.sep
+    prefixes = tuple(f"{app}{os.sep}" for app in settings.SLOW_QUERY_STACK_APPS)
+    frames = []
+    for frame in traceback.extract_stack():
+        if not frame.filename.startswith(base) or frame.filename == __file__:
+            continue
+        filename = frame.filename[len(base):]
+        if filename.startswith(prefixes):
+            frames.append(f"{filename}:{frame.lineno} in {frame.name}")
+    return frames[-settings.SLOW_QUERY_STACK_DEPTH:]
+
+
+def write_entries(entries, path=None):
+    append_jsonl(path or settings.SLOW_QUERY_LOG, entries)
+
+
+def read_entries(path=None, since=None):
+    for entry in read_jsonl(path or settings.SLOW_QUERY_LOG):
+        if since is None or entry['time'] >= since.isoformat():
+            yield entry
+
+
+class QueryRecorder:
+    '''``execute_wrapper`` timing and counting the queries of one request.'''
+
+    def __init__(self, method='', path=''):
+        self.method = method
+        self.path = path
+        self.view = ''
+        self.action = ''
+        self.threshold = settings.SLOW_QUERY_THRESHOLD_MS / 1000
+        self.repeats = settings.SLOW_QUERY_N_PLUS_ONE
+        self.counts = Counter()
+        self.durations = defaultdict(float)
+        self.repeated = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.observe(sql, params, many, time.perf_counter() - started)
+
+    def observe(self, sql, params, many, duration):
+        normalized = normalize(sql)
+        key = fingerprint(normalized)
+        self.counts[key] += 1
+        self.durations[key] += duration
+        if self.counts[key] == self.repeats + 1:
+            self.repeated[key] = (normalized, app_stack())
+        if duration >= self.threshold:
+            parameters = len(params[0] if many and params else params or ())
+            write_entries([self.entry('slow', key, normalized, duration, app_stack(), params=parameters)])
+
+    def entry(self, kind, key, sql, duration, stack, **extra):
+        return {
+            'time': timezone.now().isoformat(), 'kind': kind, 'fingerprint': key, 'sql': sql[:2000],
+            'duration_ms': round(duration * 1000, 3), 'method': self.method, 'path': self.path,
+            'view': self.view, 'action': self.action, 'stack': stack, **extra,
+        }
+
+    def finish(self):
+        '''Log the fingerprints repeated more than ``SLOW_QUERY_N_PLUS_ONE`` times.'''
+        write_entries([
+            self.entry('n+1', key, sql, self.durations[key], stack, count=self.counts[key])
+            for key, (sql, stack) in self.repeated.items()
+        ])
+
+
+def report(entries, top=20, kind=None):
+    '''Aggregate log entries by kind and fingerprint, heaviest total time first.'''
+    groups = {}
+    for entry in entries:
+        if kind and entry['kind'] != kind:
+            continue
+        group = groups.setdefault((entry['kind'], entry['fingerprint']), {
+            'kind': entry['kind'], 'fingerprint': entry['fingerprint'], 'sql': entry['sql'],
+            'occurrences': 0, 'queries': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'views': Counter(), 'stack': entry['stack'],
+        })
+        group['occurrences'] += 1
+        group['queries'] += entry.get('count', 1)
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        view = '.'.join(filter(None, (entry['view'], entry['action']))) or entry['path']
+        group['views'][view] += 1
+    rows = sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)[:top]
+    for row in rows:
+        row['total_ms'] = round(row['total_ms'], 3)
+        row['mean_ms'] = round(row['total_ms'] / row['queries'], 3)
+        row['views'] = [view for view, _ in row['views'].most_common()]
+    return rows
@@ -0,0 +1,14 @@
+from rest_framework import serializers
+from .memory import GROUP_BY
+
+
+class SnapshotDiffQuerySerializer(serializers.Serializer):
+    '''SnapshotDiffQuerySerializer for validating snapshot diff parameters.
+
+    ## Fields:
+    - group_by: Group allocations by source line, file or whole traceback
+    - limit: Maximum number of allocation sites
+    '''
+
+    group_by = serializers.ChoiceField(choices=GROUP_BY, default='lineno')
+    limit = serializers.IntegerField(min_value=1, max_value=200, default=20)
@@ -0,0 +1,50 @@
+'''Start-up measurement run in a fresh interpreter by ``manage.py startup_profile``.
+
+``python -X importtime -m diagnostics.startup [--no-warmup] [--path PATH]``
+loads the project the way a WSGI worker does and prints the duration of
+each phase as JSON on stdout; ``-X importtime`` writes the per-module
+import times to stderr.
+'''
+import argparse
+import json
+import os
+import time
+
+
+def measure(warmup=True, path='/clinics/'):
+    phases = {}
+
+    def phase(name, function):
+        started = time.perf_counter()
+        result = function()
+        phases[name] = round(time.perf_counter() - started, 4)
+        return result
+
+    import django
+    phase('django.setup', django.setup)
+    from django.conf import settings
+    from django.core.handlers.wsgi import WSGIHandler
+    phase('middleware', WSGIHandler)
+    if warmup:
+        from healthcare_appointment_system.warmup import warm_up
+        phases.update({f"warm_up.{step}": seconds for step, seconds in phase('warm_up', warm_up).items()})
+
+    from django.test import Client
+    settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+    client = Client()
+    phase('first_request', lambda: client.get(path))
+    phase('second_request', lambda: client.get(path))
+    return phases
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--no-warmup', action='store_true')
+    parser.add_argument('--path', default='/clinics/')
+    options = parser.parse_args()
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'healthcare_appointment_system.settings')
+    print(json.dumps(measure(not options.no_warmup, options.path)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,370 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import tracemalloc
+
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from users.models import User
+from . import memory
+from .management.commands.startup_profile import parse_importtime
+from .middleware import MemoryTrackingMiddleware, ProfilingMiddleware
+from .models import ProfileCapture
+from .profiling import collapsed_stacks, prune_captures
+from .queries import QueryRecorder, normalize, read_entries, report
+from .traffic import ClientTarget, body_shape, fill_placeholders, read_records, replay
+
+
+def leaf(n):
+    return sum(i * i for i in range(n))
+
+
+def branch():
+    return leaf(20000) + leaf(40000)
+
+
+class ProfilingTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.staff = User.objects.create_user(
+            phone_number='09124000001', password='securepassword',
+            first_name='Nima', last_name='Sadri', is_staff=True
+        )
+        self.patient = User.objects.create_user(
+            phone_number='09124000002', password='securepassword',
+            first_name='Ali', last_name='Karimi'
+        )
+
+    def settings(self, **kwargs):
+        return override_settings(PROFILING_DIR=self.directory, **kwargs)
+
+    def test_collapsed_stacks_follow_the_call_graph(self):
+        profiler = cProfile.Profile()
+        profiler.runcall(branch)
+        stacks = collapsed_stacks(pstats.Stats(profiler))
+        leaves = [stack for stack in stacks if 'branch' in stack and stack.split(';')[-1].startswith('<genexpr>')]
+        self.assertTrue(leaves)
+        self.assertTrue(all(';leaf_(tests.py' in stack for stack in leaves))
+        total = sum(stacks.values())
+        self.assertGreater(sum(stacks[stack] for stack in leaves), total / 2)
+
+    def test_disabled_middleware_is_not_loaded(self):
+        with self.settings(PROFILING_SAMPLE_RATE=0, PROFILING_ON_DEMAND=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
+
+    def test_staff_profiles_on_demand(self):
+        with self.settings(PROFILING_ON_DEMAND=True):
+            client = Client()
+            token = AccessToken.for_user(self.staff)
+            response = client.get('/clinics/', HTTP_X_PROFILE='1', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        capture = ProfileCapture.objects.get(pk=response['X-Profile-Id'])
+        self.assertEqual(capture.trigger, ProfileCapture.Trigger.ON_DEMAND)
+        self.assertEqual(capture.view, 'appointments.views.ClinicViewSet')
+        self.assertEqual(capture.action, 'list')
+        self.assertEqual(capture.path, '/clinics/')
+        with open(os.path.join(self.directory, capture.stacks_file)) as file:
+            self.assertIn('list_(views.py:', file.read())
+        pstats.Stats(os.path.join(self.directory, capture.stats_file))
+
+    def test_header_ignored_for_non_staff(self):
+        with self.settings(PROFILING_ON_DEMAND=True):
+            client = Client()
+            client.force_login(self.patient)
+            response = client.get('/clinics/', HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertFalse(ProfileCapture.objects.exists())
+
+    def test_sampled_requests_and_admin_list(self):
+        with self.settings(PROFILING_SAMPLE_RATE=1):
+            client = Client()
+            client.force_login(self.patient)
+            client.get('/clinics/')
+        capture = ProfileCapture.objects.get()
+        self.assertEqual(capture.trigger, ProfileCapture.Trigger.SAMPLED)
+        self.assertEqual(capture.user, self.patient)
+
+        with self.settings():
+            client = Client()
+            client.force_login(self.staff)
+            self.staff.is_superuser = True
+            self.staff.save()
+            response = client.get('/admin/diagnostics/profilecapture/')
+            self.assertContains(response, '/clinics/')
+            download = client.get(f'/admin/diagnostics/profilecapture/{capture.pk}/download/stacks/')
+            self.assertEqual(download.status_code, 200)
+
+    def test_prune_removes_old_captures_and_files(self):
+        with self.settings(PROFILING_SAMPLE_RATE=1, PROFILING_MAX_CAPTURES=2):
+            client = Client()
+            client.force_login(self.patient)
+            for _ in range(3):
+                client.get('/clinics/')
+            self.assertEqual(ProfileCapture.objects.count(), 2)
+            self.assertEqual(len(os.listdir(self.directory)), 4)
+            prune_captures(keep=0)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class MemoryTrackingTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.staff = User.objects.create_user(
+            phone_number='09124000011', password='securepassword',
+            first_name='Nima', last_name='Sadri', is_staff=True
+        )
+        self.addCleanup(memory.request_peaks.clear)
+        self.addCleanup(memory.snapshots.clear)
+
+    def trace(self):
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+        memory.start()
+
+    def test_disabled_middleware_is_not_loaded(self):
+        with override_settings(TRACEMALLOC_ENABLED=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                MemoryTrackingMiddleware(lambda request: None)
+
+    def test_request_peaks_recorded_per_view(self):
+        self.trace()
+        with override_settings(TRACEMALLOC_ENABLED=True):
+            client = Client()
+            client.force_login(self.staff)
+            client.get('/appointments/')
+            client.get('/appointments/')
+            response = client.get('/diagnostics/memory/')
+        self.assertTrue(response.json()['tracing'])
+        rows = {row['view']: row for row in response.json()['requests']}
+        row = rows['appointments.views.AppointmentViewSet.list']
+        self.assertEqual(row['requests'], 2)
+        self.assertGreater(row['max_bytes'], 0)
+
+    def test_snapshot_diff(self):
+        client = Client()
+        client.force_login(self.staff)
+        self.assertEqual(client.post('/diagnostics/memory/snapshots/').status_code, 409)
+
+        self.trace()
+        first = client.post('/diagnostics/memory/snapshots/').json()['id']
+        grown = [bytearray(1024) for _ in range(500)]
+        second = client.post('/diagnostics/memory/snapshots/').json()['id']
+        response = client.get(f'/diagnostics/memory/snapshots/{first}/diff/{second}/', {'limit': 50})
+        self.assertEqual(response.status_code, 200)
+        sites = [site for site in response.json()['sites'] if site['site'][-1].startswith(__file__)]
+        self.assertGreaterEqual(sites[0]['size_diff'], 500 * 1024)
+        self.assertTrue(grown)
+
+        self.assertEqual(client.get(f'/diagnostics/memory/snapshots/{first}/diff/999/').status_code, 404)
+        self.assertEqual(
+            client.get(f'/diagnostics/memory/snapshots/{first}/diff/{second}/', {'group_by': 'x'}).status_code, 400
+        )
+
+    def test_memory_endpoints_are_staff_only(self):
+        patient = User.objects.create_user(
+            phone_number='09124000012', password='securepassword', first_name='Ali', last_name='Karimi'
+        )
+        client = Client()
+        client.force_login(patient)
+        self.assertEqual(client.get('/diagnostics/memory/').status_code, 403)
+        self.assertEqual(client.post('/diagnostics/memory/snapshots/').status_code, 403)
+
+    def test_profile_endpoint(self):
+        report = memory.profile_endpoint('GET', '/appointments/', self.staff)
+        self.assertEqual(report['status'], 200)
+        self.assertGreater(report['peak_bytes'], 0)
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+class SlowQueryTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.log = os.path.join(directory, 'slow.jsonl')
+        self.staff = User.objects.create_user(
+            phone_number='09124000021', password='securepassword',
+            first_name='Nima', last_name='Sadri', is_staff=True
+        )
+
+    def test_normalize(self):
+        self.assertEqual(
+            normalize('SELECT "t1"."id" FROM "t1" WHERE "t1"."id" IN (%s, %s) AND "t1"."name" = \'x\'\'y\' LIMIT 21'),
+            'SELECT "t1"."id" FROM "t1" WHERE "t1"."id" IN (...) AND "t1"."name" = ? LIMIT ?'
+        )
+        self.assertEqual(normalize('INSERT INTO t (a) VALUES (%s), (%s), (%s)'), 'INSERT INTO t (a) VALUES (...)')
+
+    def test_slow_queries_attributed_to_view(self):
+        with override_settings(SLOW_QUERY_ENABLED=True, SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG=self.log):
+            client = Client()
+            client.force_login(self.staff)
+            client.get('/appointments/')
+        entries = [entry for entry in read_entries(self.log) if entry['view'] == 'appointments.views.AppointmentViewSet']
+        self.assertTrue(entries)
+        self.assertTrue(all(entry['kind'] == 'slow' and entry['action'] == 'list' for entry in entries))
+        self.assertTrue(any(frame.startswith('appointments/views.py:') for entry in entries for frame in entry['stack']))
+        self.assertFalse(any('diagnostics' in frame for entry in entries for frame in entry['stack']))
+
+    @override_settings(SLOW_QUERY_N_PLUS_ONE=3, SLOW_QUERY_THRESHOLD_MS=10_000,
+                       SLOW_QUERY_STACK_APPS=['diagnostics'])
+    def test_repeated_fingerprint_flagged_as_n_plus_one(self):
+        recorder = QueryRecorder('GET', '/loop/')
+        with connection.execute_wrapper(recorder):
+            for pk in range(5):
+                User.objects.filter(first_name=f'name-{pk}').exists()
+            User.objects.count()
+        with override_settings(SLOW_QUERY_LOG=self.log):
+            recorder.finish()
+        entries = list(read_entries(self.log))
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['kind'], 'n+1')
+        self.assertEqual(entries[0]['count'], 5)
+        self.assertIn('WHERE "users_user"."first_name" = ?', entries[0]['sql'])
+        self.assertTrue(entries[0]['stack'][-1].startswith('diagnostics/tests.py:'))
+
+    def test_report_command(self):
+        entry = {
+            'time': '2026-01-01T00:00:00+00:00', 'kind': 'slow', 'sql': 'SELECT ?', 'method': 'GET',
+            'path': '/clinics/', 'view': 'appointments.views.ClinicViewSet', 'action': 'list', 'stack': [],
+        }
+        with open(self.log, 'w') as file:
+            for fingerprint, duration in [('a', 5), ('b', 300), ('a', 7), ('b', 1)]:
+                file.write(json.dumps({**entry, 'fingerprint': fingerprint, 'duration_ms': duration}) + '\n')
+        rows = report(read_entries(self.log))
+        self.assertEqual([(row['fingerprint'], row['total_ms'], row['max_ms']) for row in rows],
+                         [('b', 301, 300), ('a', 12, 7)])
+        self.assertEqual(rows[0]['views'], ['appointments.views.ClinicViewSet.list'])
+
+        out = io.StringIO()
+        call_command('slow_queries', '--json', '--top', '1', '--log', self.log, stdout=out)
+        self.assertEqual([row['fingerprint'] for row in json.loads(out.getvalue())], ['b'])
+        out = io.StringIO()
+        call_command('slow_queries', '--since', '2027-01-01', '--log', self.log, stdout=out)
+        self.assertIn('No slow queries logged.', out.getvalue())
+
+
+class TrafficTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.file = os.path.join(directory, 'traffic.jsonl')
+        self.patient = User.objects.create_user(
+            phone_number='09124000031', password='securepassword', first_name='Ali', last_name='Karimi'
+        )
+
+    def test_body_shape(self):
+        shape = body_shape(
+            {'availability': 3, 'selected_time': '10:10', 'name': 'Ali', 'tags': ['a', 'bc'], 'ok': True},
+            keep={'selected_time'}
+        )
+        self.assertEqual(shape, {
+            'availability': 3, 'selected_time': '10:10', 'name': '<str:3>', 'tags': ['<str:1>', '<str:2>'],
+            'ok': True,
+        })
+        self.assertEqual(fill_placeholders(shape)['name'], 'xxx')
+
+    def test_capture_is_sanitized(self):
+        with override_settings(TRAFFIC_CAPTURE_ENABLED=True, TRAFFIC_CAPTURE_FILE=self.file):
+            client = Client()
+            client.force_login(self.patient)
+            client.post('/clinics/?fields=id&phone_number=09124000031',
+                        {'name': 'Central', 'address': 'Main street 5'}, content_type='application/json')
+            client.get('/diagnostics/metrics/')
+        records = read_records(self.file)
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertEqual(record['method'], 'POST')
+        self.assertEqual(record['path'], '/clinics/')
+        self.assertEqual(record['query'], {'fields': ['id'], 'phone_number': ['***']})
+        self.assertEqual(record['body'], {'name': '<str:7>', 'address': '<str:13>'})
+        self.assertEqual(record['role'], 'patient')
+        self.assertEqual((record['view'], record['action']), ('appointments.views.ClinicViewSet', 'create'))
+        self.assertEqual(record['status'], 403)
+        self.assertNotIn('09124000031', json.dumps(record))
+
+    def test_uploads_are_left_to_the_view(self):
+        admin = User.objects.create_superuser(
+            phone_number='09124000032', password='securepassword', first_name='Admin', last_name='User'
+        )
+        upload = SimpleUploadedFile('photo.png', b'\x89PNG' + b'0' * 8192, content_type='image/png')
+        with override_settings(TRAFFIC_CAPTURE_ENABLED=True, TRAFFIC_CAPTURE_FILE=self.file,
+                               DATA_UPLOAD_MAX_MEMORY_SIZE=4096):
+            client = Client()
+            client.force_login(admin)
+            response = client.post('/clinics/', {'name': 'Central', 'address': 'Main street 5', 'photo': upload})
+        self.assertEqual(response.status_code, 201, response.content)
+        [record] = read_records(self.file)
+        self.assertIsNone(record['body'])
+        self.assertTrue(record['content_type'].startswith('multipart/form-data'))
+
+    def test_client_target_rebuilds_requests(self):
+        target = ClientTarget({'patient': self.patient})
+        record = {'method': 'GET', 'path': '/sync/', 'query': {'limit': ['1']}, 'role': 'patient', 'body': None}
+        self.assertEqual(target.send(record), 200)
+        self.assertEqual(target.send({**record, 'role': 'anonymous'}), 401)
+
+    def test_replay_reports_per_endpoint(self):
+        class Target:
+            sent = []
+
+            def send(self, record):
+                self.sent.append(record['path'])
+                if record['path'] == '/boom/':
+                    raise ConnectionResetError
+                return record['status']
+
+        records = [
+            {'at': 100.0 + index / 100, 'method': 'GET', 'path': path, 'status': status,
+             'view': view, 'action': action}
+            for index, (path, status, view, action) in enumerate([
+                ('/clinics/1/', 200, 'appointments.views.ClinicViewSet', 'retrieve'),
+                ('/clinics/2/', 404, 'appointments.views.ClinicViewSet', 'retrieve'),
+                ('/clinics/3/', 500, 'appointments.views.ClinicViewSet', 'retrieve'),
+                ('/clinics/4/', 200, 'appointments.views.ClinicViewSet', 'retrieve'),
+                ('/boom/', 200, '', ''),
+            ])
+        ]
+        result = replay(records, Target(), speed=2, concurrency=2)
+        self.assertEqual(result['requests'], 5)
+        self.assertGreaterEqual(result['elapsed_s'], 0.02)
+        rows = {row['endpoint']: row for row in result['endpoints']}
+        self.assertEqual(rows['GET ClinicViewSet.retrieve']['requests'], 4)
+        self.assertEqual(rows['GET ClinicViewSet.retrieve']['error_rate'], 0.25)
+        self.assertEqual(rows['GET ClinicViewSet.retrieve']['client_error_rate'], 0.25)
+        self.assertEqual(rows['GET /boom/']['error_rate'], 1.0)
+
+    def test_replay_command_requires_records(self):
+        with self.assertRaisesMessage(Exception, 'No records to replay.'):
+            call_command('replay', self.file)
+
+
+class StartupProfileTests(TestCase):
+    databases = '__all__'
+
+    def test_parse_importtime(self):
+        output = "\n".join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       120 |        120 |     _io',
+            'import time:      2000 |       2500 |   django.utils',
+            'import time:       900 |       3400 | django',
+            'noise',
+        ])
+        self.assertEqual(parse_importtime(output), [
+            ('_io', 120, 120, 2), ('django.utils', 2000, 2500, 1), ('django', 900, 3400, 0),
+        ])
@@ -0,0 +1,253 @@
+'''Recorded traffic: sanitized request records and their replay.
+
+``TrafficCaptureMiddleware`` appends one record per request to
+``TRAFFIC_CAPTURE_FILE``::
+
+    {"at": 1760000000.25, "method": "POST", "path": "/appointments/",
+     "query": {"fields": ["id"]}, "content_type": "application/json",
+     "body": {"availability": 12, "selected_time": "10:10", "notes": "<str:14>"},
+     "role": "patient", "view": "appointments.views.AppointmentViewSet",
+     "action": "create", "status": 201, "duration_ms": 23.1}
+
+Bodies keep their shape only: numbers, booleans and the fields listed in
+``TRAFFIC_CAPTURE_KEEP_FIELDS`` keep their value, other strings become a
+``<str:length>`` placeholder. Query values are kept except the parameters in
+``TRAFFIC_CAPTURE_REDACT_PARAMS``. ``manage.py replay`` sends the records
+again and reports latency percentiles and error rates per endpoint.
+'''
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request as URLRequest, urlopen
+
+from django.conf import settings
+from django.test import Client
+
+from .logfiles import append_jsonl, read_jsonl
+
+PLACEHOLDER = re.compile(r'^<str:(\d+)>$')
+NUMERIC_SEGMENT = re.compile(r'/\d+(?=/|$)')
+MAX_BODY_BYTES = 64 * 1024
+
+
+def body_shape(value, keep=(), key=None):
+    '''Strip personal data from a parsed JSON body, keeping its structure.'''
+    if isinstance(value, dict):
+        return {name: body_shape(item, keep, name) for name, item in value.items()}
+    if isinstance(value, list):
+        return [body_shape(item, keep, key) for item in value]
+    if isinstance(value, str) and key not in keep:
+        return f"<str:{len(value)}>"
+    return value
+
+
+def sanitize_query(query, redact=()):
+    return {name: ['***'] if name in redact else values for name, values in query.lists()}
+
+
+def has_captured_body(request):
+    '''Whether the body of ``request`` is recorded: JSON of at most ``MAX_BODY_BYTES``.
+
+    Any other body (a photo upload, say) is never read, so its stream is
+    left to the view untouched.
+    '''
+    if request.method in ('GET', 'HEAD', 'OPTIONS') or request.content_type != 'application/json':
+        return False
+    try:
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return False
+    return 0 < length <= MAX_BODY_BYTES
+
+
+def capture_record(request, response, duration, view='', action='', role=''):
+    '''Build the sanitized record of one request.'''
+    content_type = request.content_type or ''
+    body = None
+    if has_captured_body(request):
+        raw = request.body
+        if raw:
+            try:
+                body = body_shape(json.loads(raw), set(settings.TRAFFIC_CAPTURE_KEEP_FIELDS))
+            except ValueError:
+                body = None
+    return {
+        'at': round(time.time() - duration, 6),
+        'method': request.method,
+        'path': request.path,
+        'query': sanitize_query(request.GET, set(settings.TRAFFIC_CAPTURE_REDACT_PARAMS)),
+        'content_type': content_type,
+        'body': body,
+        'role': role,
+        'view': view,
+        'action': action,
+        'status': response.status_code,
+        'duration_ms': round(duration * 1000, 3),
+    }
+
+
+def write_records(records, path=None):
+    append_jsonl(path or settings.TRAFFIC_CAPTURE_FILE, records)
+
+
+def read_records(path=None):
+    return list(read_jsonl(path or settings.TRAFFIC_CAPTURE_FILE))
+
+
+def fill_placeholders(value):
+    '''Turn a captured body shape back into a sendable body.'''
+    if isinstance(value, dict):
+        return {name: fill_placeholders(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [fill_placeholders(item) for item in value]
+    if isinstance(value, str):
+        match = PLACEHOLDER.match(value)
+        if match:
+            return 'x' * int(match.group(1))
+    return value
+
+
+def endpoint(record):
+    '''Report key of a record: the view and action, or the path with ids folded.'''
+    if record.get('view'):
+        name = record['view'].rsplit('.', 1)[-1]
+        return f"{record['method']} {name}.{record['action']}" if record.get('action') else f"{record['method']} {name}"
+    return f"{record['method']} {NUMERIC_SEGMENT.sub('/{id}', record['path'])}"
+
+
+class ClientTarget:
+    '''Replay through the Django test client, logged in as one user per role.'''
+
+    def __init__(self, users):
+        self.users = users
+        self.local = threading.local()
+
+    def client(self, role):
+        clients = getattr(self.local, 'clients', None)
+        if clients is None:
+            clients = self.local.clients = {}
+        if role not in clients:
+            client = Client()
+            if self.users.get(role) is not None:
+                client.force_login(self.users[role])
+            clients[role] = client
+        return clients[role]
+
+    def send(self, record):
+        body = record.get('body')
+        data = json.dumps(fill_placeholders(body)) if body is not None else ''
+        path = record['path']
+        if record.get('query'):
+            path = f"{path}?{urlencode(record['query'], doseq=True)}"
+        response = self.client(record.get('role', '')).generic(
+            record['method'], path, data, content_type=record.get('content_type') or 'application/json'
+        )
+        if getattr(response, 'streaming', False):
+            for _ in response.streaming_content:
+                pass
+        return response.status_code
+
+
+class ServerTarget:
+    '''Replay over HTTP against a running server, with a bearer token per role.'''
+
+    def __init__(self, base_url, tokens, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.tokens = tokens
+        self.timeout = timeout
+
+    def send(self, record):
+        url = self.base_url + record['path']
+        if record.get('query'):
+            url = f"{url}?{urlencode(record['query'], doseq=True)}"
+        body = record.get('body')
+        data = json.dumps(fill_placeholders(body)).encode() if body is not None else None
+        headers = {'Content-Type': record.get('content_type') or 'application/json'}
+        if self.tokens.get(record.get('role')):
+            headers['Authorization'] = f"Bearer {self.tokens[record['role']]}"
+        try:
+            with urlopen(URLRequest(url, data=data, headers=headers, method=record['method']),
+                         timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except HTTPError as error:
+            return error.code
+
+
+def percentile(values, fraction):
+    '''Nearest-rank percentile of sorted ``values``.'''
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(fraction * len(values) + 0.5) - 1))]
+
+
+def replay(records, target, speed=1.0, concurrency=4):
+    '''Send ``records`` to ``target`` and return per-endpoint results.
+
+    With ``speed`` > 0 records are sent at their recorded offsets divided by
+    ``speed`` (2 replays twice as fast); 0 sends them as fast as the
+    ``concurrency`` workers allow. ``lag_ms`` is how late the most delayed
+    record was sent, i.e. whether the target (or the worker pool) kept up.
+    '''
+    records = sorted(records, key=lambda record: record['at'])
+    results = defaultdict(list)
+    lock = threading.Lock()
+    lag = [0.0]
+
+    def send(record, due):
+        started = time.perf_counter()
+        lag_seconds = started - due if due is not None else 0
+        try:
+            status = target.send(record)
+        except Exception as error:
+            # connection errors, timeouts, exceptions raised by the view
+            status = type(error).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            results[endpoint(record)].append((elapsed, status))
+            lag[0] = max(lag[0], lag_seconds)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        first = records[0]['at'] if records else 0
+        for record in records:
+            due = None
+            if speed > 0:
+                due = started + (record['at'] - first) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(send, record, due)
+    return summarize(results, time.perf_counter() - started, lag[0])
+
+
+def summarize(results, elapsed, lag):
+    endpoints = []
+    for name, samples in sorted(results.items()):
+        latencies = sorted(elapsed * 1000 for elapsed, _ in samples)
+        statuses = [status for _, status in samples]
+        errors = sum(1 for status in statuses if not isinstance(status, int) or status >= 500)
+        client_errors = sum(1 for status in statuses if isinstance(status, int) and 400 <= status < 500)
+        endpoints.append({
+            'endpoint': name,
+            'requests': len(samples),
+            'error_rate': round(errors / len(samples), 4),
+            'client_error_rate': round(client_errors / len(samples), 4),
+            'p50_ms': round(percentile(latencies, 0.5), 3),
+            'p90_ms': round(percentile(latencies, 0.9), 3),
+            'p99_ms': round(percentile(latencies, 0.99), 3),
+            'max_ms': round(latencies[-1], 3),
+        })
+    total = sum(row['requests'] for row in endpoints)
+    return {
+        'requests': total,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_rps': round(total / elapsed, 1) if elapsed else None,
+        'lag_ms': round(lag * 1000, 3),
+        'endpoints': endpoints,
+    }
@@ -0,0 +1,13 @@
+from django.urls import path
+from .views import MetricsAPIView, MemoryAPIView, MemorySnapshotAPIView, MemorySnapshotDiffAPIView
+
+
+urlpatterns = [
+    path('diagnostics/metrics/', MetricsAPIView.as_view(), name='metrics'),
+    path('diagnostics/memory/', MemoryAPIView.as_view(), name='memory'),
+    path('diagnostics/memory/snapshots/', MemorySnapshotAPIView.as_view(), name='memory-snapshots'),
+    path(
+        'diagnostics/memory/snapshots/<int:first>/diff/<int:second>/',
+        MemorySnapshotDiffAPIView.as_view(), name='memory-snapshot-diff'
+    ),
+]
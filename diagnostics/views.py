@@ -0,0 +1,80 @@
+import tracemalloc
+
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from healthcare_appointment_system.apidocs import swagger_auto_schema
+from . import memory, metrics
+from .serializers import SnapshotDiffQuerySerializer
+
+
+class MetricsAPIView(APIView):
+    '''Current values of the registered operational metrics.'''
+
+    permission_classes = [IsAdminUser, IsAuthenticated]
+
+    @swagger_auto_schema(operation_description=_('Current values of the operational metrics.'))
+    def get(self, request):
+        '''Collect every registered metric.'''
+        return Response(metrics.collect(), status=status.HTTP_200_OK)
+
+
+def not_tracing():
+    return Response(
+        {'error': _('tracemalloc is not tracing in this process; set TRACEMALLOC_ENABLED=True.')},
+        status=status.HTTP_409_CONFLICT
+    )
+
+
+class MemoryAPIView(APIView):
+    '''Traced memory, per-view request peaks and stored snapshots of this process.'''
+
+    permission_classes = [IsAdminUser, IsAuthenticated]
+
+    @swagger_auto_schema(operation_description=_('Traced memory and per-view peak allocation of requests.'))
+    def get(self, request):
+        '''Return the allocation overview.'''
+        tracing = tracemalloc.is_tracing()
+        traced, peak = tracemalloc.get_traced_memory() if tracing else (None, None)
+        return Response({
+            'tracing': tracing,
+            'traced_bytes': traced,
+            'peak_bytes': peak,
+            'requests': memory.request_peaks.rows(),
+            'snapshots': memory.snapshots.records(),
+        }, status=status.HTTP_200_OK)
+
+
+class MemorySnapshotAPIView(APIView):
+    '''Take a tracemalloc snapshot to diff against later.'''
+
+    permission_classes = [IsAdminUser, IsAuthenticated]
+
+    @swagger_auto_schema(operation_description=_('Take a snapshot of the traced allocations.'))
+    def post(self, request):
+        '''Take a snapshot.'''
+        if not tracemalloc.is_tracing():
+            return not_tracing()
+        return Response(memory.snapshots.take(), status=status.HTTP_201_CREATED)
+
+
+class MemorySnapshotDiffAPIView(APIView):
+    '''Allocation sites that grew between two snapshots.'''
+
+    permission_classes = [IsAdminUser, IsAuthenticated]
+
+    @swagger_auto_schema(
+        query_serializer=SnapshotDiffQuerySerializer,
+        operation_description=_('Top allocation sites by growth from the first snapshot to the second.')
+    )
+    def get(self, request, first, second):
+        '''Diff two snapshots.'''
+        query = SnapshotDiffQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        older, newer = memory.snapshots.get(first), memory.snapshots.get(second)
+        if older is None or newer is None:
+            return Response({'error': _('Snapshot not found.')}, status=status.HTTP_404_NOT_FOUND)
+        sites = memory.diff(older, newer, query.validated_data['group_by'], query.validated_data['limit'])
+        return Response({'first': first, 'second': second, 'sites': sites}, status=status.HTTP_200_OK)
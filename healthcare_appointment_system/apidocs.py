@@ -0,0 +1,206 @@
+'''Lazily loaded drf_yasg.
+
+Importing anything from ``drf_yasg`` pulls in ``pkg_resources`` and the
+schema inspectors, a noticeable part of a worker's start-up. Views import
+``swagger_auto_schema`` and ``openapi`` from here instead:
+
+* ``openapi.Schema(...)``, ``openapi.TYPE_STRING``... are recorded as
+  deferred calls/attributes;
+* ``swagger_auto_schema(...)`` records the decorated method and its
+  arguments and returns the method unchanged.
+
+``load()`` imports drf_yasg, resolves the deferred values and applies the
+recorded decorators. The documentation views returned by
+``get_schema_view`` call it on their first request, so with
+``API_DOCS_ENABLED`` off (no documentation routes) drf_yasg is never
+imported at all. The schema document is prebuilt per language with
+``manage.py build_schema`` and served from memory with an ETag.
+'''
+import hashlib
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils import translation
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.views.decorators.http import require_safe
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_pending = []
+_loaded = False
+
+
+class Deferred:
+    '''``drf_yasg.openapi.<name>``, optionally called with arguments.'''
+
+    def __init__(self, name, args=None, kwargs=None):
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+
+    def __call__(self, *args, **kwargs):
+        return Deferred(self.name, args, kwargs)
+
+    def __repr__(self):
+        return f"<deferred openapi.{self.name}>"
+
+    def resolve(self):
+        from drf_yasg import openapi as real_openapi
+        value = getattr(real_openapi, self.name)
+        if self.args is None:
+            return value
+        return value(*resolve(self.args), **resolve(self.kwargs))
+
+
+class DeferredModule:
+    '''Stand-in for ``drf_yasg.openapi`` whose attributes are ``Deferred``.'''
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Deferred(name)
+
+
+openapi = DeferredModule()
+
+
+def resolve(value):
+    '''Replace every ``Deferred`` inside ``value`` with the real drf_yasg object.'''
+    if isinstance(value, Deferred):
+        return value.resolve()
+    if isinstance(value, dict):
+        return {key: resolve(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return type(value)(resolve(item) for item in value)
+    return value
+
+
+def swagger_auto_schema(**kwargs):
+    '''``drf_yasg.utils.swagger_auto_schema``, applied when drf_yasg is loaded.'''
+    def decorator(view_method):
+        with _lock:
+            if not _loaded:
+                _pending.append((view_method, kwargs))
+                return view_method
+        from drf_yasg.utils import swagger_auto_schema as real_decorator
+        return real_decorator(**resolve(kwargs))(view_method)
+    return decorator
+
+
+def is_loaded():
+    return _loaded
+
+
+def load():
+    '''Import drf_yasg and apply every recorded ``swagger_auto_schema``.'''
+    global _loaded
+    with _lock:
+        if _loaded:
+            return
+        from drf_yasg.utils import swagger_auto_schema as real_decorator
+        for view_method, kwargs in _pending:
+            real_decorator(**resolve(kwargs))(view_method)
+        _pending.clear()
+        _loaded = True
+
+
+class LazySchemaView:
+    '''``drf_yasg.views.get_schema_view(...)`` built on the first request.
+
+    The schema document itself is not generated per request: ``document``
+    serves the artifact written by ``manage.py build_schema`` for the
+    request's language (``API_SCHEMA_DIR/openapi.<language>.json``), or
+    generates it once when there is none, and keeps it in memory with its
+    ETag.
+    '''
+
+    def __init__(self, info, kwargs):
+        self.info = info
+        self.kwargs = kwargs
+        self._schema_view = None
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    def schema_view(self):
+        if self._schema_view is None:
+            load()
+            from drf_yasg.views import get_schema_view as real_get_schema_view
+            self._info = resolve(self.info)
+            self._schema_view = real_get_schema_view(self._info, **resolve(self.kwargs))
+        return self._schema_view
+
+    def generate(self, language):
+        '''Introspect every view and return the schema as JSON bytes in ``language``.'''
+        from drf_yasg.codecs import OpenAPICodecJson
+        schema_view = self.schema_view()
+        with translation.override(language):
+            generator = schema_view.generator_class(self._info)
+            return OpenAPICodecJson(validators=[]).encode(generator.get_schema(request=None, public=True))
+
+    def document(self, language):
+        '''Return ``(etag, content)`` of the schema in ``language``.'''
+        document = self._documents.get(language)
+        if document is None:
+            with self._lock:
+                document = self._documents.get(language)
+                if document is None:
+                    try:
+                        with open(schema_path(language), 'rb') as file:
+                            content = file.read()
+                    except FileNotFoundError:
+                        logger.warning("No prebuilt API schema for %r; run manage.py build_schema.", language)
+                        content = self.generate(language)
+                    etag = '"%s"' % hashlib.sha256(content).hexdigest()[:32]
+                    document = self._documents[language] = (etag, content)
+        return document
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+
+    def serve_document(self, request):
+        etag, content = self.document(schema_language(getattr(request, 'LANGUAGE_CODE', None)))
+        response = HttpResponse(content, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=settings.API_SCHEMA_MAX_AGE)
+        return get_conditional_response(request, etag=etag, response=response)
+
+    def without_ui(self, cache_timeout=0, cache_kwargs=None):
+        '''The schema document (JSON), served from the prebuilt artifact.'''
+        return require_safe(self.serve_document)
+
+    def with_ui(self, renderer='swagger', cache_timeout=0, cache_kwargs=None):
+        '''The documentation page; its ``?format=openapi`` spec request gets the prebuilt document.'''
+        view = None
+
+        def lazy_view(request, *args, **kwargs):
+            nonlocal view
+            if request.GET.get('format') == 'openapi':
+                return self.serve_document(request)
+            if view is None:
+                # the page itself is rendered without introspecting any view
+                view = self.schema_view().with_ui(renderer, cache_timeout, cache_kwargs)
+            return view(request, *args, **kwargs)
+        lazy_view.csrf_exempt = True
+        return lazy_view
+
+
+def schema_language(code):
+    '''The ``LANGUAGES`` entry serving ``code`` (``fa-ir`` -> ``fa``).'''
+    try:
+        return translation.get_supported_language_variant(code or settings.LANGUAGE_CODE)
+    except LookupError:
+        return settings.LANGUAGES[0][0]
+
+
+def schema_path(language):
+    return os.path.join(settings.API_SCHEMA_DIR, f"openapi.{language}.json")
+
+
+def get_schema_view(info=None, **kwargs):
+    '''``drf_yasg.views.get_schema_view`` that imports drf_yasg on first use.'''
+    return LazySchemaView(info, kwargs)
@@ -14,3 +14,16 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'healthcare_appointment_system.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.WARMUP_ON_START:
+    from healthcare_appointment_system.warmup import warm_up
+
+    warm_up()
+
+# Live slot streams (/availabilities/live/) are served from ASGI processes;
+# start receiving slot changes published by the other processes.
+from appointments.live import get_broker  # noqa: E402
+
+get_broker().start()
@@ -0,0 +1,144 @@
+'''Sparse fieldsets (``?fields=``) and expansion (``?expand=``) for serializers.
+
+Both parameters take comma separated, dotted paths::
+
+    /appointments/?fields=id,selected_time,availability.start_time&expand=patient
+
+Once either parameter is given, nested objects that are not expanded (by
+``expand`` or by a dotted path in ``fields``) are rendered as their primary
+key; without them the serializer output is unchanged. Querysets handed to a
+``many=True`` serializer are narrowed with ``select_related``/``defer`` to
+the joins and columns that are actually rendered.
+'''
+from django.db.models import QuerySet
+from .apidocs import openapi
+from rest_framework import serializers
+
+SPARSE_PARAMETERS = [
+    openapi.Parameter(
+        'fields', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+        description='Comma separated (dotted) field paths to return, e.g. `id,availability.start_time`.',
+    ),
+    openapi.Parameter(
+        'expand', openapi.IN_QUERY, type=openapi.TYPE_STRING,
+        description='Comma separated (dotted) nested objects to return in full; the others are returned as IDs.',
+    ),
+]
+
+
+def sparse_fieldset(request):
+    '''Return the ``fields``/``expand`` serializer kwargs of a request, or ``{}``.'''
+    if request is None:
+        # schema generation without a request (manage.py build_schema)
+        return {}
+    params = request.query_params
+    if 'fields' not in params and 'expand' not in params:
+        return {}
+    return {'fields': params.get('fields', ''), 'expand': params.get('expand', '')}
+
+
+def parse_paths(value):
+    '''Turn ``'a,b.c,b.d'`` into the tree ``{'a': {}, 'b': {'c': {}, 'd': {}}}``.'''
+    if isinstance(value, str):
+        value = value.split(',')
+    tree = {}
+    for path in value or ():
+        node = tree
+        for name in filter(None, (part.strip() for part in path.split('.'))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def collapse(name, field):
+    '''Replace a nested serializer with the primary key(s) of the related object(s).'''
+    kwargs = {'source': field.source} if field.source != name else {}
+    many = isinstance(field, serializers.ListSerializer)
+    return serializers.PrimaryKeyRelatedField(read_only=True, many=many, **kwargs)
+
+
+def prune(fields, only, expand):
+    '''Drop unrequested ``fields`` and collapse unexpanded nested serializers, recursively.'''
+    for name in list(fields):
+        if only and name not in only:
+            del fields[name]
+            continue
+        field = fields[name]
+        nested = field.child if isinstance(field, serializers.ListSerializer) else field
+        if not isinstance(nested, serializers.BaseSerializer):
+            continue
+        if only.get(name) or name in expand:
+            prune(nested.fields, only.get(name) or {}, expand.get(name) or {})
+        else:
+            fields[name] = collapse(name, field)
+
+
+def narrow_queryset(queryset, serializer):
+    '''Join and load only what ``serializer`` renders.
+
+    Columns read by fields with ``source='*'`` (method fields) cannot be
+    guessed; serializers list them in a ``sparse_sources`` mapping of field
+    name to model field paths (``'clinic__name'`` also joins ``clinic``),
+    otherwise the whole row is loaded.
+    '''
+    relations, deferred = [], []
+    _collect(serializer, queryset.model, '', relations, deferred)
+    if relations:
+        queryset = queryset.select_related(*relations)
+    return queryset.defer(*deferred) if deferred else queryset
+
+
+def _collect(serializer, model, prefix, relations, deferred):
+    needed, whole_row = set(), False
+    sources = getattr(serializer, 'sparse_sources', {})
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source == '*':
+            if name not in sources:
+                whole_row = True
+            for path in sources.get(name, ()):
+                parts = path.split('__')
+                needed.add(parts[0])
+                if len(parts) > 1:
+                    relations.append(prefix + '__'.join(parts[:-1]))
+            continue
+        column = field.source_attrs[0]
+        needed.add(column)
+        if isinstance(field, serializers.ListSerializer):
+            continue
+        if isinstance(field, serializers.BaseSerializer) and len(field.source_attrs) == 1:
+            relations.append(prefix + column)
+            _collect(field, model._meta.get_field(column).related_model, f"{prefix}{column}__",
+                     relations, deferred)
+    if whole_row:
+        return
+    for model_field in model._meta.concrete_fields:
+        if not model_field.primary_key and model_field.name not in needed:
+            deferred.append(prefix + model_field.name)
+
+
+class SparseFieldsetMixin:
+    '''Serializer mixin adding the ``fields`` and ``expand`` keyword arguments.'''
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sparse = None
+        if fields is not None or expand is not None:
+            self.sparse = (parse_paths(fields), parse_paths(expand))
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        serializer = super().many_init(*args, **kwargs)
+        if isinstance(serializer.instance, QuerySet):
+            serializer.instance = serializer.child.narrow_queryset(serializer.instance)
+        return serializer
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.sparse is not None:
+            prune(fields, *self.sparse)
+        return fields
+
+    def narrow_queryset(self, queryset):
+        '''Return ``queryset`` limited to the joins and columns this serializer renders.'''
+        return narrow_queryset(queryset, self)
@@ -0,0 +1,47 @@
+'''Paginator that does not ``COUNT(*)`` large tables.
+
+On PostgreSQL a count is a full scan of the table (or of an index). For an
+unfiltered queryset the planner's estimate in ``pg_class.reltuples`` is
+read instead, once the table holds at least ``ESTIMATED_COUNT_THRESHOLD``
+rows; filtered querysets, small tables and other databases are counted
+exactly.
+'''
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+def estimated_count(queryset):
+    '''The planner's row estimate of an unfiltered ``queryset``, or ``None``.'''
+    connection = connections[queryset.db]
+    query = queryset.query
+    if connection.vendor != 'postgresql':
+        return None
+    if query.where or query.distinct or query.is_sliced or query.combinator:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)',
+            [connection.ops.quote_name(queryset.model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    # -1 until the table is first vacuumed or analyzed
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    '''``Paginator`` whose ``count`` is estimated for large, unfiltered tables.
+
+    The last pages may come out short or empty when the estimate is off;
+    filtering the list always gives exact numbers.
+    '''
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            estimate = estimated_count(self.object_list)
+            if estimate is not None and estimate >= settings.ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
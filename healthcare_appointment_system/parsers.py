@@ -0,0 +1,29 @@
+'''JSON parser backed by orjson, with the stdlib ``json`` as fallback.'''
+import codecs
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from .renderers import ORJSONRenderer, orjson
+
+
+class ORJSONParser(JSONParser):
+    '''Parse ``application/json`` request bodies with orjson when it is installed.
+
+    orjson only reads UTF-8 and always rejects ``NaN``/``Infinity``, so other
+    encodings and the non-strict mode are left to ``JSONParser``.
+    '''
+
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
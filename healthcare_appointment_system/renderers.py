@@ -0,0 +1,44 @@
+'''JSON renderer backed by orjson, with the stdlib ``json`` as fallback.
+
+Select it in ``REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES']``. Output is the
+same as DRF's ``JSONRenderer`` in compact mode: anything orjson cannot
+serialize natively (lazy translation strings, ``Decimal``, timezone-aware
+datetimes, querysets...) goes through DRF's own ``JSONEncoder.default``,
+so dates keep the ``Z`` suffix and UUIDs render as plain strings.
+'''
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ORJSONRenderer(JSONRenderer):
+    '''Render responses with orjson when it is installed.
+
+    Pretty printed (``indent``), ASCII-only and non-compact output are left
+    to the stdlib implementation, as is any payload orjson rejects.
+    '''
+
+    def orjson_options(self):
+        # datetimes go through DRF's encoder so the output matches JSONRenderer
+        return orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.orjson_options())
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Same strict javascript subset guarantee as JSONRenderer.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -47,15 +47,23 @@ DJANGO_DEFAULT_APPS = [
     'django.contrib.staticfiles',
 ]
 
+# API documentation (/swagger/, /redoc/); without it drf_yasg is never imported
+API_DOCS_ENABLED = os.environ.get('API_DOCS_ENABLED', 'True') == 'True'
+
 THIRD_PARTY_APPS = [
     'rest_framework',
     'rest_framework_simplejwt.token_blacklist',
-    'drf_yasg',
 ]
+if API_DOCS_ENABLED:
+    THIRD_PARTY_APPS.append('drf_yasg')
 
 LOCAL_APPS = [
     'users.apps.UsersConfig',
     'appointments.apps.AppointmentsConfig',
+    'analytics.apps.AnalyticsConfig',
+    'diagnostics.apps.DiagnosticsConfig',
+    'sync.apps.SyncConfig',
+    'sharding.apps.ShardingConfig',
 ]
 
 INSTALLED_APPS = DJANGO_DEFAULT_APPS + THIRD_PARTY_APPS + LOCAL_APPS
@@ -69,6 +77,10 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
+    'diagnostics.middleware.ProfilingMiddleware',
+    'diagnostics.middleware.MemoryTrackingMiddleware',
+    'diagnostics.middleware.SlowQueryMiddleware',
+    'diagnostics.middleware.TrafficCaptureMiddleware',
 ]
 
 ROOT_URLCONF = 'healthcare_appointment_system.urls'
@@ -128,7 +140,17 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
-    ]
+    ],
+    # orjson-backed JSON, falls back to the stdlib when orjson is not installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'healthcare_appointment_system.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'healthcare_appointment_system.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 SIMPLE_JWT = {
@@ -172,3 +194,146 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # media url
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
+
+# runtime artifacts (outbox files, profiles, captures, ...)
+VAR_DIR = BASE_DIR / 'var'
+
+# photo thumbnails
+PHOTO_THUMBNAIL_SIZES = {
+    'small': (96, 96),
+    'medium': (256, 256),
+}
+PHOTO_THUMBNAIL_DEFAULT = 'small'
+PHOTO_THUMBNAIL_WORKERS = int(os.environ.get('PHOTO_THUMBNAIL_WORKERS', 2))
+PHOTO_THUMBNAIL_ASYNC = os.environ.get('PHOTO_THUMBNAIL_ASYNC', 'True') == 'True'
+# thumbnail names are content hashed: whatever serves MEDIA_URL in production
+# (web server or storage object metadata) should send
+# "Cache-Control: public, max-age=<this>, immutable" for MEDIA_URL/thumbnails/;
+# the development view (DEBUG only) sends it itself
+PHOTO_THUMBNAIL_MAX_AGE = 60 * 60 * 24 * 365
+
+# appointment event outbox
+OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE', 100))
+OUTBOX_SINKS = [
+    {
+        'BACKEND': 'appointments.outbox.FileSink',
+        'OPTIONS': {'path': os.environ.get('OUTBOX_FILE', VAR_DIR / 'outbox.jsonl')},
+    },
+]
+if os.environ.get('OUTBOX_WEBHOOK_URL'):
+    OUTBOX_SINKS.append({
+        'BACKEND': 'appointments.outbox.WebhookSink',
+        'OPTIONS': {'url': os.environ['OUTBOX_WEBHOOK_URL']},
+    })
+
+# appointment reminders (lead times in minutes)
+REMINDER_WINDOWS = {
+    '24h': 24 * 60,
+    '2h': 2 * 60,
+}
+REMINDER_BATCH_SIZE = int(os.environ.get('REMINDER_BATCH_SIZE', 1000))
+REMINDER_MAX_ATTEMPTS = int(os.environ.get('REMINDER_MAX_ATTEMPTS', 3))
+REMINDER_RETRY_SECONDS = int(os.environ.get('REMINDER_RETRY_SECONDS', 10 * 60))
+REMINDER_SENDER = {
+    'BACKEND': os.environ.get('REMINDER_SENDER', 'appointments.reminders.ConsoleSender'),
+}
+
+# incremental sync API
+SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', 500))
+SYNC_MAX_PAGE_SIZE = 2000
+SYNC_SETTLE_SECONDS = float(os.environ.get('SYNC_SETTLE_SECONDS', 1))
+
+# live slot updates (server-sent events)
+LIVE_SLOTS_BROKER = {
+    'BACKEND': os.environ.get('LIVE_SLOTS_BROKER', 'appointments.live.LocalBroker'),
+}
+LIVE_SLOTS_HEARTBEAT = 15
+LIVE_SLOTS_MAX_SUBSCRIPTIONS = 50
+
+# single-flight coalescing of identical read requests (reuse window in seconds)
+SINGLE_FLIGHT_WINDOW = float(os.environ.get('SINGLE_FLIGHT_WINDOW', 0.05))
+
+# per-request CPU profiling; with a sample rate of 0 and on-demand profiling
+# off the middleware is not loaded at all
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_ON_DEMAND = os.environ.get('PROFILING_ON_DEMAND') == 'True'
+PROFILING_DIR = os.environ.get('PROFILING_DIR', VAR_DIR / 'profiles')
+PROFILING_MAX_CAPTURES = int(os.environ.get('PROFILING_MAX_CAPTURES', 500))
+
+# allocation tracking with tracemalloc (off by default: it slows allocations)
+TRACEMALLOC_ENABLED = os.environ.get('TRACEMALLOC_ENABLED') == 'True'
+TRACEMALLOC_FRAMES = int(os.environ.get('TRACEMALLOC_FRAMES', 10))
+TRACEMALLOC_MAX_SNAPSHOTS = 10
+
+# slow query and N+1 log (report with manage.py slow_queries)
+SLOW_QUERY_ENABLED = os.environ.get('SLOW_QUERY_ENABLED') == 'True'
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', 100))
+SLOW_QUERY_N_PLUS_ONE = int(os.environ.get('SLOW_QUERY_N_PLUS_ONE', 10))
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', VAR_DIR / 'slow_queries.jsonl')
+SLOW_QUERY_STACK_APPS = ['appointments', 'users']
+SLOW_QUERY_STACK_DEPTH = 8
+
+# traffic capture for manage.py replay (bodies keep their shape, not their data)
+TRAFFIC_CAPTURE_ENABLED = os.environ.get('TRAFFIC_CAPTURE_ENABLED') == 'True'
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.environ.get('TRAFFIC_CAPTURE_SAMPLE_RATE', 1))
+TRAFFIC_CAPTURE_FILE = os.environ.get('TRAFFIC_CAPTURE_FILE', VAR_DIR / 'traffic.jsonl')
+TRAFFIC_CAPTURE_EXCLUDE = ['/admin/', '/diagnostics/', '/token/', '/swagger/', '/redoc/', '/static/']
+TRAFFIC_CAPTURE_KEEP_FIELDS = [
+    'availability', 'selected_time', 'clinic', 'doctor', 'start_time', 'end_time', 'day', 'specialty',
+]
+TRAFFIC_CAPTURE_REDACT_PARAMS = ['token', 'password', 'phone_number']
+
+# prime URLconf, serializers, templates and translations when a WSGI/ASGI
+# worker loads the application, before its first request
+WARMUP_ON_START = os.environ.get('WARMUP_ON_START', 'True') == 'True'
+
+# prebuilt OpenAPI schema, one file per language (manage.py build_schema)
+API_SCHEMA_DIR = os.environ.get('API_SCHEMA_DIR', VAR_DIR / 'schema')
+API_SCHEMA_MAX_AGE = 300
+
+# admin change lists read the planner's row estimate instead of COUNT(*) for
+# unfiltered tables of at least this many rows (PostgreSQL only)
+ESTIMATED_COUNT_THRESHOLD = int(os.environ.get('ESTIMATED_COUNT_THRESHOLD', 100000))
+
+# archival of past availabilities and their appointments (manage.py archive);
+# history endpoints read the hot and the archive tables together
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+# clinic sharding (off while SHARDS is empty): clinics and their
+# availabilities, appointments, reminders, outbox events, archives and
+# rollups live on one of SHARDS, users/doctors/patients on 'default' with
+# copies on every shard. Shards may be appended but never reordered: shard
+# n issues ids from n * SHARD_ID_SPAN (manage.py migrate_shards).
+for _alias, _url in (
+    item.split('=', 1) for item in os.environ.get('SHARD_DATABASE_URLS', '').split(',') if item
+):
+    DATABASES[_alias.strip()] = dj_database_url.parse(_url.strip())
+SHARDS = [alias.strip() for alias in os.environ.get('SHARDS', '').split(',') if alias.strip()]
+SHARD_MAP = {
+    'BACKEND': os.environ.get('SHARD_MAP', 'sharding.maps.DirectoryShardMap'),
+}
+SHARD_ID_SPAN = 10 ** 12
+DATABASE_ROUTERS = ['sharding.routing.ShardRouter']
+# SHARDS=default,shard1 SHARD_DATABASE_URLS=shard1=sqlite:///shard1.sqlite3
+# runs the test suite against two shards
+TEST_RUNNER = 'sharding.testing.ShardedTestRunner'
+
+# nearby clinic search (/clinics/nearby/), radii in kilometres
+NEARBY_RADIUS_KM = 5
+NEARBY_MAX_RADIUS_KM = 50
+NEARBY_PAGE_SIZE = 20
+NEARBY_MAX_PAGE_SIZE = 100
+
+# doctor directory search (/doctors/search/)
+DOCTOR_SEARCH_TRIGRAM = os.environ.get('DOCTOR_SEARCH_TRIGRAM', 'True') == 'True'
+DOCTOR_SEARCH_FACET_SECONDS = int(os.environ.get('DOCTOR_SEARCH_FACET_SECONDS', 300))
+DOCTOR_SEARCH_PAGE_SIZE = 20
+DOCTOR_SEARCH_MAX_PAGE_SIZE = 100
+
+# public doctor profiles (/doctors/<slug>/)
+DOCTOR_SLUG_CACHE_SECONDS = int(os.environ.get('DOCTOR_SLUG_CACHE_SECONDS', 60 * 60))
+DOCTOR_PROFILE_SLOTS = 10
+DOCTOR_PROFILE_SLOT_DAYS = 14
@@ -15,14 +15,15 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
+from healthcare_appointment_system.apidocs import get_schema_view, openapi
 from django.conf import settings
 from django.conf.urls.static import static
 from django.utils.translation import gettext_lazy as _
+from users.thumbnails import THUMBNAIL_DIR
+from users.views import serve_thumbnail
 
 
 schema_view = get_schema_view(
@@ -45,10 +46,28 @@ urlpatterns = [
     path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
-
     path('', include('users.urls')),
     path('', include('appointments.urls')),
+    path('', include('analytics.urls')),
+    path('', include('diagnostics.urls')),
+    path('', include('sync.urls')),
+
 ]
+# drf_yasg is only imported when one of these is first requested; the schema
+# itself is prebuilt with manage.py build_schema
+if settings.API_DOCS_ENABLED:
+    urlpatterns += [
+        path('swagger.json', schema_view.without_ui(), name='schema-json'),
+        path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
+        path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    ]
+# media is served by the web server (or the storage) in production, like
+# static() below; see PHOTO_THUMBNAIL_MAX_AGE for the thumbnail headers
+if settings.DEBUG:
+    urlpatterns += [
+        re_path(
+            rf'^{settings.MEDIA_URL.lstrip("/")}{THUMBNAIL_DIR}/(?P<path>.+)$',
+            serve_thumbnail, name='photo-thumbnail'
+        ),
+    ]
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
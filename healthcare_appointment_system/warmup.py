@@ -0,0 +1,96 @@
+'''Prime a worker before its first request.
+
+``warm_up()`` is run by ``wsgi.py``/``asgi.py`` right after the application
+is created (``WARMUP_ON_START``), so under ``gunicorn --preload`` it runs
+once in the master and the forked workers inherit the warm state. It
+imports and builds everything Django and DRF otherwise build lazily on the
+first request: the URLconf and its reverse map, every view module, the
+fields of every local serializer, the browsable API templates and the
+translation catalogs of each language. It leaves no database connection
+open, so it is safe to fork afterwards.
+'''
+import logging
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver
+from django.utils import translation
+from rest_framework.serializers import BaseSerializer
+
+logger = logging.getLogger(__name__)
+
+TEMPLATES = ['rest_framework/api.html', 'rest_framework/login.html']
+
+
+def local_app_names():
+    return {config.name for config in apps.get_app_configs() if config.path.startswith(str(settings.BASE_DIR))}
+
+
+def prime_urlconf():
+    # populating the reverse lookup tables imports every included URLconf
+    # and view module
+    return len(get_resolver().reverse_dict)
+
+
+def serializer_classes(app_names):
+    seen, stack = [], list(BaseSerializer.__subclasses__())
+    while stack:
+        cls = stack.pop()
+        stack.extend(cls.__subclasses__())
+        if cls.__module__.split('.')[0] in app_names and cls not in seen:
+            seen.append(cls)
+    return seen
+
+
+def prime_serializers(app_names):
+    '''Build the fields of every local serializer once (model metadata, field mappings).'''
+    primed = 0
+    for cls in serializer_classes(app_names):
+        try:
+            cls().fields
+        except Exception:
+            # serializers that need a request or other context
+            logger.debug("Could not prime %s.", cls.__qualname__, exc_info=True)
+            continue
+        primed += 1
+    return primed
+
+
+def prime_templates():
+    for name in TEMPLATES:
+        get_template(name)
+    return len(TEMPLATES)
+
+
+def prime_translations():
+    for code, _ in settings.LANGUAGES:
+        with translation.override(code):
+            translation.gettext('Not found.')
+    return len(settings.LANGUAGES)
+
+
+STEPS = [
+    ('urlconf', lambda app_names: prime_urlconf()),
+    ('serializers', prime_serializers),
+    ('templates', lambda app_names: prime_templates()),
+    ('translations', lambda app_names: prime_translations()),
+]
+
+
+def warm_up():
+    '''Run every warm-up step; return ``{step: seconds}``.'''
+    app_names = local_app_names()
+    timings = {}
+    for name, step in STEPS:
+        started = time.perf_counter()
+        try:
+            step(app_names)
+        except Exception:
+            logger.exception("Warm-up step %s failed.", name)
+        timings[name] = round(time.perf_counter() - started, 4)
+    connections.close_all()
+    logger.info("Warm-up finished: %s", timings)
+    return timings
@@ -0,0 +1,51 @@
+from contextlib import ExitStack
+
+from django.contrib import admin
+from django.contrib.admin.utils import unquote
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import ClinicPlacement
+from .routing import atomic, locate, sharding_enabled
+
+
+class ShardedModelAdmin(admin.ModelAdmin):
+    '''Admin of clinic data: add, change and delete run on the row's shard.
+
+    ``ModelAdmin`` opens ``transaction.atomic(using=router.db_for_write(model))``
+    without a row to route by, which raises ``ShardNotSelected``. The change
+    and delete views of a row run in a transaction on its shard (pinned for
+    the block) and one on ``'default'`` for the admin log; a new row is
+    routed by its own clinic when saved.
+    '''
+
+    def shard_atomic(self, object_id):
+        stack = ExitStack()
+        stack.enter_context(transaction.atomic(using=DEFAULT_DB_ALIAS))
+        try:
+            pk = self.opts.pk.to_python(unquote(object_id)) if object_id is not None else None
+        except ValidationError:
+            pk = None
+        alias = locate(self.model, pk) if pk is not None else None
+        if alias is not None:
+            stack.enter_context(atomic(alias))
+        return stack
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        if not sharding_enabled():
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        with self.shard_atomic(object_id):
+            return self._changeform_view(request, object_id, form_url, extra_context)
+
+    def delete_view(self, request, object_id, extra_context=None):
+        if not sharding_enabled():
+            return super().delete_view(request, object_id, extra_context)
+        with self.shard_atomic(object_id):
+            return self._delete_view(request, object_id, extra_context)
+
+
+@admin.register(ClinicPlacement)
+class ClinicPlacementAdmin(admin.ModelAdmin):
+    list_display = ('clinic_id', 'shard', 'moved_at')
+    list_filter = ('shard',)
+    search_fields = ('clinic_id',)
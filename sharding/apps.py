@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.translation import gettext_lazy as _
+
+
+class ShardingConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'sharding'
+    verbose_name = _("sharding")
+
+    def ready(self):
+        import sharding.replication
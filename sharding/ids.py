@@ -0,0 +1,43 @@
+'''Per-shard id ranges.
+
+Shard ``n`` of ``SHARDS`` issues ids from ``n * SHARD_ID_SPAN + 1`` on, so
+clinic data ids stay unique across shards (API ids, outbox event ids and
+sync entries never collide) and the shard that created a row can be read
+off its id (``sharding.routing.origin_shard``). The first shard keeps its
+natural sequence, which is how an existing database becomes shard 0.
+Shards may be appended to ``SHARDS`` but never reordered.
+'''
+from django.conf import settings
+from django.db import NotSupportedError, connections
+
+from .routing import shard_index
+
+
+def reserve_id_range(alias, model):
+    '''Move the id sequence of ``model`` on ``alias`` to the start of its range.
+
+    Returns the first id the table will issue, or ``None`` when the
+    sequence was already inside the range.
+    '''
+    start = shard_index(alias) * settings.SHARD_ID_SPAN
+    connection = connections[alias]
+    table = model._meta.db_table
+    column = model._meta.pk.column
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MAX({quote(column)}) FROM {quote(table)}')
+        if (cursor.fetchone()[0] or 0) >= start:
+            return None
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT setval(pg_get_serial_sequence(%s, %s), %s)', [quote(table), column, start],
+            )
+        elif connection.vendor == 'sqlite':
+            cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [start, table])
+            if not cursor.rowcount:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, start])
+        elif connection.vendor == 'mysql':
+            cursor.execute(f'ALTER TABLE {quote(table)} AUTO_INCREMENT = {start + 1}')
+        else:
+            raise NotSupportedError(f"Cannot reserve id ranges on {connection.vendor}.")
+    return start + 1
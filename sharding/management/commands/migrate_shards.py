@@ -0,0 +1,27 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from sharding.ids import reserve_id_range
+from sharding.replication import replicas, sync_reference_tables
+from sharding.routing import sharded_models, shards
+
+
+class Command(BaseCommand):
+    help = "Migrate every shard, reserve its id ranges and copy users, doctors and patients to it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-sync', action='store_true', help="Skip copying the reference tables.")
+
+    def handle(self, *args, **options):
+        if not shards():
+            raise CommandError("Sharding is off: SHARDS is empty.")
+        for alias in shards():
+            self.stdout.write(f"Migrating {alias}")
+            call_command('migrate', database=alias, interactive=False, verbosity=0)
+            for model in sharded_models():
+                if model._meta.auto_field is not None:
+                    reserve_id_range(alias, model)
+            if alias in replicas() and not options['no_sync']:
+                copied = sync_reference_tables(alias)
+                self.stdout.write(f"Copied {copied} users, doctors and patients to {alias}")
+        self.stdout.write(self.style.SUCCESS(f"{len(shards())} shards ready."))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from sharding.rebalance import clinic_loads, move_clinic, plan_even
+from sharding.routing import shard_for_clinic, shards
+
+
+class Command(BaseCommand):
+    help = "Move a clinic to another shard, or even out the shards."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', type=int, help="Clinic id to move.")
+        parser.add_argument('--to', help="Target shard of --clinic.")
+        parser.add_argument('--even', action='store_true',
+                            help="Move clinics until the shards hold about as many availabilities.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would move.")
+
+    def handle(self, *args, **options):
+        if not shards():
+            raise CommandError("Sharding is off: SHARDS is empty.")
+        if options['even']:
+            moves = plan_even(clinic_loads())
+        elif options['clinic'] and options['to']:
+            if options['to'] not in shards():
+                raise CommandError(f"Unknown shard {options['to']!r}.")
+            moves = [(options['clinic'], shard_for_clinic(options['clinic']), options['to'])]
+        else:
+            raise CommandError("Give --clinic and --to, or --even.")
+
+        prefix = "Would move" if options['dry_run'] else "Moved"
+        for clinic_id, source, target in moves:
+            try:
+                report = move_clinic(clinic_id, target, dry_run=options['dry_run'])
+            except NotImplementedError as error:
+                raise CommandError(f"{error} Use sharding.maps.DirectoryShardMap.")
+            rows = sum(report.values())
+            self.stdout.write(f"{prefix} clinic {clinic_id} from {source} to {target} ({rows} rows)")
+        self.stdout.write(self.style.SUCCESS(f"{prefix} {len(moves)} clinics."))
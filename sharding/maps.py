@@ -0,0 +1,95 @@
+'''Shard maps: which shard a clinic lives on.
+
+The map is configured with ``SHARD_MAP`` (``BACKEND`` and ``OPTIONS``):
+
+``RangeShardMap``
+    A clinic stays on the shard that issued its id; new clinics go to the
+    shard holding the fewest clinics. Nothing to look up, but clinics can
+    never move.
+``DirectoryShardMap`` (default)
+    The range map plus per-clinic overrides kept in ``ClinicPlacement`` on
+    the default database, which is what ``manage.py rebalance_shards``
+    writes. Overrides are cached per process for ``cache_seconds``.
+'''
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .routing import origin_shard
+
+
+class BaseShardMap:
+    '''Interface of shard maps.'''
+
+    def __init__(self, shards, **options):
+        self.shards = list(shards)
+
+    def shard_for_clinic(self, clinic_id):
+        raise NotImplementedError
+
+    def place_clinic(self):
+        '''The shard a new clinic is created on.'''
+        raise NotImplementedError
+
+    def move(self, clinic_id, alias):
+        raise NotImplementedError(f"{type(self).__name__} cannot move clinics.")
+
+
+class RangeShardMap(BaseShardMap):
+    '''A clinic lives on the shard whose id range its id comes from.'''
+
+    def shard_for_clinic(self, clinic_id):
+        return origin_shard(clinic_id) or self.shards[0]
+
+    def place_clinic(self):
+        Clinic = apps.get_model('appointments', 'Clinic')
+        return min(self.shards, key=lambda alias: Clinic._base_manager.using(alias).count())
+
+
+class DirectoryShardMap(RangeShardMap):
+    '''``RangeShardMap`` with the per-clinic overrides of ``ClinicPlacement``.'''
+
+    def __init__(self, shards, cache_seconds=30, **options):
+        super().__init__(shards, **options)
+        self.cache_seconds = cache_seconds
+        self._placements = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def placements(self):
+        with self._lock:
+            if self._placements is None or time.monotonic() - self._loaded_at > self.cache_seconds:
+                ClinicPlacement = apps.get_model('sharding', 'ClinicPlacement')
+                self._placements = dict(ClinicPlacement.objects.values_list('clinic_id', 'shard'))
+                self._loaded_at = time.monotonic()
+            return self._placements
+
+    def shard_for_clinic(self, clinic_id):
+        return self.placements().get(clinic_id) or super().shard_for_clinic(clinic_id)
+
+    def move(self, clinic_id, alias):
+        ClinicPlacement = apps.get_model('sharding', 'ClinicPlacement')
+        ClinicPlacement.objects.update_or_create(
+            clinic_id=clinic_id, defaults={'shard': alias, 'moved_at': timezone.now()},
+        )
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._placements = None
+
+
+_shard_maps = {}
+
+
+def get_shard_map():
+    # keyed by the settings, so tests overriding SHARDS get their own map
+    config = settings.SHARD_MAP
+    key = (config['BACKEND'], tuple(settings.SHARDS))
+    if key not in _shard_maps:
+        _shard_maps[key] = import_string(config['BACKEND'])(settings.SHARDS, **config.get('OPTIONS', {}))
+    return _shard_maps[key]
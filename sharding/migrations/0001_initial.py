@@ -0,0 +1,28 @@
+# Generated by Django 5.1.1 on 2026-10-19 01:36
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicPlacement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clinic_id', models.BigIntegerField(unique=True, verbose_name='Clinic ID')),
+                ('shard', models.CharField(max_length=100, verbose_name='Shard')),
+                ('moved_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Moved at')),
+            ],
+            options={
+                'verbose_name': 'Clinic placement',
+                'verbose_name_plural': 'Clinic placements',
+            },
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class ClinicPlacement(models.Model):
+    '''A clinic that was moved off the shard its id comes from.
+
+    Read by ``sharding.maps.DirectoryShardMap``; lives on the default
+    database like every other global table.
+    '''
+
+    clinic_id = models.BigIntegerField(unique=True, verbose_name=_("Clinic ID"))
+    shard = models.CharField(max_length=100, verbose_name=_("Shard"))
+    moved_at = models.DateTimeField(default=timezone.now, verbose_name=_("Moved at"))
+
+    class Meta:
+        verbose_name = _("Clinic placement")
+        verbose_name_plural = _("Clinic placements")
+
+    def __str__(self):
+        return f"clinic #{self.clinic_id} on {self.shard}"
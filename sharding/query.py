@@ -0,0 +1,276 @@
+'''Querysets of clinic data that read every shard when none is selected.
+
+A ``ShardedQuerySet`` that is not pinned (no ``using()``, no active shard,
+no related instance) runs on each shard and merges the results: rows are
+re-sorted by the query's ordering, then the slice is applied, so a page of
+``n`` rows reads at most ``offset + n`` rows per shard. ``count()``,
+``exists()``, ``update()``, ``delete()`` and ``aggregate()`` (``Count``,
+``Sum``, ``Min``, ``Max``) are combined; ``values().annotate()`` groups
+that appear on several shards are folded together the same way. Anything
+that cannot be merged exactly raises ``NotSupportedError`` instead of
+returning the rows of one shard.
+
+Writes without a shard are routed row by row: ``create()`` and
+``bulk_create()`` by the clinic of each row, ``bulk_update()`` by the
+database each row was loaded from.
+'''
+from itertools import chain
+
+from django.db import NotSupportedError, router
+from django.db.models import Count, F, Manager, Max, Min, Model, QuerySet, Sum
+from django.db.models.expressions import OrderBy
+from django.db.models.query import (FlatValuesListIterable, ModelIterable,
+                                    ValuesIterable)
+
+from .routing import shard_for, sharding_enabled, shards
+
+
+def combine(aggregate, values):
+    '''Fold the per-shard results of one aggregate.'''
+    values = [value for value in values if value is not None]
+    if getattr(aggregate, 'distinct', False):
+        raise NotSupportedError("Distinct aggregates cannot be combined across shards.")
+    if isinstance(aggregate, (Count, Sum)):
+        return sum(values) if values else (0 if isinstance(aggregate, Count) else None)
+    if isinstance(aggregate, Min):
+        return min(values, default=None)
+    if isinstance(aggregate, Max):
+        return max(values, default=None)
+    raise NotSupportedError(f"{type(aggregate).__name__} cannot be combined across shards.")
+
+
+class ShardedQuerySet(QuerySet):
+    '''``QuerySet`` that fans out to every shard when it is not pinned to one.'''
+
+    def fans_out(self):
+        return (
+            self._db is None and sharding_enabled()
+            and shard_for(self.model, self._hints.get('instance')) is None
+        )
+
+    @property
+    def db(self):
+        if not self._for_write and self.fans_out():
+            # only read for connection features (in_bulk, get); the rows
+            # themselves come from _fetch_all
+            return shards()[0]
+        return super().db
+
+    def on_shards(self):
+        '''One copy of this queryset per shard, without its slice.'''
+        for alias in shards():
+            clone = self.using(alias)
+            clone._prefetch_related_lookups = ()
+            clone.query.clear_limits()
+            yield clone
+
+    def _fetch_all(self):
+        if self._result_cache is None and self.fans_out():
+            self._result_cache = self._fetch_shards()
+        super()._fetch_all()
+
+    def _fetch_shards(self):
+        low, high = self.query.low_mark, self.query.high_mark
+        aggregates = self._aggregates()
+        rows = []
+        for clone in self.on_shards():
+            if high is not None and not aggregates:
+                clone.query.set_limits(high=high)
+            rows += list(clone)
+        if aggregates:
+            rows = self._fold_groups(rows, aggregates)
+        if self.query.distinct and not self.query.distinct_fields:
+            rows = self._unique(rows)
+        for name, descending in reversed(self._ordering()):
+            key = self._sort_key(name)
+            # NULLs last, and first when descending, as PostgreSQL sorts them
+            rows.sort(key=lambda row, key=key: (key(row) is None, key(row)), reverse=descending)
+        return rows[low:high]
+
+    def _aggregates(self):
+        if issubclass(self._iterable_class, ModelIterable):
+            # a model row is on one shard only: its group cannot be split
+            return {}
+        return {
+            name: annotation for name, annotation in self.query.annotation_select.items()
+            if getattr(annotation, 'contains_aggregate', False)
+        }
+
+    def _fold_groups(self, rows, aggregates):
+        if not issubclass(self._iterable_class, ValuesIterable):
+            raise NotSupportedError("Use values() to aggregate groups across shards.")
+        groups = {}
+        for row in rows:
+            key = tuple((name, value) for name, value in row.items() if name not in aggregates)
+            groups.setdefault(key, []).append(row)
+        folded = []
+        for key, group in groups.items():
+            row = dict(group[0])
+            for name, aggregate in aggregates.items():
+                row[name] = combine(aggregate, [member[name] for member in group])
+            folded.append(row)
+        return folded
+
+    def _unique(self, rows):
+        seen, unique = set(), []
+        for row in rows:
+            key = tuple(row.items()) if isinstance(row, dict) else row
+            if key not in seen:
+                seen.add(key)
+                unique.append(row)
+        return unique
+
+    def _ordering(self):
+        if self.query.order_by:
+            terms = self.query.order_by
+        elif self.query.default_ordering:
+            terms = self.model._meta.ordering
+        else:
+            terms = ()
+        ordering = []
+        for term in terms:
+            if isinstance(term, str):
+                if term == '?':
+                    continue
+                ordering.append((term.lstrip('-'), term.startswith('-')))
+            elif isinstance(term, OrderBy) and isinstance(term.expression, F):
+                ordering.append((term.expression.name, term.descending))
+            elif isinstance(term, F):
+                ordering.append((term.name, False))
+            else:
+                raise NotSupportedError(f"Cannot merge shards ordered by {term!r}.")
+        return ordering
+
+    def _sort_key(self, name):
+        iterable = self._iterable_class
+        if issubclass(iterable, ModelIterable):
+            def value(row):
+                for part in name.split('__'):
+                    row = getattr(row, part)
+                    if row is None:
+                        return None
+                return row.pk if isinstance(row, Model) else row
+            return value
+        names = [name]
+        if name == 'pk':
+            names += [self.model._meta.pk.name, self.model._meta.pk.attname]
+        elif '__' not in name:
+            field = next((field for field in self.model._meta.concrete_fields if field.name == name), None)
+            if field is not None:
+                names.append(field.attname)
+        if issubclass(iterable, ValuesIterable):
+            if self._fields:
+                columns = list(self._fields) + list(self.query.annotation_select)
+            else:
+                columns = [field.attname for field in self.model._meta.concrete_fields]
+                columns += list(self.query.annotation_select)
+            column = next((column for column in names if column in columns), None)
+            if column is not None:
+                return lambda row: row[column]
+        elif self._fields:
+            columns = list(self._fields)
+            for column in names:
+                if column in columns:
+                    if issubclass(iterable, FlatValuesListIterable):
+                        return lambda row: row
+                    index = columns.index(column)
+                    return lambda row: row[index]
+        raise NotSupportedError(f"Cannot merge shards ordered by {name!r}: select it too.")
+
+    def iterator(self, chunk_size=None):
+        if not self.fans_out():
+            return super().iterator(chunk_size)
+        if self.query.order_by or self.query.is_sliced or self.query.distinct or self._aggregates():
+            return iter(self._fetch_shards())
+        return chain.from_iterable(clone.iterator(chunk_size) for clone in self.on_shards())
+
+    def count(self):
+        if self._result_cache is None and self.fans_out():
+            if self.query.is_sliced or self.query.distinct or self._aggregates():
+                return len(self._fetch_shards())
+            return sum(clone.count() for clone in self.on_shards())
+        return super().count()
+
+    def exists(self):
+        if self._result_cache is None and self.fans_out():
+            return any(clone.exists() for clone in self.on_shards())
+        return super().exists()
+
+    def aggregate(self, *args, **kwargs):
+        if not self.fans_out():
+            return super().aggregate(*args, **kwargs)
+        if self.query.is_sliced or self.query.distinct:
+            raise NotSupportedError("Sliced or distinct querysets cannot be aggregated across shards.")
+        for arg in args:
+            kwargs[arg.default_alias] = arg
+        results = [clone.aggregate(**kwargs) for clone in self.on_shards()]
+        return {
+            name: combine(aggregate, [result[name] for result in results])
+            for name, aggregate in kwargs.items()
+        }
+
+    def update(self, **kwargs):
+        if not self.fans_out():
+            return super().update(**kwargs)
+        if self.query.is_sliced:
+            raise TypeError("Cannot update a query once a slice has been taken.")
+        return sum(clone.update(**kwargs) for clone in self.on_shards())
+
+    update.alters_data = True
+
+    def delete(self):
+        if not self.fans_out():
+            return super().delete()
+        if self.query.is_sliced:
+            raise TypeError("Cannot use 'limit' or 'offset' with delete().")
+        deleted, per_model = 0, {}
+        for clone in self.on_shards():
+            count, counts = clone.delete()
+            deleted += count
+            for label, number in counts.items():
+                per_model[label] = per_model.get(label, 0) + number
+        self._result_cache = None
+        return deleted, per_model
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def create(self, **kwargs):
+        if not self.fans_out():
+            return super().create(**kwargs)
+        instance = self.model(**kwargs)
+        # routed by ShardRouter from the instance (its clinic)
+        instance.save(force_insert=True)
+        return instance
+
+    create.alters_data = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        if not self.fans_out():
+            return super().bulk_create(objs, *args, **kwargs)
+        objs = list(objs)
+        groups = {}
+        for obj in objs:
+            groups.setdefault(router.db_for_write(self.model, instance=obj), []).append(obj)
+        for alias, group in groups.items():
+            self.using(alias).bulk_create(group, *args, **kwargs)
+        return objs
+
+    bulk_create.alters_data = True
+
+    def bulk_update(self, objs, fields, batch_size=None):
+        if not self.fans_out():
+            return super().bulk_update(objs, fields, batch_size=batch_size)
+        groups = {}
+        for obj in objs:
+            groups.setdefault(router.db_for_write(self.model, instance=obj), []).append(obj)
+        return sum(
+            self.using(alias).bulk_update(group, fields, batch_size=batch_size)
+            for alias, group in groups.items()
+        )
+
+    bulk_update.alters_data = True
+
+
+class ShardedManager(Manager.from_queryset(ShardedQuerySet)):
+    pass
@@ -0,0 +1,94 @@
+'''Moving clinics between shards.
+
+A clinic is moved with everything that belongs to it: the rows are copied
+to the target shard (keeping their ids), the placement is recorded in the
+directory and the originals are deleted, without signals (nothing changed
+from a client's point of view). Both transactions commit one after the
+other, so this is not atomic across databases: run it while the clinic is
+quiet. Other processes follow the new placement once their directory
+cache expires (``SHARD_MAP`` ``cache_seconds``).
+'''
+from django.apps import apps
+from django.db import transaction
+
+from appointments.archive import copy_row
+from .maps import get_shard_map
+from .routing import shard_for_clinic, shards
+
+# parents before children; deleted in reverse
+CLINIC_ROWS = (
+    ('appointments.Clinic', 'pk'),
+    ('appointments.Availability', 'clinic'),
+    ('appointments.Appointment', 'availability__clinic'),
+    ('appointments.AppointmentReminder', 'appointment__availability__clinic'),
+    ('appointments.ArchivedAvailability', 'clinic'),
+    ('appointments.ArchivedAppointment', 'availability__clinic'),
+    ('analytics.DailyUtilization', 'clinic'),
+)
+
+
+def clinic_rows(clinic_id, alias):
+    '''``[(model, queryset), ...]`` of the rows of a clinic on ``alias``.'''
+    return [
+        (apps.get_model(label), apps.get_model(label)._base_manager.using(alias).filter(**{path: clinic_id}))
+        for label, path in CLINIC_ROWS
+    ]
+
+
+def clinic_loads():
+    '''``{alias: {clinic_id: availabilities}}`` of every shard.'''
+    Availability = apps.get_model('appointments', 'Availability')
+    Clinic = apps.get_model('appointments', 'Clinic')
+    loads = {}
+    for alias in shards():
+        load = dict.fromkeys(Clinic._base_manager.using(alias).values_list('pk', flat=True), 0)
+        for clinic_id in Availability._base_manager.using(alias).values_list('clinic_id', flat=True):
+            load[clinic_id] = load.get(clinic_id, 0) + 1
+        loads[alias] = load
+    return loads
+
+
+def plan_even(loads):
+    '''Moves ``[(clinic_id, source, target), ...]`` that even out the shard loads.
+
+    Greedy: the clinic whose size is closest to half the gap between the
+    heaviest and the lightest shard moves, as long as that shrinks the gap.
+    '''
+    loads = {alias: dict(load) for alias, load in loads.items()}
+    totals = {alias: sum(load.values()) for alias, load in loads.items()}
+    moves = []
+    while len(totals) > 1:
+        heaviest = max(totals, key=totals.get)
+        lightest = min(totals, key=totals.get)
+        gap = totals[heaviest] - totals[lightest]
+        candidates = [(size, clinic_id) for clinic_id, size in loads[heaviest].items() if 0 < size < gap]
+        if not candidates:
+            break
+        size, clinic_id = min(candidates, key=lambda candidate: (abs(gap / 2 - candidate[0]), candidate[1]))
+        loads[lightest][clinic_id] = loads[heaviest].pop(clinic_id)
+        totals[heaviest] -= size
+        totals[lightest] += size
+        moves.append((clinic_id, heaviest, lightest))
+    return moves
+
+
+def move_clinic(clinic_id, target, dry_run=False):
+    '''Move a clinic and its rows to ``target``. Returns ``{model label: rows}``.'''
+    source = shard_for_clinic(clinic_id)
+    if source == target:
+        return {}
+    rows = clinic_rows(clinic_id, source)
+    if dry_run:
+        return {model._meta.label: queryset.count() for model, queryset in rows}
+    report = {}
+    with transaction.atomic(using=target), transaction.atomic(using=source):
+        # bookings lock their availability: keep them out while copying
+        list(rows[1][1].select_for_update().values_list('pk', flat=True))
+        for model, queryset in rows:
+            copies = [copy_row(model, instance) for instance in queryset.order_by('pk')]
+            model._base_manager.using(target).bulk_create(copies)
+            report[model._meta.label] = len(copies)
+        get_shard_map().move(clinic_id, target)
+        for model, queryset in reversed(rows):
+            queryset._raw_delete(source)
+    return report
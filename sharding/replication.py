@@ -0,0 +1,86 @@
+'''Copies of users, doctors and patients on every shard.
+
+Clinic data joins these tables (``doctor__user__last_name``,
+``patient__user__phone_number``) and references them with foreign keys, so
+each shard holds a copy. The default database stays the only place they
+are written; after a commit the changed row is upserted (or deleted) on
+the other shards. Deleting a doctor therefore also deletes, through the
+cascade on each shard, the availabilities and appointments it had there.
+'''
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import Doctor, Patient, User
+from .routing import shards, sharding_enabled
+
+REPLICATED = (User, Doctor, Patient)
+
+
+def replicas():
+    return [alias for alias in shards() if alias != DEFAULT_DB_ALIAS]
+
+
+def copy_rows(model, rows, alias):
+    '''Upsert ``rows`` (instances read from the default database) on ``alias``.'''
+    manager = model._base_manager.using(alias)
+    missing = []
+    for row in rows:
+        values = {
+            field.attname: getattr(row, field.attname)
+            for field in model._meta.concrete_fields if not field.primary_key
+        }
+        if not manager.filter(pk=row.pk).update(**values):
+            missing.append(row)
+    if missing:
+        manager.bulk_create(missing)
+
+
+def replicate(model, pks):
+    '''Copy the current state of ``model`` rows ``pks`` to every other shard.'''
+    rows = list(model._base_manager.using(DEFAULT_DB_ALIAS).filter(pk__in=pks))
+    if not rows:
+        return
+    if model is not User:
+        # the user row first, for the foreign key
+        replicate(User, [row.user_id for row in rows])
+    for alias in replicas():
+        copy_rows(model, rows, alias)
+
+
+def sync_reference_tables(alias, batch_size=1000):
+    '''Copy every user, doctor and patient to ``alias``. Returns the row count.'''
+    copied = 0
+    for model in REPLICATED:
+        rows = model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk')
+        last = 0
+        while batch := list(rows.filter(pk__gt=last)[:batch_size]):
+            copy_rows(model, batch, alias)
+            last = batch[-1].pk
+            copied += len(batch)
+    return copied
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Patient)
+def replicate_save(sender, instance, using, raw=False, **kwargs):
+    if raw or using != DEFAULT_DB_ALIAS or not sharding_enabled():
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: replicate(sender, [pk]), using=using)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Patient)
+def replicate_delete(sender, instance, using, **kwargs):
+    if using != DEFAULT_DB_ALIAS or not sharding_enabled():
+        return
+    pk = instance.pk
+
+    def delete():
+        for alias in replicas():
+            sender._base_manager.using(alias).filter(pk=pk).delete()
+
+    transaction.on_commit(delete, using=using)
@@ -0,0 +1,235 @@
+'''Clinic based horizontal sharding.
+
+Each clinic and every row hanging off it (availabilities, appointments,
+reminders, outbox events, archives and daily rollups) lives on one of the
+databases listed in ``SHARDS``; the shard map (``SHARD_MAP``) decides which.
+Users, doctors and patients stay on ``'default'`` and are copied to every
+shard (see ``sharding.replication``) so shard queries can still join them.
+With ``SHARDS`` empty, the default, everything stays on ``'default'`` and
+none of this changes a query.
+
+Code that writes clinic data picks its shard in one of three ways:
+
+* from the row itself: an unsaved availability knows its clinic, an
+  appointment its availability, a loaded row the database it came from;
+* with ``atomic(instance_or_alias)``, which opens the transaction on that
+  shard and pins it for every query inside the block;
+* with ``use_shard(alias)``, which only pins it.
+
+Reads that are neither pinned nor tied to a row are sent to every shard and
+merged (``sharding.query.ShardedQuerySet``).
+'''
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from django.db.utils import ProgrammingError
+
+SHARDED_MODELS = {
+    'appointments.clinic',
+    'appointments.availability',
+    'appointments.appointment',
+    'appointments.appointmentreminder',
+    'appointments.archivedavailability',
+    'appointments.archivedappointment',
+    'appointments.outboxevent',
+    'analytics.dailyutilization',
+}
+
+# the relation a row follows to find its shard (clinics are placed by the
+# shard map, outbox events by their payload)
+SHARD_KEYS = {
+    'appointments.availability': 'clinic',
+    'appointments.archivedavailability': 'clinic',
+    'analytics.dailyutilization': 'clinic',
+    'appointments.appointment': 'availability',
+    'appointments.archivedappointment': 'availability',
+    'appointments.appointmentreminder': 'appointment',
+}
+
+_active_shard = ContextVar('active_shard', default=None)
+
+
+class ShardNotSelected(ProgrammingError):
+    '''A write whose shard cannot be derived from the row or the context.'''
+
+
+def sharding_enabled():
+    return bool(settings.SHARDS)
+
+
+def shards():
+    return list(settings.SHARDS)
+
+
+def each_shard():
+    '''The aliases to visit when a job has to cover every shard.'''
+    return shards() or [DEFAULT_DB_ALIAS]
+
+
+def is_sharded(model):
+    '''Whether rows of ``model`` (a model class or instance) live on the shards.'''
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def active_shard():
+    return _active_shard.get()
+
+
+@contextmanager
+def use_shard(alias):
+    '''Send the clinic data queries of the block to ``alias``.'''
+    token = _active_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _active_shard.reset(token)
+
+
+@contextmanager
+def atomic(target=None, **kwargs):
+    '''``transaction.atomic`` on the shard of ``target``, pinned for the block.
+
+    ``target`` is a model instance or a database alias; without it the
+    active shard is used. When sharding is off this is a plain
+    ``transaction.atomic()`` on the default database.
+    '''
+    if not sharding_enabled():
+        with transaction.atomic(**kwargs):
+            yield DEFAULT_DB_ALIAS
+        return
+    alias = target
+    if target is not None and not isinstance(target, str):
+        alias = router.db_for_write(type(target), instance=target)
+    alias = alias or active_shard()
+    if alias is None:
+        raise ShardNotSelected("No shard selected for this transaction.")
+    with use_shard(alias), transaction.atomic(using=alias, **kwargs):
+        yield alias
+
+
+def shard_index(alias):
+    return shards().index(alias)
+
+
+def origin_shard(pk):
+    '''The shard whose id range ``pk`` was issued from (see ``sharding.ids``).'''
+    aliases = shards()
+    index = pk // settings.SHARD_ID_SPAN
+    return aliases[index] if 0 <= index < len(aliases) else None
+
+
+def shard_for_clinic(clinic_id):
+    if not sharding_enabled():
+        return DEFAULT_DB_ALIAS
+    from .maps import get_shard_map
+    return get_shard_map().shard_for_clinic(clinic_id)
+
+
+def locate(model, pk):
+    '''The shard holding the ``model`` row ``pk``, or ``None``.'''
+    origin = origin_shard(pk)
+    for alias in sorted(shards(), key=lambda alias: alias != origin):
+        if model._base_manager.using(alias).filter(pk=pk).exists():
+            return alias
+    return None
+
+
+def shard_of(instance):
+    '''The shard an unsaved clinic data row belongs to, or ``None``.'''
+    label = instance._meta.label_lower
+    if label == 'appointments.clinic':
+        if instance.pk is not None:
+            return shard_for_clinic(instance.pk)
+        if getattr(instance, '_placed_on', None) is None:
+            from .maps import get_shard_map
+            instance._placed_on = get_shard_map().place_clinic()
+        return instance._placed_on
+    if label == 'appointments.outboxevent':
+        clinic_id = (instance.payload or {}).get('clinic')
+        return shard_for_clinic(clinic_id) if clinic_id is not None else None
+    relation = SHARD_KEYS.get(label)
+    if relation is None:
+        return None
+    field = instance._meta.get_field(relation)
+    if relation == 'clinic':
+        clinic_id = getattr(instance, field.attname)
+        return shard_for_clinic(clinic_id) if clinic_id is not None else None
+    if field.is_cached(instance):
+        parent = field.get_cached_value(instance)
+        if parent is not None:
+            return shard_of(parent) if parent._state.adding else parent._state.db
+    pk = getattr(instance, field.attname)
+    return locate(field.related_model, pk) if pk is not None else None
+
+
+def shard_for(model, instance=None):
+    '''The database of a ``model`` query, or ``None`` when it needs every shard.'''
+    if instance is not None and is_sharded(instance):
+        if not instance._state.adding and instance._state.db:
+            return instance._state.db
+        alias = shard_of(instance)
+        if alias is not None:
+            return alias
+    return active_shard()
+
+
+def group_by_shard(instances):
+    '''``{alias: [instance, ...]}`` of unsaved rows (one group when sharding is off).'''
+    if not sharding_enabled():
+        return {DEFAULT_DB_ALIAS: list(instances)} if instances else {}
+    groups = {}
+    for instance in instances:
+        alias = shard_for(type(instance), instance)
+        if alias is None:
+            raise ShardNotSelected(f"No shard for {instance._meta.label} {instance!r}.")
+        groups.setdefault(alias, []).append(instance)
+    return groups
+
+
+class ShardRouter:
+    '''Route clinic data to its shard and everything else to ``'default'``.
+
+    There is no ``allow_migrate``: every shard gets the full schema, so
+    reference tables can be replicated and joined on it.
+    '''
+
+    def db_for_read(self, model, **hints):
+        if not sharding_enabled():
+            return None
+        if not is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        return shard_for(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        if not sharding_enabled():
+            return None
+        if not is_sharded(model):
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        alias = shard_for(model, instance)
+        # a global instance hint comes from assigning it to a foreign key
+        # of an unsaved row; that row is routed again when it is saved
+        if alias is None and (instance is None or is_sharded(instance)):
+            raise ShardNotSelected(
+                f"No shard selected for writing {model._meta.label}; "
+                "use sharding.routing.atomic() or use_shard()."
+            )
+        return alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if not sharding_enabled():
+            return None
+        # not type(obj): request.user is a SimpleLazyObject, _meta is proxied
+        if not (is_sharded(obj1) and is_sharded(obj2)):
+            # users, doctors and patients are replicated to every shard
+            return True
+        if obj1._state.adding or obj2._state.adding:
+            # an unsaved row is routed to its parent's shard when saved
+            return True
+        return obj1._state.db == obj2._state.db
+
+def sharded_models():
+    return [apps.get_model(label) for label in sorted(SHARDED_MODELS)]
@@ -0,0 +1,24 @@
+'''Test runner for running the suite against shards.
+
+With ``SHARDS`` set (for example ``SHARDS=default,shard1`` and
+``SHARD_DATABASE_URLS=shard1=sqlite:///shard1.sqlite3``) every test
+database is created and given its id ranges the way ``manage.py
+migrate_shards`` prepares a real shard, so the clinic data tests run
+against several databases. Test cases touching clinic data declare
+``databases = '__all__'``.
+'''
+from django.test.runner import DiscoverRunner
+
+from .ids import reserve_id_range
+from .routing import sharded_models, shards
+
+
+class ShardedTestRunner(DiscoverRunner):
+
+    def setup_databases(self, **kwargs):
+        old_config = super().setup_databases(**kwargs)
+        for alias in shards():
+            for model in sharded_models():
+                if model._meta.auto_field is not None:
+                    reserve_id_range(alias, model)
+        return old_config
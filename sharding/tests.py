@@ -0,0 +1,157 @@
+from datetime import datetime, time, timedelta
+from unittest import skipUnless
+
+from django.conf import settings
+from django.db import router
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+
+from analytics.models import DailyUtilization
+from appointments.models import Appointment, Availability, Clinic, OutboxEvent
+from appointments.outbox import LocMemSink, OutboxDispatcher
+from users.models import Doctor, User
+from .ids import reserve_id_range
+from .maps import get_shard_map
+from .rebalance import move_clinic, plan_even
+from .routing import ShardNotSelected, atomic, sharded_models, shard_for_clinic
+
+
+class PlanEvenTests(SimpleTestCase):
+
+    def test_moves_clinics_to_the_lightest_shard(self):
+        moves = plan_even({'a': {1: 50, 2: 30, 3: 20}, 'b': {4: 10}, 'c': {5: 40}})
+        self.assertEqual(moves, [(1, 'a', 'b'), (4, 'b', 'c')])
+
+    def test_balanced_shards_stay(self):
+        self.assertEqual(plan_even({'a': {1: 40}, 'b': {2: 10, 3: 20}}), [])
+
+
+@skipUnless('shard1' in settings.DATABASES, "needs SHARD_DATABASE_URLS=shard1=<url>")
+@override_settings(SHARDS=['default', 'shard1'])
+class ShardingTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        get_shard_map().clear()
+        for model in sharded_models():
+            if model._meta.auto_field is not None:
+                reserve_id_range('shard1', model)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor = User.objects.create_user(
+                phone_number='09121000001', password='securepassword',
+                first_name='Sara', last_name='Rad', is_doctor=True,
+            ).doctor
+            self.doctor.specialty = 'Cardiology'
+            self.doctor.save()
+            self.patient = User.objects.create_user(
+                phone_number='09121000002', password='securepassword',
+                first_name='Ali', last_name='Karimi', date_of_birth='1990-01-01',
+            ).patient
+        self.north = Clinic.objects.create(name='North', address='North street')
+        self.south = Clinic.objects.create(name='South', address='South street')
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def create_availability(self, clinic, start, end):
+        return Availability.objects.create(
+            doctor=self.doctor, clinic=clinic,
+            start_time=timezone.make_aware(datetime.combine(self.day, start)),
+            end_time=timezone.make_aware(datetime.combine(self.day, end)),
+        )
+
+    def test_users_are_replicated(self):
+        self.assertTrue(Doctor.objects.using('shard1').filter(pk=self.doctor.pk, specialty='Cardiology').exists())
+        self.assertTrue(User.objects.using('shard1').filter(pk=self.patient.user_id).exists())
+
+    def test_new_clinics_are_spread_and_get_their_shard_ids(self):
+        self.assertEqual(self.north._state.db, 'default')
+        self.assertEqual(self.south._state.db, 'shard1')
+        self.assertGreater(self.south.pk, settings.SHARD_ID_SPAN)
+        self.assertEqual(shard_for_clinic(self.south.pk), 'shard1')
+        self.assertFalse(Clinic.objects.using('default').filter(pk=self.south.pk).exists())
+
+    def test_clinic_data_follows_its_clinic(self):
+        availability = self.create_availability(self.south, time(10, 0), time(11, 0))
+        appointment = Appointment.objects.create(
+            patient=self.patient, availability=availability, selected_time='10:00',
+        )
+        self.assertEqual(availability._state.db, 'shard1')
+        self.assertEqual(appointment._state.db, 'shard1')
+        self.assertFalse(Availability.objects.using('shard1').get(pk=availability.pk).selectable_time_list['10:00'])
+        self.assertTrue(OutboxEvent.objects.using('shard1').filter(payload__appointment=appointment.pk).exists())
+        self.assertTrue(DailyUtilization.objects.using('shard1').filter(clinic=self.south).exists())
+
+        appointment.delete()
+        self.assertTrue(Availability.objects.using('shard1').get(pk=availability.pk).selectable_time_list['10:00'])
+
+    def test_reads_without_a_shard_are_merged(self):
+        late = self.create_availability(self.north, time(14, 0), time(15, 0))
+        early = self.create_availability(self.south, time(9, 0), time(10, 0))
+
+        self.assertEqual(list(Availability.objects.order_by('start_time')), [early, late])
+        self.assertEqual(list(Availability.objects.order_by('-start_time')[1:]), [early])
+        self.assertEqual(Availability.objects.count(), 2)
+        self.assertEqual(Availability.objects.filter(clinic=self.south).get(), early)
+        self.assertEqual(Availability.objects.values_list('pk', flat=True).order_by('pk')[0], late.pk)
+
+        rows = list(DailyUtilization.objects.values('doctor_id').annotate(total=Sum('total_slots')))
+        self.assertEqual(rows, [{'doctor_id': self.doctor.pk, 'total': 12}])
+        self.assertEqual(DailyUtilization.objects.aggregate(Sum('total_slots')), {'total_slots__sum': 12})
+
+    def test_writes_without_a_shard_are_refused(self):
+        with self.assertRaises(ShardNotSelected):
+            OutboxEvent.objects.create(event_type=OutboxEvent.EventType.BOOKED, payload={})
+        with atomic('shard1'):
+            OutboxEvent.objects.create(event_type=OutboxEvent.EventType.BOOKED, payload={})
+        self.assertEqual(OutboxEvent.objects.using('shard1').count(), 1)
+
+    def test_lazy_users_can_be_related(self):
+        user = SimpleLazyObject(lambda: User.objects.get(pk=self.patient.user_id))
+        self.assertTrue(router.allow_relation(user, self.north))
+
+    def test_dispatcher_drains_every_shard(self):
+        for clinic, start in ((self.north, time(10, 0)), (self.south, time(12, 0))):
+            availability = self.create_availability(clinic, start, start.replace(hour=start.hour + 1))
+            Appointment.objects.create(
+                patient=self.patient, availability=availability, selected_time=start.strftime('%H:%M'),
+            )
+        self.assertEqual(OutboxDispatcher(sinks=[LocMemSink()]).dispatch_batch(), 2)
+        self.assertFalse(OutboxEvent.objects.filter(dispatched_at__isnull=True).exists())
+
+    def test_move_clinic(self):
+        availability = self.create_availability(self.south, time(10, 0), time(11, 0))
+        Appointment.objects.create(patient=self.patient, availability=availability, selected_time='10:00')
+
+        report = move_clinic(self.south.pk, 'default')
+
+        self.assertEqual(report['appointments.Appointment'], 1)
+        self.assertEqual(shard_for_clinic(self.south.pk), 'default')
+        self.assertFalse(Availability.objects.using('shard1').exists())
+        moved = Availability.objects.get(pk=availability.pk)
+        self.assertEqual(moved._state.db, 'default')
+        self.assertEqual(moved.appointment_set.get().selected_time, '10:00')
+
+    def test_admin_writes_go_to_the_row_shard(self):
+        self.client.force_login(User.objects.create_superuser(
+            phone_number='09121000005', password='securepassword', first_name='Admin', last_name='User',
+        ))
+        availability = self.create_availability(self.south, time(10, 0), time(11, 0))
+        appointment = Appointment.objects.create(
+            patient=self.patient, availability=availability, selected_time='10:00',
+        )
+
+        response = self.client.post(
+            f'/admin/appointments/clinic/{self.south.pk}/change/', {'name': 'South wing', 'address': 'South street'},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Clinic.objects.using('shard1').get(pk=self.south.pk).name, 'South wing')
+
+        response = self.client.post(f'/admin/appointments/appointment/{appointment.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Appointment.objects.using('shard1').exists())
+        self.assertTrue(Availability.objects.using('shard1').get(pk=availability.pk).selectable_time_list['10:00'])
+
+        response = self.client.post('/admin/appointments/clinic/add/', {'name': 'East', 'address': 'East street'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Clinic.objects.filter(name='East').exists())
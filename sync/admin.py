@@ -0,0 +1,8 @@
+from django.contrib import admin
+from .models import ChangeLog
+
+
+@admin.register(ChangeLog)
+class ChangeLogAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'object_id', 'deleted', 'owner', 'created_at')
+    list_filter = ('kind', 'deleted')
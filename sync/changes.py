@@ -0,0 +1,65 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .models import ChangeLog
+from .serializers import (ClinicSyncSerializer,
+                          DoctorSyncSerializer,
+                          AvailabilitySyncSerializer,
+                          AppointmentSyncSerializer)
+from .tracking import TRACKED
+
+SERIALIZERS = {
+    ChangeLog.Kind.CLINIC: ClinicSyncSerializer,
+    ChangeLog.Kind.DOCTOR: DoctorSyncSerializer,
+    ChangeLog.Kind.AVAILABILITY: AvailabilitySyncSerializer,
+    ChangeLog.Kind.APPOINTMENT: AppointmentSyncSerializer,
+}
+MODELS = {kind: model for model, kind in TRACKED.items()}
+
+
+def visible_entries(patient_id=None):
+    '''Change log entries a client may read: public rows plus its own appointments.
+
+    Entries younger than ``SYNC_SETTLE_SECONDS`` are held back, so two
+    commits racing for neighbouring sequence numbers are both visible
+    before a cursor can pass them.
+    '''
+    horizon = timezone.now() - timedelta(seconds=settings.SYNC_SETTLE_SECONDS)
+    visible = Q(owner__isnull=True)
+    if patient_id is not None:
+        visible |= Q(owner=patient_id)
+    return ChangeLog.objects.filter(visible, created_at__lte=horizon)
+
+
+def changes_since(cursor, limit, patient_id=None, context=None):
+    '''Return one page of the changes after ``cursor``.
+
+    Several entries of the same row collapse into its current state, or a
+    tombstone when the last entry is a delete (or the row is gone).
+    '''
+    entries = list(
+        visible_entries(patient_id).filter(pk__gt=cursor).order_by('pk')
+        .values_list('pk', 'kind', 'object_id', 'deleted')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    latest = {kind: {} for kind in SERIALIZERS}
+    for _, kind, object_id, deleted in entries:
+        latest[kind][object_id] = deleted
+
+    page = {'cursor': entries[-1][0] if entries else cursor, 'has_more': has_more}
+    for kind, serializer in SERIALIZERS.items():
+        changed = [object_id for object_id, deleted in latest[kind].items() if not deleted]
+        rows = MODELS[kind].objects.filter(pk__in=changed).order_by('pk')
+        if kind == ChangeLog.Kind.DOCTOR:
+            rows = rows.select_related('user')
+        data = serializer(rows, many=True, context=context or {}).data
+        found = {row['id'] for row in data}
+        page[kind] = {
+            'changed': data,
+            'deleted': sorted(object_id for object_id in latest[kind] if object_id not in found),
+        }
+    return page
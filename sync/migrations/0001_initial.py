@@ -0,0 +1,53 @@
+# Generated by Django 5.1.1 on 2026-10-19 00:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_changelog(apps, schema_editor):
+    '''Give every existing row an entry, so ``since=0`` downloads everything.'''
+    ChangeLog = apps.get_model('sync', 'ChangeLog')
+    sources = [
+        ('clinics', apps.get_model('appointments', 'Clinic'), None),
+        ('doctors', apps.get_model('users', 'Doctor'), None),
+        ('availabilities', apps.get_model('appointments', 'Availability'), None),
+        ('appointments', apps.get_model('appointments', 'Appointment'), 'patient_id'),
+    ]
+    for kind, model, owner in sources:
+        columns = ('pk', owner) if owner else ('pk',)
+        batch = []
+        for row in model.objects.order_by('pk').values_list(*columns).iterator(chunk_size=1000):
+            batch.append(ChangeLog(kind=kind, object_id=row[0], owner=row[1] if owner else None))
+            if len(batch) == 1000:
+                ChangeLog.objects.bulk_create(batch)
+                batch = []
+        ChangeLog.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('appointments', '0005_appointment_updated_at_availability_updated_at_and_more'),
+        ('users', '0003_doctor_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('clinics', 'Clinic'), ('doctors', 'Doctor'), ('availabilities', 'Availability'), ('appointments', 'Appointment')], max_length=20, verbose_name='Kind')),
+                ('object_id', models.BigIntegerField(verbose_name='Object ID')),
+                ('deleted', models.BooleanField(default=False, verbose_name='Deleted')),
+                ('owner', models.BigIntegerField(blank=True, null=True, verbose_name='Owner')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created at')),
+            ],
+            options={
+                'verbose_name': 'Change log entry',
+                'verbose_name_plural': 'Change log entries',
+            },
+        ),
+        migrations.RunPython(backfill_changelog, migrations.RunPython.noop),
+    ]
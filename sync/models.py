@@ -0,0 +1,33 @@
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+
+class ChangeLog(models.Model):
+    '''One change of a row served by the sync API.
+
+    The auto-incrementing ``id`` is the change sequence clients page
+    through with ``/sync/?since=<cursor>``. Deletes are kept as tombstones
+    (``deleted``); ``owner`` is the patient id of private rows
+    (appointments) and empty for rows every client may see.
+    '''
+
+    class Kind(models.TextChoices):
+        CLINIC = 'clinics', _('Clinic')
+        DOCTOR = 'doctors', _('Doctor')
+        AVAILABILITY = 'availabilities', _('Availability')
+        APPOINTMENT = 'appointments', _('Appointment')
+
+    kind = models.CharField(max_length=20, choices=Kind.choices, verbose_name=_("Kind"))
+    object_id = models.BigIntegerField(verbose_name=_("Object ID"))
+    deleted = models.BooleanField(default=False, verbose_name=_("Deleted"))
+    owner = models.BigIntegerField(null=True, blank=True, verbose_name=_("Owner"))
+    created_at = models.DateTimeField(default=timezone.now, verbose_name=_("Created at"))
+
+    class Meta:
+        verbose_name = _("Change log entry")
+        verbose_name_plural = _("Change log entries")
+
+    def __str__(self):
+        action = 'delete' if self.deleted else 'upsert'
+        return f"#{self.pk} {action} {self.kind}:{self.object_id}"
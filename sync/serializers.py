@@ -0,0 +1,111 @@
+from django.conf import settings
+from rest_framework import serializers
+from users.models import Doctor
+from users.serializers import PhotoThumbnailField
+from appointments.models import Clinic, Availability, Appointment
+
+
+class SyncQuerySerializer(serializers.Serializer):
+    '''SyncQuerySerializer for validating sync parameters.
+
+    ## Fields:
+    - since: Cursor returned by the previous page (0 for a full download)
+    - limit: Maximum number of changes in the page
+    '''
+
+    since = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=settings.SYNC_MAX_PAGE_SIZE,
+                                     default=settings.SYNC_PAGE_SIZE)
+
+
+class ClinicSyncSerializer(serializers.ModelSerializer):
+    '''ClinicSyncSerializer for one changed clinic.
+
+    ## Fields:
+    - id: Clinic ID
+    - name: Clinic name
+    - address: Clinic address
+    - updated_at: Time of the last change
+    '''
+
+    class Meta:
+        model = Clinic
+        fields = ['id', 'name', 'address', 'updated_at']
+
+
+class DoctorSyncSerializer(serializers.ModelSerializer):
+    '''DoctorSyncSerializer for one changed doctor, flattened.
+
+    ## Fields:
+    - id: Doctor ID
+    - user: User ID
+    - first_name: Doctor's first name
+    - last_name: Doctor's last name
+    - gender: Doctor's gender
+    - medical_code: Doctor's medical code
+    - specialty: Doctor's specialty
+    - photo: Doctor's profile photo
+    - photo_thumbnail: URL of a resized copy of the photo
+    - updated_at: Time of the last change
+    '''
+
+    first_name = serializers.CharField(source='user.first_name')
+    last_name = serializers.CharField(source='user.last_name')
+    gender = serializers.CharField(source='user.gender')
+    photo_thumbnail = PhotoThumbnailField()
+
+    class Meta:
+        model = Doctor
+        fields = ['id', 'user', 'first_name', 'last_name', 'gender', 'medical_code', 'specialty',
+                  'photo', 'photo_thumbnail', 'updated_at']
+
+
+class AvailabilitySyncSerializer(serializers.ModelSerializer):
+    '''AvailabilitySyncSerializer for one changed availability.
+
+    ## Fields:
+    - id: Availability ID
+    - doctor: Doctor ID
+    - clinic: Clinic ID
+    - start_time: Start time of availability
+    - end_time: End time of availability
+    - selectable_time_list: Slot times and whether they are still free
+    - updated_at: Time of the last change
+    '''
+
+    class Meta:
+        model = Availability
+        fields = ['id', 'doctor', 'clinic', 'start_time', 'end_time', 'selectable_time_list', 'updated_at']
+
+
+class AppointmentSyncSerializer(serializers.ModelSerializer):
+    '''AppointmentSyncSerializer for one changed appointment of the requesting patient.
+
+    ## Fields:
+    - id: Appointment ID
+    - availability: Availability ID
+    - selected_time: Selected slot time
+    - scheduled_at: Date and time of the appointment
+    - updated_at: Time of the last change
+    '''
+
+    class Meta:
+        model = Appointment
+        fields = ['id', 'availability', 'selected_time', 'scheduled_at', 'updated_at']
+
+
+class SyncPageSerializer(serializers.Serializer):
+    '''SyncPageSerializer documenting one page of changes.
+
+    ## Fields:
+    - cursor: Value to send as ``since`` for the next page
+    - has_more: Whether more changes are waiting
+    - clinics, doctors, availabilities, appointments: ``changed`` rows and ``deleted`` IDs
+    '''
+
+    cursor = serializers.IntegerField()
+    has_more = serializers.BooleanField()
+    clinics = serializers.DictField()
+    doctors = serializers.DictField()
+    availabilities = serializers.DictField()
+    appointments = serializers.DictField()
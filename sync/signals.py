@@ -0,0 +1,47 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from users.models import Doctor, User
+from users.signals import SEARCHED_USER_FIELDS
+from appointments.models import Clinic, Availability, Appointment
+from appointments.signals import rows_changed
+from .tracking import TRACKED, record_changes
+
+# Receivers are bound to the tracked models only: a post_delete receiver
+# without a sender would disable fast deletes for every model.
+
+
+@receiver(post_save, sender=Clinic)
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Availability)
+@receiver(post_save, sender=Appointment)
+def track_save(sender, instance, using, **kwargs):
+    record_changes(sender, [instance], using=using)
+
+
+@receiver(post_save, sender=User)
+def track_doctor_names(sender, instance, created, using, raw=False, update_fields=None, **kwargs):
+    # the synced doctor rows carry the user's name; logins save last_login only
+    if created or raw or not instance.is_doctor:
+        return
+    if update_fields is not None and not SEARCHED_USER_FIELDS & set(update_fields):
+        return
+    try:
+        doctor = instance.doctor
+    except Doctor.DoesNotExist:
+        return
+    record_changes(Doctor, [doctor], using=using)
+
+
+@receiver(post_delete, sender=Clinic)
+@receiver(post_delete, sender=Doctor)
+@receiver(post_delete, sender=Availability)
+@receiver(post_delete, sender=Appointment)
+def track_delete(sender, instance, using, **kwargs):
+    record_changes(sender, [instance], deleted=True, using=using)
+
+
+@receiver(rows_changed)
+def track_rows(sender, instances, **kwargs):
+    if sender in TRACKED and instances:
+        record_changes(sender, instances, using=instances[0]._state.db or DEFAULT_DB_ALIAS)
@@ -0,0 +1,156 @@
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, time, timedelta
+
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from users.models import User
+from appointments.bulk import cancel_appointments
+from appointments.models import Clinic, Availability, Appointment
+from sharding import routing as sharding
+from .models import ChangeLog
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        with self.committing():
+            doctor_user = User.objects.create_user(
+                phone_number='09123000001', password='securepassword',
+                first_name='Sara', last_name='Rad', is_doctor=True
+            )
+            self.doctor = doctor_user.doctor
+            self.doctor.medical_code = 'MC-1'
+            self.doctor.specialty = 'Cardiology'
+            self.doctor.save()
+            self.patient = User.objects.create_user(
+                phone_number='09123000002', password='securepassword',
+                first_name='Ali', last_name='Karimi'
+            ).patient
+            self.clinic = Clinic.objects.create(name='Central', address='Main street')
+            start = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(10, 0)))
+            self.availability = Availability.objects.create(
+                doctor=self.doctor, clinic=self.clinic, start_time=start, end_time=start + timedelta(hours=1)
+            )
+        self.client = APIClient()
+        self.client.force_authenticate(self.patient.user)
+
+    @contextmanager
+    def committing(self):
+        # entries for shard rows are written when the shard transaction commits
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(self.captureOnCommitCallbacks(using=alias, execute=True))
+            yield
+
+    def sync(self, since=0, **params):
+        response = self.client.get('/sync/', {'since': since, **params})
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def ids(self, page, kind, part='changed'):
+        rows = page[kind][part]
+        return [row['id'] for row in rows] if part == 'changed' else rows
+
+    def test_full_then_incremental(self):
+        page = self.sync()
+        self.assertFalse(page['has_more'])
+        self.assertEqual(self.ids(page, 'clinics'), [self.clinic.pk])
+        self.assertEqual(self.ids(page, 'doctors'), [self.doctor.pk])
+        self.assertEqual(page['doctors']['changed'][0]['first_name'], 'Sara')
+        self.assertEqual(self.ids(page, 'availabilities'), [self.availability.pk])
+
+        with self.committing():
+            appointment = Appointment.objects.create(
+                patient=self.patient, availability=self.availability, selected_time='10:00'
+            )
+        changes = self.sync(page['cursor'])
+        self.assertEqual(self.ids(changes, 'clinics'), [])
+        self.assertEqual(self.ids(changes, 'doctors'), [])
+        self.assertEqual(self.ids(changes, 'appointments'), [appointment.pk])
+        [availability] = changes['availabilities']['changed']
+        self.assertFalse(availability['selectable_time_list']['10:00'])
+        self.assertEqual(self.sync(changes['cursor'])['cursor'], changes['cursor'])
+
+    def test_deletes_become_tombstones(self):
+        cursor = self.sync()['cursor']
+        with self.committing():
+            clinic = Clinic.objects.create(name='Temporary', address='Side street')
+            clinic_id = clinic.pk
+            clinic.delete()
+            availability_id = self.availability.pk
+            self.availability.delete()
+        page = self.sync(cursor)
+        self.assertEqual(self.ids(page, 'clinics', 'deleted'), [clinic_id])
+        self.assertEqual(self.ids(page, 'availabilities', 'deleted'), [availability_id])
+        self.assertEqual(self.ids(page, 'clinics'), [])
+
+    def test_appointments_are_private(self):
+        with self.committing():
+            Appointment.objects.create(patient=self.patient, availability=self.availability, selected_time='10:00')
+        other = User.objects.create_user(
+            phone_number='09123000003', password='securepassword', first_name='Reza', last_name='Amini'
+        )
+        self.client.force_authenticate(other)
+        page = self.sync()
+        self.assertEqual(page['appointments'], {'changed': [], 'deleted': []})
+        self.assertEqual(len(self.ids(page, 'availabilities')), 1)
+
+    def test_pages_follow_the_cursor(self):
+        seen, cursor, more = [], 0, True
+        while more:
+            page = self.sync(cursor, limit=1)
+            for kind in ('clinics', 'doctors', 'availabilities'):
+                seen += [(kind, object_id) for object_id in self.ids(page, kind)]
+            cursor, more = page['cursor'], page['has_more']
+        self.assertEqual(set(seen), {
+            ('clinics', self.clinic.pk), ('doctors', self.doctor.pk), ('availabilities', self.availability.pk),
+        })
+
+    def test_set_based_writes_are_tracked(self):
+        with self.committing():
+            appointment = Appointment.objects.create(
+                patient=self.patient, availability=self.availability, selected_time='10:00'
+            )
+        cursor = self.sync()['cursor']
+        updated_at = Availability.objects.get(pk=self.availability.pk).updated_at
+        with self.committing():
+            Appointment.objects.get(pk=appointment.pk).reschedule(self.availability.pk, '10:20')
+        page = self.sync(cursor)
+        self.assertEqual(page['appointments']['changed'][0]['selected_time'], '10:20')
+        self.assertGreater(Availability.objects.get(pk=self.availability.pk).updated_at, updated_at)
+
+        with self.committing():
+            cancel_appointments(availability_ids=[self.availability.pk])
+        page = self.sync(page['cursor'])
+        self.assertEqual(self.ids(page, 'appointments', 'deleted'), [appointment.pk])
+        self.assertTrue(page['availabilities']['changed'][0]['selectable_time_list']['10:20'])
+
+    def test_doctor_renames_are_tracked(self):
+        cursor = self.sync()['cursor']
+        user = self.doctor.user
+        with self.committing():
+            user.save(update_fields=['last_login'])
+        self.assertEqual(self.ids(self.sync(cursor), 'doctors'), [])
+
+        with self.committing():
+            user.last_name = 'Rahimi'
+            user.save(update_fields=['last_name'])
+        page = self.sync(cursor)
+        self.assertEqual(self.ids(page, 'doctors'), [self.doctor.pk])
+        self.assertEqual(page['doctors']['changed'][0]['last_name'], 'Rahimi')
+
+    def test_rolled_back_writes_leave_no_entries(self):
+        count = ChangeLog.objects.count()
+        with self.committing():
+            try:
+                clinic = Clinic(name='Never', address='Nowhere')
+                with sharding.atomic(clinic):
+                    clinic.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(ChangeLog.objects.count(), count)
@@ -0,0 +1,34 @@
+from django.db import DEFAULT_DB_ALIAS, transaction
+from users.models import Doctor
+from appointments.models import Clinic, Availability, Appointment
+from .models import ChangeLog
+
+TRACKED = {
+    Clinic: ChangeLog.Kind.CLINIC,
+    Doctor: ChangeLog.Kind.DOCTOR,
+    Availability: ChangeLog.Kind.AVAILABILITY,
+    Appointment: ChangeLog.Kind.APPOINTMENT,
+}
+
+
+def owner_of(instance):
+    '''Patient id of a private row, ``None`` for public ones.'''
+    return instance.patient_id if isinstance(instance, Appointment) else None
+
+
+def record_changes(model, instances, deleted=False, using=DEFAULT_DB_ALIAS):
+    '''Append change log entries for ``instances`` once the transaction commits.
+
+    Writing after the commit keeps the sequence in commit order: an entry
+    can only become visible after the row change it announces, so a client
+    never moves its cursor past a change it could not see yet. Rolled back
+    writes leave no entries. ``using`` is the database of the change (a
+    shard for clinic data); the log itself lives on the default database.
+    '''
+    kind = TRACKED[model]
+    entries = [
+        ChangeLog(kind=kind, object_id=instance.pk, deleted=deleted, owner=owner_of(instance))
+        for instance in instances
+    ]
+    if entries:
+        transaction.on_commit(lambda: ChangeLog.objects.bulk_create(entries), using=using)
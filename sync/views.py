@@ -0,0 +1,32 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework import status
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from healthcare_appointment_system.apidocs import swagger_auto_schema
+from users.models import Patient
+from .changes import changes_since
+from .serializers import SyncQuerySerializer, SyncPageSerializer
+
+
+class SyncAPIView(APIView):
+    '''Incremental download of clinics, doctors, availabilities and the user's appointments.'''
+
+    permission_classes = [IsAuthenticated]
+
+    @swagger_auto_schema(
+        query_serializer=SyncQuerySerializer,
+        responses={200: SyncPageSerializer},
+        operation_description=_('Changes after a cursor, in change order. Repeat with the returned cursor '
+                                'while has_more is true.')
+    )
+    def get(self, request):
+        '''Return the next page of changes.'''
+        query = SyncQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        patient_id = Patient.objects.filter(user=request.user).values_list('pk', flat=True).first()
+        page = changes_since(
+            query.validated_data['since'], query.validated_data['limit'],
+            patient_id=patient_id, context={'request': request},
+        )
+        return Response(page, status=status.HTTP_200_OK)
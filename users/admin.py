@@ -1,6 +1,7 @@
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 from .models import User, Doctor, Patient
+from .search import search_doctors
 
 admin.site.site_header = _("The management panel of the healthcare appointment system")
 
@@ -43,6 +44,7 @@ class DoctorAdmin(admin.ModelAdmin):
     search_fields = ('user__last_name', 'medical_code', 'specialty')
     list_filter = ('specialty',)
     ordering = ('user__last_name',)
+    raw_id_fields = ('user',)
 
     fieldsets = (
         (None, {
@@ -50,12 +52,23 @@ class DoctorAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        # str(doctor) reads the user, here and in the availability autocomplete
+        return super().get_queryset(request).select_related('user')
+
+    def get_search_results(self, request, queryset, search_term):
+        # search_fields only turns the search box on; terms go through the token index
+        if not search_term.strip():
+            return queryset, False
+        return search_doctors(search_term, queryset), False
+
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
     list_display = ('user', 'insurance_type')
     search_fields = ('user__last_name',)
     list_filter = ('insurance_type',)
     ordering = ('user__last_name',)
+    raw_id_fields = ('user',)
 
     fieldsets = (
         (None, {
@@ -63,4 +76,7 @@ class PatientAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+
 admin.site.register(User, UserAdmin)
@@ -0,0 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from users.models import Doctor, Patient
+from users.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = "Generate the cached thumbnails of existing doctor and patient photos."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help="Re-render thumbnails even when the photo content did not change.",
+        )
+        parser.add_argument(
+            '--workers', type=int, default=settings.PHOTO_THUMBNAIL_WORKERS,
+            help="Number of threads rendering images in parallel.",
+        )
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        force = options['force']
+
+        def work(instance):
+            try:
+                return generate_thumbnails(instance, force=force) is not None
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for model in (Doctor, Patient):
+                photos = (
+                    model.objects.exclude(photo='').exclude(photo__isnull=True)
+                    .only('id', 'photo', 'photo_thumbnails').order_by('pk')
+                )
+                done = skipped = 0
+                chunk = []
+                for instance in photos.iterator(chunk_size=options['chunk_size']):
+                    chunk.append(instance)
+                    if len(chunk) == options['chunk_size']:
+                        results = list(executor.map(work, chunk))
+                        done += sum(results)
+                        skipped += len(results) - sum(results)
+                        chunk = []
+                results = list(executor.map(work, chunk))
+                done += sum(results)
+                skipped += len(results) - sum(results)
+                self.stdout.write(f"{model._meta.verbose_name_plural}: {done} generated, {skipped} skipped.")
+        self.stdout.write(self.style.SUCCESS("Thumbnail backfill finished."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from users.models import Doctor
+from users.search import index_doctors
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search tokens of every doctor."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        doctors = Doctor.objects.select_related('user').order_by('pk')
+        indexed = last = 0
+        while batch := list(doctors.filter(pk__gt=last)[:options['batch_size']]):
+            index_doctors(batch)
+            last = batch[-1].pk
+            indexed += len(batch)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} doctors."))
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctor',
+            name='photo_thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Photo thumbnails'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='photo_thumbnails',
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name='Photo thumbnails'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.1 on 2026-10-19 01:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def add_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX users_doctorsearchtoken_token_trgm '
+        'ON users_doctorsearchtoken USING gin (token gin_trgm_ops)'
+    )
+
+
+def remove_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS users_doctorsearchtoken_token_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_doctor_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(db_index=True, max_length=64, verbose_name='Token')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='users.doctor', verbose_name='Doctor')),
+            ],
+            options={
+                'verbose_name': 'Doctor search token',
+                'verbose_name_plural': 'Doctor search tokens',
+            },
+        ),
+        migrations.RunPython(add_trigram_index, remove_trigram_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.1 on 2026-10-19 02:06
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def number_duplicate_slugs(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    users = User.objects.using(schema_editor.connection.alias)
+    taken = set(users.exclude(slug=None).values_list('slug', flat=True))
+    duplicates = users.values('slug').annotate(count=Count('pk')).filter(count__gt=1).exclude(slug=None)
+    for slug in duplicates.values_list('slug', flat=True):
+        # the first user keeps the slug
+        for user in users.filter(slug=slug).order_by('pk')[1:]:
+            number = 2
+            while f"{slug}-{number}" in taken:
+                number += 1
+            user.slug = f"{slug}-{number}"
+            taken.add(user.slug)
+            user.save(update_fields=['slug'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0004_doctor_search_token'),
+    ]
+
+    operations = [
+        migrations.RunPython(number_duplicate_slugs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='user',
+            name='slug',
+            field=models.SlugField(blank=True, editable=False, max_length=120, null=True, unique=True, verbose_name='Slug'),
+        ),
+    ]
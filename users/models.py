@@ -1,12 +1,16 @@
 import uuid
+from functools import partial
 
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db import models
+from django.db import IntegrityError, models, transaction
 from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import gettext
 from .validators import phone_number_validator
 
+# saves a slug may be lost to before giving up (see User.claim_slug)
+SLUG_ATTEMPTS = 5
+
 
 class Gender(models.TextChoices):
     MALE = 'M', _('Male')
@@ -56,7 +60,10 @@ class User(AbstractBaseUser, PermissionsMixin):
         max_length=1, choices=Gender.choices,
         default=Gender.UNSET, verbose_name=_("Gender")
     )
-    slug = models.SlugField(null=True, blank=True, editable=False, verbose_name=_("Slug"))
+    slug = models.SlugField(
+        max_length=120, unique=True, null=True,
+        blank=True, editable=False, verbose_name=_("Slug")
+    )
     phone_number = models.CharField(
         max_length=11, validators=[phone_number_validator],
         unique=True, verbose_name=_("Phone Number")
@@ -74,9 +81,40 @@ class User(AbstractBaseUser, PermissionsMixin):
     objects = UserManager()
 
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(f"{self.first_name}-{self.last_name}-{str(self.id)[:8]}")
-        super().save(*args, **kwargs)
+        if self.slug:
+            return super().save(*args, **kwargs)
+        parts = (self.first_name, self.last_name, str(self.id)[:8])
+        self.slug = self.unique_slug(*parts)
+        self.claim_slug(partial(super().save, *args, **kwargs), *parts)
+
+    def unique_slug(self, *parts):
+        '''Slug of ``parts`` not taken by another user (a counter is appended if it is).'''
+        max_length = self._meta.get_field('slug').max_length - 4
+        base = slugify('-'.join(str(part) for part in parts if part))[:max_length].strip('-')
+        if not base or base.isdigit():
+            # an all-digit slug would be read as a doctor id in the URLs
+            base = f"{'dr' if self.is_doctor else 'user'}-{base}".strip('-')
+        slug, number = base, 1
+        while User.objects.filter(slug=slug).exclude(pk=self.pk).exists():
+            number += 1
+            slug = f"{base}-{number}"
+        return slug
+
+    def claim_slug(self, save, *parts):
+        '''Run ``save`` with ``self.slug``, moving to the next free slug of ``parts`` if it was taken.
+
+        ``unique_slug`` only checks: a concurrent save can take the same slug
+        before ours is written, and then the unique index refuses it.
+        '''
+        for attempt in range(1, SLUG_ATTEMPTS + 1):
+            try:
+                with transaction.atomic():
+                    return save()
+            except IntegrityError:
+                taken = User.objects.filter(slug=self.slug).exclude(pk=self.pk).exists()
+                if not taken or attempt == SLUG_ATTEMPTS:
+                    raise
+                self.slug = self.unique_slug(*parts)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.phone_number})"
@@ -91,10 +129,18 @@ class Doctor(models.Model):
     specialty = models.CharField(max_length=100, verbose_name=_("Specialty"))
     medical_code = models.CharField(max_length=50, unique=True, verbose_name=_("Medical Code"))
     photo = models.ImageField(upload_to='doctor_photos/', verbose_name=_("Photo"))
+    photo_thumbnails = models.JSONField(default=dict, blank=True, editable=False, verbose_name=_("Photo thumbnails"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Updated at"))
 
     def save(self, *args, **kwargs):
         self.photo.name = f"doctor_{self.medical_code}.png"
-        self.user.slug = slugify(f"{self.user.first_name}-{self.user.last_name}-{self.medical_code}")
+        parts = (self.user.first_name, self.user.last_name, self.medical_code)
+        slug = self.user.unique_slug(*parts)
+        if slug != self.user.slug:
+            # the profile URL follows the name (see users.signals)
+            self._renamed_from = self.user.slug
+            self.user.slug = slug
+            self.user.claim_slug(partial(self.user.save, update_fields=['slug']), *parts)
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -122,13 +168,19 @@ class Patient(models.Model):
         upload_to='user_photos/', null=True,
         blank=True, verbose_name=_("Photo")
     )
+    photo_thumbnails = models.JSONField(default=dict, blank=True, editable=False, verbose_name=_("Photo thumbnails"))
 
     def save(self, *args, **kwargs):
         if self.photo:
             self.photo.name = f"patient_{str(self.user.id)[:10]}.png"
 
-        self.user.slug = slugify(f"{str(self.id)[:8]}-{self.user.first_name}-{self.user.last_name}")
         super().save(*args, **kwargs)
+        # after the insert: the slug starts with the patient id
+        parts = (str(self.id)[:8], self.user.first_name, self.user.last_name)
+        slug = self.user.unique_slug(*parts)
+        if slug != self.user.slug:
+            self.user.slug = slug
+            self.user.claim_slug(partial(self.user.save, update_fields=['slug']), *parts)
 
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name}"
@@ -136,3 +188,18 @@ class Patient(models.Model):
     class Meta:
         verbose_name = _("Patient")
         verbose_name_plural = _("Patients")
+
+
+class DoctorSearchToken(models.Model):
+    '''One normalized word of a doctor's name, specialty or medical code (see ``users.search``).'''
+    doctor = models.ForeignKey(
+        Doctor, on_delete=models.CASCADE, related_name='search_tokens', verbose_name=_("Doctor")
+    )
+    token = models.CharField(max_length=64, db_index=True, verbose_name=_("Token"))
+
+    def __str__(self):
+        return self.token
+
+    class Meta:
+        verbose_name = _("Doctor search token")
+        verbose_name_plural = _("Doctor search tokens")
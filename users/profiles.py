@@ -0,0 +1,69 @@
+'''Public doctor profiles, addressed by the slug of the doctor's user.
+
+Slugs are resolved to doctor ids through the cache (``DOCTOR_SLUG_CACHE_SECONDS``).
+When a doctor is renamed or deleted the entry of the old slug is dropped
+(``users.signals``), so a stale slug stops resolving at once.
+'''
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import Doctor
+
+
+def slug_key(slug):
+    return f'doctor-slug:{slug}'
+
+
+def doctor_id_for_slug(slug):
+    '''Id of the doctor whose profile slug is ``slug``, or ``None``.'''
+    doctor_id = cache.get(slug_key(slug))
+    if doctor_id is None:
+        doctor_id = Doctor.objects.filter(user__slug=slug).values_list('pk', flat=True).first()
+        if doctor_id is not None:
+            cache.set(slug_key(slug), doctor_id, settings.DOCTOR_SLUG_CACHE_SECONDS)
+    return doctor_id
+
+
+def forget_slug(slug):
+    if slug:
+        cache.delete(slug_key(slug))
+
+
+def next_free_slots(doctor_id, limit=None, now=None):
+    '''The doctor's next ``limit`` free slots within ``DOCTOR_PROFILE_SLOT_DAYS``.
+
+    One query reads the availabilities (with their clinic) of the period;
+    the free ``HH:MM`` slots are picked from them in order.
+    '''
+    from appointments.models import Availability
+
+    now = now or timezone.now()
+    limit = limit or settings.DOCTOR_PROFILE_SLOTS
+    rows = (
+        Availability.objects
+        .filter(doctor_id=doctor_id, end_time__gt=now,
+                start_time__lt=now + timedelta(days=settings.DOCTOR_PROFILE_SLOT_DAYS))
+        .order_by('start_time', 'pk')
+        .values_list('pk', 'clinic_id', 'clinic__name', 'start_time', 'selectable_time_list')
+    )
+    slots = []
+    for availability_id, clinic_id, clinic_name, start_time, times in rows:
+        for selected_time, selectable in sorted((times or {}).items()):
+            if not selectable:
+                continue
+            hour, minute = (int(part) for part in selected_time.split(':'))
+            scheduled_at = start_time.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if scheduled_at < now:
+                continue
+            slots.append({
+                'availability': availability_id,
+                'clinic': {'id': clinic_id, 'name': clinic_name},
+                'selected_time': selected_time,
+                'scheduled_at': scheduled_at,
+            })
+            if len(slots) == limit:
+                return slots
+    return slots
@@ -0,0 +1,153 @@
+'''Doctor directory search.
+
+The names, specialty and medical code of every doctor are normalized
+(``normalize``) and split into words stored in ``DoctorSearchToken``. Each
+word of a query has to be the prefix of one of a doctor's tokens, which is
+an index range scan per word however large the directory grows. On
+PostgreSQL with the ``pg_trgm`` extension (``DOCTOR_SEARCH_TRIGRAM``),
+words of ``TRIGRAM_MIN_LENGTH`` letters or more also match tokens that are
+merely similar, so a typo still finds the doctor.
+
+The specialty facet counts of a query are cached for
+``DOCTOR_SEARCH_FACET_SECONDS``; indexing a doctor drops all of them.
+'''
+import hashlib
+import re
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections, transaction
+from django.db.models import Count, F, Q, Value
+
+from .models import Doctor, DoctorSearchToken
+
+TOKEN_LENGTH = DoctorSearchToken._meta.get_field('token').max_length
+TRIGRAM_MIN_LENGTH = 4
+MAX_QUERY_WORDS = 8
+GENERATION_KEY = 'doctor-search:generation'
+# sorts after every character, so [word, word + PREFIX_END) holds the words starting with word
+PREFIX_END = '\U0010ffff'
+
+ZWNJ = '\u200c'
+# Arabic letters typed on Arabic keyboards or pasted from Arabic text, and
+# Arabic-Indic / Persian digits
+CHARACTERS = str.maketrans({
+    '\u064a': '\u06cc', '\u0649': '\u06cc',  # yeh, alef maksura -> Persian yeh
+    '\u0643': '\u06a9',  # kaf -> keheh
+    '\u0629': '\u0647', '\u06c0': '\u0647',  # teh marbuta, heh with yeh -> heh
+    '\u0624': '\u0648',  # waw with hamza -> waw
+    '\u0622': '\u0627', '\u0623': '\u0627', '\u0625': '\u0627', '\u0671': '\u0627',  # alef forms -> alef
+    **{chr(0x0660 + digit): str(digit) for digit in range(10)},
+    **{chr(0x06F0 + digit): str(digit) for digit in range(10)},
+})
+# diacritics, superscript alef, tatweel and the zero width joiner
+IGNORED = re.compile('[\u064b-\u065f\u0670\u0640\u200d]')
+WORD_BREAKS = re.compile(rf'[^\w{ZWNJ}]+')
+
+_trigram_aliases = {}
+
+
+def normalize(text):
+    '''Case- and script-folded ``text``, keeping word breaks and ZWNJs.'''
+    text = unicodedata.normalize('NFKC', text or '').casefold().translate(CHARACTERS)
+    return IGNORED.sub('', text)
+
+
+def tokens(text):
+    '''The words of ``text`` to index.
+
+    A word written with a ZWNJ (half space) is indexed whole and by its
+    parts, so "محمد‌رضا" is found by "محمدرضا", "محمد" and "رضا".
+    '''
+    found = set()
+    for word in WORD_BREAKS.split(normalize(text)):
+        parts = [part for part in word.split(ZWNJ) if part]
+        if len(parts) > 1:
+            found.update(parts)
+        if parts:
+            found.add(''.join(parts))
+    return {token[:TOKEN_LENGTH] for token in found}
+
+
+def query_words(text):
+    '''The distinct words of a search, at most ``MAX_QUERY_WORDS``.'''
+    words = []
+    for word in WORD_BREAKS.split(normalize(text).replace(ZWNJ, '')):
+        word = word[:TOKEN_LENGTH]
+        if word and word not in words:
+            words.append(word)
+    return words[:MAX_QUERY_WORDS]
+
+
+def doctor_tokens(doctor):
+    user = doctor.user
+    return tokens(' '.join((user.first_name, user.last_name, doctor.specialty, doctor.medical_code or '')))
+
+
+def index_doctors(doctors):
+    '''Rebuild the search tokens of ``doctors``.'''
+    doctors = list(doctors)
+    with transaction.atomic():
+        DoctorSearchToken.objects.filter(doctor__in=doctors).delete()
+        DoctorSearchToken.objects.bulk_create(
+            (DoctorSearchToken(doctor=doctor, token=token)
+             for doctor in doctors for token in sorted(doctor_tokens(doctor))),
+            batch_size=1000,
+        )
+    forget_facets()
+
+
+def trigram_enabled(alias):
+    '''Whether ``alias`` is PostgreSQL with ``pg_trgm`` installed.'''
+    if not settings.DOCTOR_SEARCH_TRIGRAM or connections[alias].vendor != 'postgresql':
+        return False
+    if alias not in _trigram_aliases:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+                _trigram_aliases[alias] = cursor.fetchone() is not None
+        except DatabaseError:
+            return False
+    return _trigram_aliases[alias]
+
+
+def matching(word):
+    '''Ids of the doctors with a token matching ``word``, as a subquery.'''
+    # range bounds, not startswith: SQLite cannot use an index for LIKE 'word%'
+    condition = Q(token__gte=word, token__lt=word + PREFIX_END)
+    if len(word) >= TRIGRAM_MIN_LENGTH and trigram_enabled(DoctorSearchToken.objects.db):
+        from django.contrib.postgres.lookups import TrigramSimilar
+        condition |= Q(TrigramSimilar(F('token'), Value(word)))
+    return DoctorSearchToken.objects.filter(condition).values('doctor_id')
+
+
+def search_doctors(text, queryset=None):
+    '''The doctors of ``queryset`` (default: all) matching every word of ``text``.'''
+    doctors = Doctor.objects.all() if queryset is None else queryset
+    for word in query_words(text):
+        doctors = doctors.filter(pk__in=matching(word))
+    return doctors
+
+
+def facets(text):
+    '''``[{'specialty': ..., 'count': ...}, ...]`` of the doctors matching ``text``, largest first.'''
+    generation = cache.get_or_set(GENERATION_KEY, 1, None)
+    digest = hashlib.md5(' '.join(query_words(text)).encode()).hexdigest()
+    key = f'doctor-search:facets:{generation}:{digest}'
+    counts = cache.get(key)
+    if counts is None:
+        counts = list(
+            search_doctors(text).order_by().values('specialty')
+            .annotate(count=Count('pk')).order_by('-count', 'specialty')
+        )
+        cache.set(key, counts, settings.DOCTOR_SEARCH_FACET_SECONDS)
+    return counts
+
+
+def forget_facets():
+    '''Drop every cached facet count.'''
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
@@ -1,10 +1,33 @@
+from django.conf import settings
 from rest_framework import serializers
 from django.contrib.auth.hashers import make_password
+from healthcare_appointment_system.fieldsets import SparseFieldsetMixin
 from .models import User, Doctor, Patient
 from .validators import phone_number_validator
+from .thumbnails import thumbnail_url
 from datetime import date
 
 
+class PhotoThumbnailField(serializers.ReadOnlyField):
+    '''Read-only URL of a cached photo thumbnail.
+
+    The variant and format can be picked with the ``photo_variant`` and
+    ``photo_format`` query parameters (defaults: small, webp).
+    '''
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('source', 'photo_thumbnails')
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        request = self.context.get('request')
+        params = getattr(request, 'query_params', None) or {}
+        url = thumbnail_url(value, params.get('photo_variant'), params.get('photo_format'))
+        if url and request is not None:
+            return request.build_absolute_uri(url)
+        return url
+
+
 class UserSerializer(serializers.ModelSerializer):
     '''UserSerializer for serializing and validating user data.
 
@@ -39,14 +62,15 @@ class LimitUserDoctorSerializer(serializers.ModelSerializer):
     - first_name: User's first name
     - last_name: User's last name
     - gender: the gender of the user.
+    - slug: Address of the doctor's profile (/doctors/<slug>/)
     '''
 
     class Meta:
         model = User
-        fields = ['first_name', 'last_name', 'gender']
+        fields = ['first_name', 'last_name', 'gender', 'slug']
 
 
-class DoctorSerializer(serializers.ModelSerializer):
+class DoctorSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     '''DoctorSerializer for viewing Doctor information accessible to all.
 
        ## Fields:
@@ -54,13 +78,15 @@ class DoctorSerializer(serializers.ModelSerializer):
        - medical_code: Doctor's medical code
        - specialty: Doctor's specialty
        - photo: Doctor's profile photo
+       - photo_thumbnail: URL of a resized copy of the photo
        '''
 
     user = LimitUserDoctorSerializer()
+    photo_thumbnail = PhotoThumbnailField()
 
     class Meta:
         model = Doctor
-        fields = ['user', 'medical_code', 'specialty', 'photo']
+        fields = ['user', 'medical_code', 'specialty', 'photo', 'photo_thumbnail']
         read_only_fields = ['user', 'medical_code', 'specialty', 'photo']
 
 
@@ -99,20 +125,22 @@ class DoctorManagementSerializer(serializers.ModelSerializer):
         instance.save()
 
 
-class PatientSerializer(serializers.ModelSerializer):
+class PatientSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     '''PatientSerializer for managing Patient information.
     
     ## Fields:
     - user: Nested serializer for the User data
     - insurance_type: Patient's insurance type
     - photo: Patient's profile photo
+    - photo_thumbnail: URL of a resized copy of the photo
     '''
 
     user = UserSerializer()
+    photo_thumbnail = PhotoThumbnailField()
 
     class Meta:
         model = Patient
-        fields = ['user', 'insurance_type', 'photo']
+        fields = ['user', 'insurance_type', 'photo', 'photo_thumbnail']
         read_only_fields = ['user']
 
     def create(self, validated_data):
@@ -144,6 +172,7 @@ class LimitUserPatientSerializer(serializers.ModelSerializer):
     '''
 
     age = serializers.SerializerMethodField()
+    sparse_sources = {'age': ['date_of_birth']}
 
     class Meta:
         model = User
@@ -169,3 +198,88 @@ class LimitPatientSerializer(serializers.ModelSerializer):
     class Meta:
         model = Patient
         fields = ['user', 'insurance_type']
+
+
+class DoctorSearchQuerySerializer(serializers.Serializer):
+    '''DoctorSearchQuerySerializer for validating a doctor directory search.
+
+    ## Fields:
+    - q: Words to look for in doctors' names, specialties and medical codes
+    - specialty: Only doctors with this specialty
+    - limit: Maximum number of doctors
+    - offset: Number of doctors to skip
+    '''
+
+    q = serializers.CharField(required=False, allow_blank=True, max_length=100, default='')
+    specialty = serializers.CharField(required=False, max_length=100)
+    limit = serializers.IntegerField(min_value=1, max_value=settings.DOCTOR_SEARCH_MAX_PAGE_SIZE,
+                                     default=settings.DOCTOR_SEARCH_PAGE_SIZE)
+    offset = serializers.IntegerField(min_value=0, default=0)
+
+
+class SpecialtyFacetSerializer(serializers.Serializer):
+    '''SpecialtyFacetSerializer for the number of matching doctors of one specialty.
+
+    ## Fields:
+    - specialty: Specialty
+    - count: Doctors of this specialty matching the search
+    '''
+
+    specialty = serializers.CharField()
+    count = serializers.IntegerField()
+
+
+class DoctorSearchSerializer(serializers.Serializer):
+    '''DoctorSearchSerializer for one page of doctor search results.
+
+    ## Fields:
+    - count: Doctors matching the search (and the specialty, when given)
+    - results: The doctors of this page
+    - facets: Matching doctors per specialty, ignoring the specialty filter
+    '''
+
+    count = serializers.IntegerField()
+    results = DoctorSerializer(many=True)
+    facets = SpecialtyFacetSerializer(many=True)
+
+
+class ProfileClinicSerializer(serializers.Serializer):
+    '''ProfileClinicSerializer for the clinic of a free slot.
+
+    ## Fields:
+    - id: Clinic ID
+    - name: Clinic name
+    '''
+
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+
+
+class FreeSlotSerializer(serializers.Serializer):
+    '''FreeSlotSerializer for one free slot of a doctor.
+
+    ## Fields:
+    - availability: ID of the availability to book the slot from
+    - clinic: The clinic of the availability
+    - selected_time: The slot, as sent when booking an appointment
+    - scheduled_at: Date and time of the slot
+    '''
+
+    availability = serializers.IntegerField()
+    clinic = ProfileClinicSerializer()
+    selected_time = serializers.CharField()
+    scheduled_at = serializers.DateTimeField()
+
+
+class DoctorProfileSerializer(DoctorSerializer):
+    '''DoctorProfileSerializer for the public profile of a doctor.
+
+    ## Fields:
+    - user, medical_code, specialty, photo, photo_thumbnail: as DoctorSerializer
+    - next_slots: The doctor's next free slots
+    '''
+
+    next_slots = FreeSlotSerializer(many=True, read_only=True)
+
+    class Meta(DoctorSerializer.Meta):
+        fields = DoctorSerializer.Meta.fields + ['next_slots']
@@ -1,6 +1,10 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from .models import User, Doctor, Patient
+from .profiles import forget_slug
+from .search import forget_facets, index_doctors
+from .thumbnails import schedule_thumbnails
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -9,3 +13,49 @@ def create_user_profile(sender, instance, created, **kwargs):
             Doctor.objects.create(user=instance)
         else:
             Patient.objects.create(user=instance)
+
+@receiver(pre_save, sender=Doctor)
+@receiver(pre_save, sender=Patient)
+def detect_photo_upload(sender, instance, raw=False, **kwargs):
+    instance._photo_uploaded = bool(instance.photo) and not instance.photo._committed and not raw
+
+@receiver(post_save, sender=Doctor)
+@receiver(post_save, sender=Patient)
+def create_photo_thumbnails(sender, instance, **kwargs):
+    if getattr(instance, '_photo_uploaded', False):
+        instance._photo_uploaded = False
+        schedule_thumbnails(instance)
+
+SEARCHED_USER_FIELDS = {'first_name', 'last_name'}
+
+@receiver(post_save, sender=Doctor)
+def index_doctor(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_doctors([instance])
+
+@receiver(post_save, sender=User)
+def index_doctor_names(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    # logins save last_login only; new doctors are indexed when their profile is created
+    if created or raw or not instance.is_doctor:
+        return
+    if update_fields is not None and not SEARCHED_USER_FIELDS & set(update_fields):
+        return
+    index_doctors(Doctor.objects.select_related('user').filter(user=instance))
+
+@receiver(post_save, sender=Doctor)
+def forget_renamed_slug(sender, instance, raw=False, **kwargs):
+    old_slug = getattr(instance, '_renamed_from', None)
+    if old_slug and not raw:
+        instance._renamed_from = None
+        # after the commit: a profile read before it would cache the old slug again
+        transaction.on_commit(lambda: forget_slug(old_slug))
+
+@receiver(post_delete, sender=Doctor)
+def forget_doctor(sender, instance, **kwargs):
+    forget_facets()
+    if Doctor.user.is_cached(instance):
+        forget_slug(instance.user.slug)
+
+@receiver(post_delete, sender=User)
+def forget_user_slug(sender, instance, **kwargs):
+    forget_slug(instance.slug)
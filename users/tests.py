@@ -1,10 +1,28 @@
 # tests/test_models.py
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from datetime import datetime, time, timedelta
+from unittest import mock
+
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
 from django.core.exceptions import ValidationError
+from appointments.models import Appointment, Availability, Clinic
 from .validators import phone_number_validator
 from .models import User, Doctor, Patient
+from .search import facets, normalize, query_words, tokens
+from .serializers import DoctorSerializer
+from .thumbnails import THUMBNAIL_DIR
+from .views import serve_thumbnail
 
 class UserModelTests(TestCase):
+    databases = '__all__'
 
     def setUp(self):
         self.user_attributes = {
@@ -61,6 +79,15 @@ class UserModelTests(TestCase):
         patient = Patient.objects.get(user=user)
         self.assertIsNotNone(patient)
 
+    def test_patient_slug_is_saved(self):
+        patient = User.objects.create_user(**self.user_attributes).patient
+        slug = f"{patient.pk}-john-doe"
+        self.assertEqual(User.objects.get(pk=patient.user_id).slug, slug)
+        # an unchanged slug is only checked, not written again
+        with self.assertNumQueries(2):
+            patient.save()
+        self.assertEqual(patient.user.slug, slug)
+
     # def test_slug_is_created(self):
     #     user = User.objects.create_user(**self.user_attributes)
     #     self.assertTrue(user.slug)
@@ -75,6 +102,7 @@ class UserModelTests(TestCase):
     #     self.assertIn('1-jane-doe', user.slug)
 
 class UserSignalTests(TestCase):
+    databases = '__all__'
 
     def test_create_doctor_profile_signal(self):
         user = User.objects.create_user(
@@ -125,3 +153,233 @@ class UserSignalTests(TestCase):
         user.first_name = 'Changed'
         user.save()
         self.assertIsNotNone(user.patient)
+
+
+class PhotoThumbnailTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, PHOTO_THUMBNAIL_ASYNC=False)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        user = User.objects.create_user(
+            phone_number='09123456792',
+            password='securepassword',
+            first_name='Photo',
+            last_name='Doctor',
+            is_doctor=True
+        )
+        self.doctor = user.doctor
+        self.doctor.medical_code = 'PH-1'
+
+    def _upload(self, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), color).save(buffer, 'PNG')
+        self.doctor.photo = SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.save()
+        self.doctor.refresh_from_db()
+
+    def test_thumbnails_are_generated_on_upload(self):
+        self._upload('red')
+        variants = self.doctor.photo_thumbnails['variants']
+        self.assertEqual(set(variants), {'small', 'medium'})
+        with Image.open(os.path.join(self.media_root, variants['small']['webp'])) as image:
+            self.assertEqual(image.size, (96, 96))
+            self.assertEqual(image.format, 'WEBP')
+        self.assertTrue(variants['medium']['jpeg'].endswith('_medium.jpeg'))
+
+    def test_thumbnail_names_follow_content(self):
+        self._upload('red')
+        first = self.doctor.photo_thumbnails
+        self._upload('red')
+        self.assertEqual(self.doctor.photo_thumbnails, first)
+        self._upload('blue')
+        self.assertNotEqual(self.doctor.photo_thumbnails['hash'], first['hash'])
+
+    def test_serializer_exposes_thumbnail_url(self):
+        self._upload('green')
+        data = DoctorSerializer(self.doctor).data
+        self.assertEqual(
+            data['photo_thumbnail'],
+            f"/media/{self.doctor.photo_thumbnails['variants']['small']['webp']}"
+        )
+
+    def test_thumbnail_is_served_with_long_cache_headers(self):
+        self._upload('green')
+        name = self.doctor.photo_thumbnails['variants']['small']['jpeg']
+        path = name.removeprefix(f"{THUMBNAIL_DIR}/")
+        response = serve_thumbnail(RequestFactory().get(f"/media/{name}"), path)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    def test_thumbnails_are_not_served_by_django_in_production(self):
+        self._upload('green')
+        name = self.doctor.photo_thumbnails['variants']['small']['jpeg']
+        self.assertEqual(self.client.get(f"/media/{name}").status_code, 404)
+
+
+class DoctorSearchTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.reza = self.create_doctor('09121000001', 'محمد\u200cرضا', 'کریمی', 'قلب و عروق', 'MC-1')
+        self.sara = self.create_doctor('09121000002', 'سارا', 'کریمان', 'پوست', 'MC-2')
+        self.john = self.create_doctor('09121000003', 'John', 'Doe', 'قلب و عروق', 'MC-3')
+
+    def create_doctor(self, phone_number, first_name, last_name, specialty, medical_code):
+        doctor = User.objects.create_user(
+            phone_number=phone_number, password='securepassword',
+            first_name=first_name, last_name=last_name, is_doctor=True,
+        ).doctor
+        doctor.specialty = specialty
+        doctor.medical_code = medical_code
+        doctor.save()
+        return doctor
+
+    def search(self, **params):
+        response = self.client.get('/doctors/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_normalization(self):
+        # Arabic yeh and kaf, a diacritic and Persian digits
+        self.assertEqual(normalize('كريمِي ۱۲'), 'کریمی 12')
+        self.assertEqual(tokens('محمد\u200cرضا Doe'), {'محمدرضا', 'محمد', 'رضا', 'doe'})
+        self.assertEqual(query_words('محمد\u200cرضا  محمدرضا'), ['محمدرضا'])
+
+    def test_prefix_search(self):
+        result = self.search(q='كريم')
+        self.assertEqual(result['count'], 2)
+        self.assertEqual([row['user']['last_name'] for row in result['results']], ['کریمان', 'کریمی'])
+        self.assertEqual([row['medical_code'] for row in self.search(q='رضا كريم')['results']], ['MC-1'])
+        self.assertEqual([row['medical_code'] for row in self.search(q='محمدرضا')['results']], ['MC-1'])
+        self.assertEqual([row['medical_code'] for row in self.search(q='jo')['results']], ['MC-3'])
+        self.assertEqual(self.search(q='کریمی پوست')['count'], 0)
+
+    def test_specialty_facets(self):
+        result = self.search(q='', specialty='قلب و عروق', limit=1)
+        self.assertEqual(result['count'], 2)
+        self.assertEqual([row['medical_code'] for row in result['results']], ['MC-3'])
+        self.assertEqual(result['facets'], [
+            {'specialty': 'قلب و عروق', 'count': 2}, {'specialty': 'پوست', 'count': 1},
+        ])
+        self.assertEqual(self.search(q='کریم')['facets'], [
+            {'specialty': 'قلب و عروق', 'count': 1}, {'specialty': 'پوست', 'count': 1},
+        ])
+
+    def test_facets_are_cached_until_a_doctor_changes(self):
+        counts = facets('کریم')
+        with self.assertNumQueries(0):
+            self.assertEqual(facets('كريم'), counts)
+        self.sara.user.last_name = 'Rad'
+        self.sara.user.save(update_fields=['last_name'])
+        self.assertEqual(self.search(q='کریم')['facets'], [{'specialty': 'قلب و عروق', 'count': 1}])
+        self.assertEqual(self.search(q='rad')['count'], 1)
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get('/doctors/search/', {'limit': 0}).status_code, 400)
+
+    def test_index_command(self):
+        self.reza.search_tokens.all().delete()
+        call_command('index_doctors', stdout=io.StringIO())
+        self.assertEqual(self.search(q='محمد')['count'], 1)
+
+
+class DoctorProfileTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = User.objects.create_user(
+            phone_number='09121000001', password='securepassword',
+            first_name='Sara', last_name='Rad', is_doctor=True,
+        ).doctor
+        self.doctor.specialty = 'Cardiology'
+        self.doctor.medical_code = 'MC-100'
+        self.doctor.save()
+        self.patient = User.objects.create_user(
+            phone_number='09121000002', password='securepassword',
+            first_name='Ali', last_name='Karimi', date_of_birth='1990-01-01',
+        ).patient
+        self.clinic = Clinic.objects.create(name='Central', address='Main street')
+        self.day = timezone.localdate() + timedelta(days=1)
+
+    def create_availability(self, day, start, end):
+        return Availability.objects.create(
+            doctor=self.doctor, clinic=self.clinic,
+            start_time=timezone.make_aware(datetime.combine(day, start)),
+            end_time=timezone.make_aware(datetime.combine(day, end)),
+        )
+
+    def test_slugs_are_unique(self):
+        self.assertEqual(self.doctor.user.slug, 'sara-rad-mc-100')
+        self.assertEqual(User.objects.get(pk=self.doctor.user_id).slug, 'sara-rad-mc-100')
+        other = User.objects.create_user(
+            phone_number='09121000003', password='securepassword',
+            first_name='Sara', last_name='Rad', is_doctor=True,
+        ).doctor
+        other.medical_code = 'MC-100 '
+        other.save()
+        self.assertEqual(other.user.slug, 'sara-rad-mc-100-2')
+        persian = User.objects.create_user(
+            phone_number='09121000004', password='securepassword',
+            first_name='سارا', last_name='راد', is_doctor=True,
+        ).doctor
+        persian.medical_code = '200'
+        persian.save()
+        self.assertEqual(persian.user.slug, 'dr-200')
+
+    def test_slug_taken_by_a_concurrent_save_gets_the_next_counter(self):
+        other = User.objects.create_user(
+            phone_number='09121000003', password='securepassword',
+            first_name='Sara', last_name='Rad', is_doctor=True,
+        ).doctor
+        other.medical_code = 'MC-100 '
+        real_unique_slug, stale = User.unique_slug, iter(['sara-rad-mc-100'])
+
+        def unique_slug(user, *parts):
+            # the first check ran before the setUp doctor's slug was written
+            return next(stale, None) or real_unique_slug(user, *parts)
+
+        with mock.patch.object(User, 'unique_slug', autospec=True, side_effect=unique_slug) as patched:
+            other.save()
+        self.assertEqual(User.objects.get(pk=other.user_id).slug, 'sara-rad-mc-100-2')
+        self.assertEqual(patched.call_count, 2)
+
+    def test_profile_embeds_next_free_slots(self):
+        later = self.create_availability(self.day + timedelta(days=1), time(9, 0), time(9, 20))
+        first = self.create_availability(self.day, time(10, 0), time(10, 30))
+        Appointment.objects.create(patient=self.patient, availability=first, selected_time='10:00')
+
+        with self.assertNumQueries(3):
+            response = self.client.get('/doctors/sara-rad-mc-100/')
+        self.assertEqual(response.status_code, 200)
+        profile = response.json()
+        self.assertEqual(profile['user']['slug'], 'sara-rad-mc-100')
+        self.assertEqual(profile['specialty'], 'Cardiology')
+        self.assertEqual(
+            [(slot['availability'], slot['selected_time']) for slot in profile['next_slots']],
+            [(first.pk, '10:10'), (first.pk, '10:20'), (later.pk, '09:00'), (later.pk, '09:10')],
+        )
+        self.assertEqual(profile['next_slots'][0]['clinic'], {'id': self.clinic.pk, 'name': 'Central'})
+
+    @override_settings(SINGLE_FLIGHT_WINDOW=0)
+    def test_slug_is_resolved_from_the_cache(self):
+        self.client.get('/doctors/sara-rad-mc-100/')
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/doctors/sara-rad-mc-100/').status_code, 200)
+
+    def test_rename_moves_the_profile(self):
+        self.assertEqual(self.client.get('/doctors/sara-rad-mc-100/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.user.last_name = 'Rahimi'
+            self.doctor.user.save()
+            self.doctor.save()
+        self.assertEqual(self.client.get('/doctors/sara-rad-mc-100/').status_code, 404)
+        self.assertEqual(self.client.get('/doctors/sara-rahimi-mc-100/').status_code, 200)
+        self.assertEqual(self.client.get('/doctors/nobody/').status_code, 404)
@@ -0,0 +1,147 @@
+import hashlib
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from appointments.signals import rows_changed
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = 'thumbnails'
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+
+_executor = None
+
+
+def get_executor():
+    '''Return the shared thread pool used for thumbnail generation.'''
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PHOTO_THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def thumbnail_name(digest, variant, extension):
+    return f"{THUMBNAIL_DIR}/{digest}_{variant}.{extension}"
+
+
+def _to_rgb(image):
+    image = ImageOps.exif_transpose(image)
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_thumbnails(content):
+    '''Render every configured size/format of an image into the storage.
+
+    Names are derived from the SHA-256 of the original bytes, so the same
+    upload always maps to the same files and already rendered variants are
+    not written twice.
+    '''
+    digest = hashlib.sha256(content).hexdigest()[:20]
+    variants = {}
+    with Image.open(io.BytesIO(content)) as source:
+        image = _to_rgb(source)
+        for variant, size in settings.PHOTO_THUMBNAIL_SIZES.items():
+            resized = ImageOps.fit(image, tuple(size), Image.Resampling.LANCZOS)
+            variants[variant] = {}
+            for extension, (image_format, options) in THUMBNAIL_FORMATS.items():
+                name = thumbnail_name(digest, variant, extension)
+                if not default_storage.exists(name):
+                    buffer = io.BytesIO()
+                    resized.save(buffer, image_format, **options)
+                    name = default_storage.save(name, ContentFile(buffer.getvalue()))
+                variants[variant][extension] = name
+    return {'hash': digest, 'variants': variants}
+
+
+def read_photo(photo):
+    try:
+        with photo.open('rb') as file:
+            return file.read()
+    except (FileNotFoundError, OSError, ValueError):
+        return None
+
+
+def generate_thumbnails(instance, force=False):
+    '''Build the thumbnails of ``instance.photo`` and store them on the row.
+
+    Returns the new ``photo_thumbnails`` value, or ``None`` when nothing
+    had to be done (no photo, unreadable file or unchanged content).
+    '''
+    if not instance.photo:
+        return None
+    content = read_photo(instance.photo)
+    if content is None:
+        logger.warning("Photo file of %s #%s could not be read.", type(instance).__name__, instance.pk)
+        return None
+    current = instance.photo_thumbnails or {}
+    if not force and current.get('hash') == hashlib.sha256(content).hexdigest()[:20]:
+        return None
+    try:
+        thumbnails = render_thumbnails(content)
+    except (OSError, Image.DecompressionBombError):
+        logger.warning("Photo of %s #%s is not a valid image.", type(instance).__name__, instance.pk)
+        return None
+    changes = {'photo_thumbnails': thumbnails}
+    try:
+        type(instance)._meta.get_field('updated_at')
+        changes['updated_at'] = timezone.now()
+    except FieldDoesNotExist:
+        pass
+    type(instance).objects.filter(pk=instance.pk).update(**changes)
+    for name, value in changes.items():
+        setattr(instance, name, value)
+    rows_changed.send(sender=type(instance), instances=[instance])
+    return thumbnails
+
+
+def _generate_in_worker(model, pk):
+    try:
+        instance = model.objects.only('id', 'photo', 'photo_thumbnails').get(pk=pk)
+        generate_thumbnails(instance)
+    except model.DoesNotExist:
+        pass
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s #%s.", model.__name__, pk)
+    finally:
+        connections.close_all()
+
+
+def schedule_thumbnails(instance):
+    '''Generate thumbnails for ``instance`` once the current transaction commits.'''
+    model, pk = type(instance), instance.pk
+    if settings.PHOTO_THUMBNAIL_ASYNC:
+        transaction.on_commit(lambda: get_executor().submit(_generate_in_worker, model, pk))
+    else:
+        transaction.on_commit(lambda: generate_thumbnails(model.objects.get(pk=pk)))
+
+
+def thumbnail_url(thumbnails, variant=None, extension=None):
+    '''Return the storage URL of one thumbnail variant, or ``None``.'''
+    variants = (thumbnails or {}).get('variants') or {}
+    formats = variants.get(variant or settings.PHOTO_THUMBNAIL_DEFAULT) or {}
+    name = formats.get(extension or 'webp')
+    return default_storage.url(name) if name else None
+
+
+def thumbnail_document_root():
+    return os.path.join(settings.MEDIA_ROOT, THUMBNAIL_DIR)
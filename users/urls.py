@@ -1,6 +1,6 @@
 from django.urls import path
 from .views import (
-    DoctorListAPIView, DoctorManagementCreateAPIView,
+    DoctorListAPIView, DoctorSearchAPIView, DoctorProfileAPIView, DoctorManagementCreateAPIView,
     DoctorManagementUpdateAPIView, DoctorManagementDestroyAPIView,
     PatientListAPIView, PatientCreateAPIView,
     PatientUpdateAPIView, PatientDestroyAPIView
@@ -9,8 +9,10 @@ from .views import (
 
 urlpatterns = [
     path('doctors/', DoctorListAPIView.as_view(), name='doctor-list'),
+    path('doctors/search/', DoctorSearchAPIView.as_view(), name='doctor-search'),
     path('doctors/new/', DoctorManagementCreateAPIView.as_view(), name='doctor-create'),
     path('doctors/<int:id>/', DoctorManagementUpdateAPIView.as_view(), name='doctor-update'),
+    path('doctors/<slug:slug>/', DoctorProfileAPIView.as_view(), name='doctor-profile'),
     path('doctors/<int:id>/delete/', DoctorManagementDestroyAPIView.as_view(), name='doctor-delete'),
 
     path('patients/', PatientListAPIView.as_view(), name='patient-list'),
@@ -1,21 +1,99 @@
+from django.conf import settings
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_safe
+from django.views.static import serve
+from django.http import Http404
+from django.utils.translation import gettext_lazy as _
 from rest_framework.generics import ListAPIView, CreateAPIView, UpdateAPIView, DestroyAPIView
 from rest_framework.views import APIView
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
+from rest_framework.response import Response
+from rest_framework import status
+from appointments.bulk import retire_doctor
+from appointments.coalescing import coalesce
+from appointments.projections import doctor_rows
+from healthcare_appointment_system.apidocs import swagger_auto_schema
+from healthcare_appointment_system.fieldsets import sparse_fieldset
 from .permissions import IsOwner
 from .models import Doctor, Patient
-from .serializers import DoctorSerializer, DoctorManagementSerializer, PatientSerializer
+from .profiles import doctor_id_for_slug, forget_slug, next_free_slots
+from .search import facets, search_doctors
+from .serializers import (DoctorSerializer, DoctorManagementSerializer, PatientSerializer,
+                          DoctorSearchQuerySerializer, DoctorSearchSerializer, DoctorProfileSerializer)
+from .thumbnails import thumbnail_document_root
 
 
 class DoctorListAPIView(ListAPIView):
     """
         List all doctors.
     """
-    queryset = Doctor.objects.all()
+    queryset = Doctor.objects.order_by('pk')
     serializer_class = DoctorSerializer
     permission_classes = [AllowAny]
 
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **sparse_fieldset(self.request), **kwargs)
+
+    @coalesce()
+    def list(self, request, *args, **kwargs):
+        if sparse_fieldset(request):
+            return super().list(request, *args, **kwargs)
+        return Response(doctor_rows(self.filter_queryset(self.get_queryset()), request))
+
+class DoctorSearchAPIView(APIView):
+    """
+        Search the doctor directory by name, specialty or medical code.
+    """
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        query_serializer=DoctorSearchQuerySerializer,
+        responses={200: DoctorSearchSerializer},
+        operation_description=_('Doctors whose names, specialty or medical code start with every word of q, '
+                                'with the number of matches per specialty.')
+    )
+    @coalesce()
+    def get(self, request):
+        query = DoctorSearchQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+        params = query.validated_data
+        counts = facets(params['q'])
+        doctors = search_doctors(params['q'])
+        if 'specialty' in params:
+            doctors = doctors.filter(specialty=params['specialty'])
+            count = sum(row['count'] for row in counts if row['specialty'] == params['specialty'])
+        else:
+            count = sum(row['count'] for row in counts)
+        page = doctors.order_by('user__last_name', 'user__first_name', 'pk')
+        page = page[params['offset']:params['offset'] + params['limit']]
+        return Response({'count': count, 'results': doctor_rows(page, request), 'facets': counts},
+                        status=status.HTTP_200_OK)
+
+class DoctorProfileAPIView(APIView):
+    """
+        Public profile of a doctor, with the next free slots.
+    """
+    permission_classes = [AllowAny]
+
+    @swagger_auto_schema(
+        responses={200: DoctorProfileSerializer},
+        operation_description=_('The profile of the doctor with this slug and their next free slots.')
+    )
+    @coalesce()
+    def get(self, request, slug):
+        doctor_id = doctor_id_for_slug(slug)
+        doctor = Doctor.objects.select_related('user').filter(pk=doctor_id).first() if doctor_id else None
+        if doctor is None or doctor.user.slug != slug:
+            # renamed or deleted since the slug was cached
+            forget_slug(slug)
+            raise Http404
+        doctor.next_slots = next_free_slots(doctor.pk)
+        return Response(DoctorProfileSerializer(doctor, context={'request': request}).data,
+                        status=status.HTTP_200_OK)
+
 class DoctorManagementCreateAPIView(CreateAPIView):
     """
        Create a new doctor.
@@ -40,6 +118,9 @@ class DoctorManagementDestroyAPIView(DestroyAPIView):
     serializer_class = DoctorManagementSerializer
     permission_classes = [JWTAuthentication, IsAdminUser]
 
+    def perform_destroy(self, instance):
+        retire_doctor(instance, delete=True)
+
 class PatientListAPIView(ListAPIView):
     """
         List all items.
@@ -48,6 +129,9 @@ class PatientListAPIView(ListAPIView):
     serializer_class = PatientSerializer
     permission_classes = [IsOwner]
 
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **sparse_fieldset(self.request), **kwargs)
+
 class PatientCreateAPIView(CreateAPIView):
     """
         Create a new item.
@@ -71,3 +155,13 @@ class PatientDestroyAPIView(DestroyAPIView):
     queryset = Patient.objects.all()
     serializer_class = PatientSerializer
     permission_classes = [JWTAuthentication, IsAdminUser]
+
+
+@require_safe
+@cache_control(public=True, max_age=settings.PHOTO_THUMBNAIL_MAX_AGE, immutable=True)
+def serve_thumbnail(request, path):
+    """
+       Serve a photo thumbnail in development (DEBUG). Names are content
+       hashed, so they never change.
+    """
+    return serve(request, path, document_root=thumbnail_document_root())